@@ -0,0 +1,96 @@
+'''
+Compression benchmark of the Writer h5 output.
+
+Writes the same recorded-style waveforms with a range of [output_settings]
+filter choices and reports write MB/s and compression ratio for each.
+Waveforms are either synthetic (noisy baseline with pulses, see
+bench_writer.py) or taken from the ch_N/rwf tables of an existing recording.
+
+Usage:
+    python benchmarks/bench_compression.py [--events 10000] [--input recording.h5]
+'''
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import tables as tb
+
+sys.path.append(os.environ.get('CARP_DIR', os.path.join(os.path.dirname(__file__), '..')))
+
+from bench_writer import make_ring, make_writer
+from core.ring import EventRing
+import felib.formats as formats
+
+# (label, [output_settings] keys)
+SETTINGS = [
+    ('none',             {'complib' : None}),
+    ('zlib 1',           {'complib' : 'zlib',   'complevel' : 1, 'shuffle' : 'shuffle'}),
+    ('blosc2 5 shuffle', {'complib' : 'blosc2', 'complevel' : 5, 'shuffle' : 'shuffle'}),
+    ('lz4 5 bitshuffle', {'complib' : 'lz4',    'complevel' : 5, 'shuffle' : 'bitshuffle'}),
+    ('zstd 1 bitshuffle',{'complib' : 'zstd',   'complevel' : 1, 'shuffle' : 'bitshuffle'}),
+    ('zstd 4 bitshuffle',{'complib' : 'zstd',   'complevel' : 4, 'shuffle' : 'bitshuffle'}),
+]
+
+
+def load_ring(path: str, n_slots: int) -> EventRing:
+    '''
+    Ring filled with the raw waveforms of an existing recording, one channel per table.
+    '''
+    with tb.open_file(path) as h5file:
+        rwfs = [node.rwf.read(stop=n_slots)['rwf'] for node in h5file.root if hasattr(node, 'rwf')]
+    n_slots  = min(len(rwf) for rwf in rwfs)
+    channels = len(rwfs)
+    samples  = rwfs[0].shape[1]
+    ring = EventRing(formats.SCOPE(channels, samples), n_slots, {ch : ch for ch in range(channels)}, formats.SCOPE_LAYOUT)
+    for ch, rwf in enumerate(rwfs):
+        ring.waveform[:, ch] = rwf[:n_slots]
+    ring.waveform_size[:] = samples
+    ring.timestamp[:]     = np.arange(n_slots)
+    return ring
+
+
+def run(settings: dict, ring: EventRing, n_events: int, flush: int, tmpdir: str, chunk_events: int) -> tuple:
+    '''
+    Write n_events with the given filter settings, returning (MB/s, compression ratio).
+    '''
+    channels = ring.waveform.shape[1]
+    writer   = make_writer(os.path.join(tmpdir, 'bench'), channels, flush,
+                           chunk_events = chunk_events, expected_rows = n_events, **settings)
+
+    t0 = time.perf_counter()
+    for start in range(0, n_events, flush):
+        for evt in range(start, min(start + flush, n_events)):
+            slot = evt % ring.n_slots
+            ring.hold(slot)
+            writer.local_buffer.append((ring, slot, evt))
+        writer.write_h5()
+    file_name = writer.output.h5file.filename
+    writer.cleanup()
+    elapsed = time.perf_counter() - t0
+
+    nbytes = n_events * channels * ring.waveform.shape[-1] * ring.waveform.itemsize
+    ratio  = nbytes / os.path.getsize(file_name)
+    os.remove(file_name)
+    return nbytes / elapsed / 1e6, ratio
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Writer compression benchmark')
+    parser.add_argument('--events',   type=int, default=10000, help='events written per setting')
+    parser.add_argument('--samples',  type=int, default=4096,  help='samples per synthetic waveform')
+    parser.add_argument('--channels', type=int, default=4,     help='synthetic channels')
+    parser.add_argument('--flush',    type=int, default=1000,  help='events per write_h5 call')
+    parser.add_argument('--chunk',    type=int, default=256,   help='chunk_events')
+    parser.add_argument('--input',    default=None,            help='recording to take waveforms from')
+    args = parser.parse_args()
+
+    ring = load_ring(args.input, 1024) if args.input else make_ring(1024, args.samples, args.channels)
+
+    print(f'{"filters":>18} | {"MB/s":>8} | {"ratio":>6}')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for label, settings in SETTINGS:
+            MB_ps, ratio = run(settings, ring, args.events, args.flush, tmpdir, args.chunk)
+            print(f'{label:>18} | {MB_ps:>8.1f} | {ratio:>6.2f}')
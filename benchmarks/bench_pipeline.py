@@ -0,0 +1,254 @@
+'''
+End-to-end benchmark of the acquisition pipeline on the simulated digitiser.
+
+Drives AcquisitionWorker -> EventBuilder -> DAQ.dispatch -> Writer as the
+application does, without the GUI, with the digitiser replaced by the
+simulated board (see felib/simulator.py). Reports sustained throughput,
+events dropped at each stage and the p50/p99 latency from readout to display
+and from readout to disk, and writes them as JSON so runs can be compared
+between releases.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--rate 10000] [--duration 10] [--firmware SCOPE] [--output results.json]
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from queue import Queue
+from threading import Event, Lock
+
+sys.path.append(os.environ.get('CARP_DIR', os.path.join(os.path.dirname(__file__), '..')))
+
+from core.io import read_config_file
+from core.commands import CommandType
+from core.daq import DAQ
+from core.worker import AcquisitionWorker
+from core.event_builder import EventBuilder
+from core.suppression import ZeroSuppressor
+from core.writer import Writer
+from core.process_writer import ProcessWriter
+from core.tracker import Tracker
+from core.functions import get_ch_mapping
+from felib.digitiser import Digitiser
+from ui.renderer import Renderer
+
+CARP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+class NullScreen:
+    '''
+    Screen that draws nothing, so the benchmark measures the pipeline rather than Qt.
+    '''
+    def update_ch(self, x, y, ch):
+        pass
+
+
+class Pipeline:
+    '''
+    Single board DAQ, sharing its dispatch.
+    '''
+    dispatch = DAQ.dispatch
+    record   = DAQ.record
+    release_unwritten = DAQ.release_unwritten
+
+    def __init__(self, dig_dict: dict, rec_dict: dict):
+        self.tracker        = Tracker()
+        # frames are handed to the renderer as in the application, but never drawn
+        self.renderer       = Renderer(NullScreen())
+        self.monitor        = None
+        self.recording      = False
+        self.recording_event = Event()
+        self.record_lock    = Lock()
+        self.record_timeout = 0.5
+        self.writer_lost    = False
+        self.suppressor     = ZeroSuppressor(rec_dict) if rec_dict.get('zero_suppression') else None
+        self.display_buffer = Queue(maxsize=1024)
+        self.writer_buffer  = Queue(maxsize=1024)
+
+        self.worker = AcquisitionWorker(cmd_buffer     = Queue(maxsize=10),
+                                        display_buffer = self.display_buffer,
+                                        stop_event     = Event(),
+                                        sw_timeout     = rec_dict['software_timeout'],
+                                        poll_policy    = rec_dict.get('poll_policy', 'adaptive'),
+                                        poll_max_wait  = rec_dict.get('poll_max_wait', 1e-3),
+                                        recording      = self.recording_event,
+                                        backpressure   = rec_dict.get('backpressure', 'block'),
+                                        high_water     = rec_dict.get('high_water', 0.9))
+        self.n_lost = self.worker.n_lost
+        self.builder_stop_event = Event()
+        self.builder = EventBuilder(input_buffer = self.display_buffer,
+                                    dispatch     = self.dispatch,
+                                    stop_event   = self.builder_stop_event,
+                                    channels     = list(get_ch_mapping(rec_dict).keys()),
+                                    window       = rec_dict.get('coincidence_window', 0),
+                                    depth        = rec_dict.get('builder_depth', 65536),
+                                    idle_timeout = rec_dict.get('builder_timeout', 0.5))
+
+        self.digitiser = Digitiser(dig_dict)
+        self.digitiser.connect()
+        self.digitiser.configure(dig_dict, rec_dict)
+        self.worker.digitiser = self.digitiser
+
+        writer_class = ProcessWriter if rec_dict.get('writer_mode', 'thread') == 'process' else Writer
+        self.writer_stop_event = Event()
+        self.writer = writer_class(ch_map       = get_ch_mapping(rec_dict),
+                                   flush_size   = rec_dict['h5_flush_size'],
+                                   write_buffer = self.writer_buffer,
+                                   stop_event   = self.writer_stop_event,
+                                   rec_config   = rec_dict,
+                                   dig_config   = dig_dict,
+                                   TIMESTAMP    = 'bench',
+                                   tracker      = self.tracker)
+
+    def run(self, duration: float) -> float:
+        '''
+        Record for duration seconds, then stop and drain every stage. Returns the time taken.
+        '''
+        self.recording = True
+        self.recording_event.set()
+        self.writer.start()
+        self.builder.start()
+        self.worker.start()
+
+        t0 = time.perf_counter()
+        self.worker.enqueue_cmd(CommandType.START)
+        time.sleep(duration)
+        self.worker.enqueue_cmd(CommandType.EXIT)
+        self.worker.join()
+        elapsed = time.perf_counter() - t0
+        self.builder_stop_event.set()
+        self.builder.join()
+
+        self.recording = False
+        self.recording_event.clear()
+        self.writer_stop_event.set()
+        self.writer.join()
+        return elapsed
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=CARP_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def results(pipeline: Pipeline, elapsed: float) -> dict:
+    '''
+    Throughput, drops and latency percentiles (ms) of a finished run.
+    '''
+    dig     = pipeline.digitiser.dig
+    ring    = pipeline.digitiser.ring
+    latency = pipeline.tracker.latency_summary()
+    written = latency['disk']['count']
+    ev_size = sum(arr[0].nbytes for arr in ring.fields.values())
+
+    return {
+        'elapsed_s'         : elapsed,
+        'events_generated'  : dig.n_events + dig.n_lost,
+        'events_read'       : dig.n_events,
+        'events_displayed'  : latency['display']['count'],
+        'events_written'    : written,
+        'events_per_s'      : written / elapsed,
+        'MB_per_s'          : written * ev_size / elapsed / 1e6,
+        'dropped' : {
+            'board_buffer'   : dig.n_lost,          # triggers lost on the board, the readout fell behind
+            'display_buffer' : pipeline.worker.n_dropped.value, # readouts discarded while not recording
+            'recording'      : pipeline.worker.n_lost.value,    # readouts discarded while recording ('alert', or the writer stopped)
+        },
+        # claims retried as every ring slot was in use, the events stay on the board rather than being lost
+        'deferred_claims'   : ring.n_full,
+        'spilled'           : pipeline.worker.n_spilled.value,
+        'blocked_s'         : pipeline.worker.t_blocked.value,
+        # reads of uncached device parameters while acquiring, should be none
+        'param_reads'       : pipeline.digitiser.acquisition_reads,
+        'event_building'    : pipeline.builder.stats(),
+        'zero_suppression'  : pipeline.suppressor.stats() if pipeline.suppressor else None,
+        'latency_ms' : {stage : {k : (v * 1e3 if k != 'count' and v is not None else v) for k, v in summary.items()}
+                        for stage, summary in latency.items()},
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='End-to-end pipeline benchmark on the simulated digitiser')
+    parser.add_argument('--dig-config', default=os.path.join(CARP_DIR, 'configs', 'debug.conf'))
+    parser.add_argument('--rec-config', default=os.path.join(CARP_DIR, 'configs', 'recording', 'scope_a4818_V1730_SELFTRIG.conf'))
+    parser.add_argument('--firmware',   default='SCOPE',   help="simulated firmware, 'SCOPE' or 'DPP-PSD'")
+    parser.add_argument('--rate',       type=float, default=10000, help='simulated trigger rate (Hz), 0 for unlimited')
+    parser.add_argument('--duration',   type=float, default=10,    help='recording time (s)')
+    parser.add_argument('--writer',     default=None,      help="writer_mode override, 'thread' or 'process'")
+    parser.add_argument('--format',     default=None,      help="output_format override, 'hdf5' or 'raw'")
+    parser.add_argument('--backpressure', default=None,    help="backpressure override, 'block', 'spill' or 'alert'")
+    parser.add_argument('--flush',      type=int,   default=None,  help='h5_flush_size override')
+    parser.add_argument('--batch',      type=int,   default=None,  help='batch_size override')
+    parser.add_argument('--features',   action='store_true', help='extract waveform features to ch_N/features')
+    parser.add_argument('--no-waveforms', action='store_true', help="don't write the raw waveforms (with --features)")
+    parser.add_argument('--zero-suppression', default=None, help="zero_suppression override, 'drop' or 'truncate'")
+    parser.add_argument('--threshold',  type=float, default=None,  help='threshold override for every channel (ADCs above baseline)')
+    parser.add_argument('--output',     default=None,      help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    dig_dict = read_config_file(args.dig_config)
+    rec_dict = read_config_file(args.rec_config)
+    dig_dict.update(dig_name = 'debug', sim_firmware = args.firmware, sim_rate = args.rate)
+    rec_dict.update(trigger_mode = 'SELFTRIG')
+    if args.writer:
+        rec_dict['writer_mode'] = args.writer
+    if args.format:
+        rec_dict['output_format'] = args.format
+    if args.backpressure:
+        rec_dict['backpressure'] = args.backpressure
+    if args.flush:
+        rec_dict['h5_flush_size'] = args.flush
+    if args.batch:
+        rec_dict['batch_size'] = args.batch
+    if args.features:
+        rec_dict['features'] = rec_dict.get('features') or {'gates' : [(-16, 100), (-16, 1000)], 'baseline_margin' : 16}
+    if args.no_waveforms:
+        rec_dict['store_waveforms'] = False
+    if args.zero_suppression:
+        rec_dict['zero_suppression'] = args.zero_suppression
+    if args.threshold is not None:
+        for key, value in rec_dict.items():
+            if key.startswith('ch') and key[2:].isdigit():
+                value['threshold'] = args.threshold
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        rec_dict['file_name'] = os.path.join(tmpdir, 'bench')
+        pipeline = Pipeline(dig_dict, rec_dict)
+        elapsed  = pipeline.run(args.duration)
+        file_MB  = sum(os.path.getsize(os.path.join(tmpdir, f)) for f in os.listdir(tmpdir) if f.endswith(('.h5', '.npy'))) / 1e6
+
+    report = {
+        'benchmark' : 'pipeline',
+        'date'      : datetime.now().isoformat(timespec='seconds'),
+        'commit'    : git_commit(),
+        'python'    : platform.python_version(),
+        'settings'  : {'firmware'    : args.firmware,
+                       'rate'        : args.rate,
+                       'duration'    : args.duration,
+                       'writer_mode' : rec_dict.get('writer_mode', 'thread'),
+                       'output_format' : rec_dict.get('output_format', 'hdf5'),
+                       'backpressure' : rec_dict.get('backpressure', 'block'),
+                       'flush_size'  : rec_dict['h5_flush_size'],
+                       'ring_slots'  : rec_dict.get('ring_slots', 1024),
+                       'batch_size'  : rec_dict.get('batch_size', 1),
+                       'features'    : rec_dict.get('features'),
+                       'waveforms'   : rec_dict.get('store_waveforms', True),
+                       'zero_suppression' : rec_dict.get('zero_suppression'),
+                       'rec_config'  : os.path.basename(args.rec_config)},
+        'results'   : {**results(pipeline, elapsed), 'file_MB' : file_MB},
+    }
+
+    print(json.dumps(report, indent=4))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
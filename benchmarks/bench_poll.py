@@ -0,0 +1,165 @@
+'''
+Benchmark of the AcquisitionWorker readout loop against a simulated endpoint.
+
+For each trigger rate, runs the worker with each poll policy, and with the readout
+loop as it was before them ('old': every pass blocked up to 10 ms on the command
+buffer, then slept software_timeout), reporting:
+    - digitiser.acquire() calls per second
+    - events read per second
+    - p50 and p99 latency from an event being ready on the endpoint to it being read
+    - CPU use of the worker thread, % of one core
+
+The simulated endpoint makes an event ready every 1/rate seconds, and has_data()
+waits for one for up to --timeout ms, as with the CAEN endpoints. Between events
+the polls come back empty, which is when the poll policies differ: 'busy' keeps
+the latency lowest at the cost of a core, 'adaptive' and 'sleep' trade latency
+for CPU, and the old loop falls behind past ~100 Hz.
+
+Usage:
+    python benchmarks/bench_poll.py [--duration 2] [--rates 100 1000 10000] [--timeout 0] [--sw-timeout 0.001]
+'''
+
+import os
+import sys
+import time
+import argparse
+from queue import Queue, Empty
+from threading import Event
+import numpy as np
+
+sys.path.append(os.environ.get('CARP_DIR', os.path.join(os.path.dirname(__file__), '..')))
+
+from core.worker import AcquisitionWorker, Poller
+from core.ring import EventRing
+import felib.formats as formats
+
+
+class SimulatedEndpoint:
+    '''
+    Endpoint making one event ready every 1/rate seconds (every poll if rate is 0).
+    has_data() waits for the next event for up to the timeout (ms), recording the
+    latency of each event taken from when it was ready.
+    '''
+    def __init__(self, rate: float = 0):
+        self.period    = 1 / rate if rate > 0 else 0
+        self.next_evt  = None
+        self.latencies = []
+
+    def has_data(self, timeout: int) -> bool:
+        t_now = time.perf_counter()
+        # events start with the first poll, leaving out the worker's start up
+        if self.next_evt is None:
+            self.next_evt = t_now
+        wait = self.next_evt - t_now
+        if wait > 0:
+            if wait > timeout / 1000:
+                if timeout > 0:
+                    time.sleep(timeout / 1000)
+                return False
+            time.sleep(wait)
+            t_now = time.perf_counter()
+        self.latencies.append(t_now - self.next_evt)
+        self.next_evt += self.period
+        return True
+
+
+class SimulatedDigitiser:
+    '''
+    Minimal stand-in for Digitiser, following the acquire() contract.
+    '''
+    def __init__(self, rate: float = 0, timeout: int = 0, reclen: int = 2048):
+        self.endpoint    = SimulatedEndpoint(rate)
+        self.timeout     = timeout
+        self.isAcquiring = True
+        # larger than the display buffer, so that discarded events free their slots
+        self.ring        = EventRing(formats.SCOPE(1, reclen), 2048, {0 : 0}, formats.SCOPE_LAYOUT)
+        self.n_acquire   = 0
+
+    def acquire(self):
+        self.n_acquire += 1
+        slots = self.ring.claim()
+        if slots is None:
+            return None
+        if not self.endpoint.has_data(self.timeout):
+            self.ring.unclaim(slots)
+            return None
+        return [(self.ring, slots)]
+
+    def stop_acquisition(self):
+        self.isAcquiring = False
+
+
+class BenchWorker(AcquisitionWorker):
+    '''
+    AcquisitionWorker measuring the CPU time of its thread, running either the readout
+    loop under test or, with old set, the loop it replaced.
+    '''
+    old = False
+
+    def run(self):
+        t_cpu = time.thread_time()
+        if self.old:
+            self.run_old()
+        else:
+            super().run()
+        self.cpu_time = time.thread_time() - t_cpu
+
+    def run_old(self):
+        '''
+        Readout loop before the poll policies, for reference.
+        '''
+        while not self.stop_event.is_set():
+            while True:
+                try:
+                    self.handle_command(self.cmd_buffer.get(timeout=0.01))
+                except Empty:
+                    break
+            if self.digitiser and self.digitiser.isAcquiring:
+                data = self.digitiser.acquire()
+                if data is not None:
+                    for event in data:
+                        self.put_readout(*event)
+            time.sleep(self.sw_timeout)
+
+
+def run(policy: str, duration: float, rate: float, timeout: int, sw_timeout: float) -> dict:
+    '''
+    Run the worker with a simulated digitiser for `duration` seconds, with the poll
+    policy given or 'old' for the loop before them, returning the results.
+    '''
+    worker = BenchWorker(cmd_buffer     = Queue(maxsize=10),
+                         display_buffer = Queue(maxsize=1024),
+                         stop_event     = Event(),
+                         sw_timeout     = sw_timeout,
+                         poll_policy    = 'adaptive' if policy == 'old' else policy)
+    worker.old = policy == 'old'
+    # keep a reference, cleanup() drops the worker's one on exit
+    digitiser = SimulatedDigitiser(rate, timeout)
+    worker.digitiser = digitiser
+    worker.start()
+    time.sleep(duration)
+    worker.stop_event.set()
+    worker.join(timeout=2)
+
+    latencies = np.array(digitiser.endpoint.latencies)
+    return {'acquire_ps' : digitiser.n_acquire / duration,
+            'events_ps'  : len(latencies) / duration,
+            'p50_ms'     : 1e3 * np.percentile(latencies, 50) if len(latencies) else float('nan'),
+            'p99_ms'     : 1e3 * np.percentile(latencies, 99) if len(latencies) else float('nan'),
+            'cpu'        : 100 * worker.cpu_time / duration}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='AcquisitionWorker poll benchmark')
+    parser.add_argument('--duration', type=float, default=2, help='seconds per policy and rate')
+    parser.add_argument('--rates', type=float, nargs='+', default=[100, 1000, 10000], help='simulated event rates (Hz), 0 for always ready')
+    parser.add_argument('--timeout', type=int, default=0, help='has_data() timeout per poll (ms)')
+    parser.add_argument('--sw-timeout', type=float, default=1e-3, help="software_timeout of the 'sleep' policy and the old loop (s)")
+    args = parser.parse_args()
+
+    print(f'{"rate (Hz)":>9} | {"policy":>8} | {"acquire calls/s":>15} | {"events/s":>8} | {"p50 (ms)":>8} | {"p99 (ms)":>8} | {"CPU %":>5}')
+    for rate in args.rates:
+        for policy in (*Poller.policies, 'old'):
+            r = run(policy, args.duration, rate, args.timeout, args.sw_timeout)
+            print(f'{rate:>9.0f} | {policy:>8} | {r["acquire_ps"]:>15.0f} | {r["events_ps"]:>8.0f} | '
+                  f'{r["p50_ms"]:>8.3f} | {r["p99_ms"]:>8.3f} | {r["cpu"]:>5.1f}')
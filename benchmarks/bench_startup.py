@@ -0,0 +1,89 @@
+'''
+Startup regression check of the command line paths.
+
+Runs each path in a fresh interpreter under `python -X importtime`, reporting
+its wall time and import time, and checking that none of the heavy packages
+it has no use for are imported:
+
+    help     : carp --help
+    config   : reading and mapping the configs
+    headless : importing the Qt-free acquisition core (core/daq.py)
+    no_felib : importing the core with caen_felib missing, as on a machine without FeLib
+
+Exits with 1 if any path imports a package it shouldn't or takes longer than
+the budget, so it can be run as a check before merging.
+
+Usage:
+    python benchmarks/bench_startup.py [--budget 0.5] [--rec-config rec.conf]
+'''
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+CARP_DIR = os.path.abspath(os.environ.get('CARP_DIR', os.path.join(os.path.dirname(__file__), '..')))
+
+# packages never needed by each path, HDF5 (tables) is needed by the headless writer.
+# Importing any of caen_felib loads the FeLib library, which only connecting to hardware needs
+GUI   = ('PySide6', 'pyqtgraph')
+HEAVY = ('pandas', 'tables', 'caen_felib', *GUI)
+
+PATHS = {
+    'help'     : (['bin/carp', '--help'], HEAVY),
+    'config'   : (['-c', "import sys; sys.path.append('.'); from core.io import read_config_file; "
+                         "from core.functions import get_ch_mapping; get_ch_mapping(read_config_file(sys.argv[1]))", 'REC_CONFIG'], HEAVY),
+    'headless' : (['-c', "import sys; sys.path.append('.'); import core.daq"], ('pandas', 'caen_felib', *GUI)),
+    'no_felib' : (['-c', "import sys; sys.modules['caen_felib'] = None; sys.path.append('.'); import core.daq"], ('pandas', *GUI)),
+}
+
+
+def run(args: list, rec_config: str) -> tuple:
+    '''
+    Run python -X importtime with args from CARP_DIR, REC_CONFIG replaced by rec_config,
+    returning (wall time (s), import time (s), modules imported).
+    '''
+    args = [rec_config if arg == 'REC_CONFIG' else arg for arg in args]
+    env = dict(os.environ, CARP_DIR = CARP_DIR)
+    t0  = time.perf_counter()
+    out = subprocess.run([sys.executable, '-X', 'importtime', *args],
+                         cwd=CARP_DIR, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - t0
+    if out.returncode != 0:
+        raise RuntimeError(f'{args} failed:\n{out.stderr}')
+
+    # lines of 'import time: self [us] | cumulative | package', top level packages unindented
+    modules, total = [], 0
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.append(name.strip())
+        if not name.startswith('  '):
+            total += int(cumulative)
+    return wall, total / 1e6, modules
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Startup time and import check of the command line paths')
+    parser.add_argument('--budget', type=float, default=0.5, help='longest wall time allowed per path (s)')
+    parser.add_argument('--rec-config', default=os.path.join(CARP_DIR, 'configs', 'recording', 'scope_a4818_V1730_SELFTRIG.conf'))
+    args = parser.parse_args()
+
+    failed = False
+    print(f'{"path":>9} | {"wall (s)":>8} | {"imports (s)":>11} | heavy packages imported')
+    for path, (path_args, forbidden) in PATHS.items():
+        try:
+            wall, imports, modules = run(path_args, args.rec_config)
+        except RuntimeError as e:
+            print(f'{path:>9} | failed: {e}')
+            failed = True
+            continue
+        loaded = [name for name in forbidden if name in modules]
+        failed |= bool(loaded) or wall > args.budget
+        print(f'{path:>9} | {wall:>8.3f} | {imports:>11.3f} | {", ".join(loaded) or "-"}')
+
+    if failed:
+        print(f'FAILED: heavy packages imported, or a path took longer than {args.budget} s.')
+    sys.exit(1 if failed else 0)
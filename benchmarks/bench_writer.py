@@ -0,0 +1,113 @@
+'''
+Throughput benchmark of the Writer h5 output.
+
+Compares the block writes of Writer.write_h5 (one Table.append per channel)
+against the previous row-based path (one Row.append per waveform), and the
+raw binary output (output_format = 'raw'), on SCOPE-style events held in an
+EventRing.
+
+Usage:
+    python benchmarks/bench_writer.py [--events 20000] [--samples 4096] [--channels 4] [--flush 1000]
+'''
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+from queue import Queue
+from threading import Event
+
+sys.path.append(os.environ.get('CARP_DIR', os.path.join(os.path.dirname(__file__), '..')))
+
+from core.writer import Writer
+from core.ring import EventRing
+import felib.formats as formats
+
+
+def make_ring(n_slots: int, samples: int, channels: int) -> EventRing:
+    '''
+    Ring filled with noisy baseline waveforms with the odd pulse on top.
+    '''
+    ch_mapping = {ch : ch for ch in range(channels)}
+    ring = EventRing(formats.SCOPE(channels, samples), n_slots, ch_mapping, formats.SCOPE_LAYOUT)
+    rng  = np.random.default_rng(0)
+    ring.waveform[:]      = rng.normal(8000, 5, ring.waveform.shape).astype(np.uint16)
+    ring.waveform[:, :, samples // 4 : samples // 4 + 20] += 2000
+    ring.waveform_size[:] = samples
+    ring.timestamp[:]     = np.arange(n_slots)
+    return ring
+
+
+def make_writer(path: str, channels: int, flush: int, **output_settings) -> Writer:
+    '''
+    Writer outside of its thread, with extra [output_settings] keys passed through.
+    '''
+    return Writer(ch_map       = {ch : ch for ch in range(channels)},
+                  flush_size   = flush,
+                  write_buffer = Queue(),
+                  stop_event   = Event(),
+                  rec_config   = {'file_name' : path, **output_settings},
+                  dig_config   = {'dig_gen' : 1},
+                  TIMESTAMP    = 'bench')
+
+
+def write_rows(writer: Writer):
+    '''
+    Previous implementation of Writer.write_h5, assigning each field on a Row.
+    '''
+    for ring, slot, evt in writer.local_buffer:
+        for wf_size, rwf, ch, ts in ring.event(slot):
+            if writer.wf_size is None:
+                writer.set_wf_size(wf_size)
+            rows = writer.output.rwf_table[ch].row
+            rows['evt_no']    = evt
+            rows['rwf']       = rwf
+            rows['channel']   = ch
+            rows['timestamp'] = ts
+            rows.append()
+        ring.release(slot)
+    writer.local_buffer.clear()
+    for table in writer.output.rwf_table.values():
+        table.flush()
+
+
+def run(mode: str, ring: EventRing, n_events: int, flush: int, channels: int, tmpdir: str) -> tuple:
+    '''
+    Write n_events in batches of flush events, returning (events/s, MB/s).
+    '''
+    settings = {'output_format' : 'raw'} if mode == 'raw' else {}
+    writer = make_writer(os.path.join(tmpdir, mode), channels, flush, **settings)
+    write  = (lambda: write_rows(writer)) if mode == 'row' else writer.write_h5
+
+    elapsed = 0
+    for start in range(0, n_events, flush):
+        for evt in range(start, min(start + flush, n_events)):
+            slot = evt % ring.n_slots
+            ring.hold(slot)
+            writer.local_buffer.append((ring, slot, evt))
+        t0 = time.perf_counter()
+        write()
+        elapsed += time.perf_counter() - t0
+
+    writer.cleanup()
+    nbytes = n_events * channels * ring.waveform.shape[-1] * ring.waveform.itemsize
+    return n_events / elapsed, nbytes / elapsed / 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Writer throughput benchmark')
+    parser.add_argument('--events',   type=int, default=20000, help='events written per mode')
+    parser.add_argument('--samples',  type=int, default=4096,  help='samples per waveform')
+    parser.add_argument('--channels', type=int, default=4,     help='enabled channels')
+    parser.add_argument('--flush',    type=int, default=1000,  help='events per write_h5 call')
+    args = parser.parse_args()
+
+    ring = make_ring(1024, args.samples, args.channels)
+
+    print(f'{"mode":>6} | {"events/s":>10} | {"MB/s":>8}')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for mode in ('row', 'block', 'raw'):
+            evts_ps, MB_ps = run(mode, ring, args.events, args.flush, args.channels, tmpdir)
+            print(f'{mode:>6} | {evts_ps:>10.0f} | {MB_ps:>8.1f}')
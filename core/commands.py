@@ -7,6 +7,7 @@ class CommandType(Enum):
     CONNECT = auto()
     UPDATE = auto()
     CH_DISPLAY = auto()
+    EXIT = auto()
     
 @dataclass
 class Command:
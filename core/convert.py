@@ -0,0 +1,51 @@
+'''
+Offline conversion of raw binary output (see RawOutput in core/writer.py) to
+the HDF5 layout written during acquisition by H5Output, with the configs,
+compression and chunking the run was recorded with.
+'''
+import json
+import logging
+import numpy as np
+
+from core.writer import H5Output
+
+
+def raw_base(path : str) -> str:
+    '''
+    Path of a raw output file without its extension, given any file of the set.
+    '''
+    for ext in ('.json', '.rwf.npy', '.features.npy'):
+        if path.endswith(ext):
+            return path[:-len(ext)]
+    return path
+
+
+def raw_to_h5(path : str, rows_per_write : int = 10000) -> str:
+    '''
+    Convert the raw output file set of path (<file>.json, <file>.rwf.npy and/or <file>.features.npy)
+    into <file>.h5, writing rows_per_write rows at a time. Returns the path of the h5 file.
+    '''
+    base = raw_base(path)
+    with open(f'{base}.json') as f:
+        meta = json.load(f)
+    if meta['wf_size'] is None:
+        logging.warning(f'{base} holds no events, nothing to convert.')
+        return None
+
+    # a single file, whatever the run rolled over on
+    rec_config = dict(meta['rec_config'], rollover_mb = None, rollover_events = None)
+    ch_map     = {ch : i for i, ch in enumerate(meta['channels'])}
+    output     = H5Output(ch_map, rec_config, meta['dig_configs'], meta['TIMESTAMP'], file_stem = base)
+    output.create_tables(meta['wf_size'])
+
+    for table in meta['tables']:
+        rows = np.load(f'{base}.{table}.npy', mmap_mode='r')
+        for start in range(0, len(rows), rows_per_write):
+            block  = np.asarray(rows[start : start + rows_per_write])
+            blocks = {(int(ch), table) : block[block['channel'] == ch] for ch in np.unique(block['channel'])}
+            output.write(blocks)
+        logging.info(f'{len(rows)} {table} rows converted from {base}.{table}.npy.')
+
+    h5_path = output.file_path()
+    output.close()
+    return h5_path
@@ -0,0 +1,427 @@
+'''
+Qt-free core of the acquisition: digitiser workers, event builder and writer,
+driven by the Controller behind the GUI or run on its own with `carp --headless`.
+'''
+import numpy as np
+import logging
+import signal
+import time
+from datetime import datetime
+from typing import Optional
+
+from core.io import read_config_file
+from core.logging import setup_logging
+from core.commands import CommandType, Command
+from core.worker import AcquisitionWorker
+from core.writer import Writer
+from core.process_writer import ProcessWriter
+from core.tracker import Tracker
+from core.functions import get_ch_mapping, board_ch_offset
+from core.event_builder import EventBuilder
+from core.suppression import ZeroSuppressor
+from core.monitor import MonitorServer
+from core.metrics import MetricsServer, SnapshotWriter
+
+from threading import Thread, Event, Lock
+from queue import Queue, Empty, Full
+
+
+class DAQ:
+    def __init__(self,
+                 dig_config: Optional[str | list] = None,
+                 rec_config: Optional[str] = None):
+        '''
+        Initialise the acquisition for the digitiser(s). dig_config may be a list
+        of digitiser configs, one per board, each read out by its own worker.
+        '''
+
+        # Initialise logging and tracking
+        setup_logging()
+        self.tracker = Tracker()
+        logging.info("Controller initialising.")
+
+        # Digitiser configuration, one config per board
+        self.dig_config = dig_config
+        self.rec_config = rec_config
+        self.dig_configs = dig_config if isinstance(dig_config, list) else [dig_config]
+        self.dig_dicts = [read_config_file(config) for config in self.dig_configs]
+        self.dig_dict = self.dig_dicts[0]
+        self.rec_dict = read_config_file(self.rec_config)
+
+        # Thread-safe communication channels
+        self.cmd_buffers = [Queue(maxsize=10) for _ in self.dig_configs]
+        self.cmd_buffer = self.cmd_buffers[0]
+        self.display_buffer = Queue(maxsize=1024 * len(self.dig_configs))
+        self.worker_stop_event = Event()
+        self.writer_stop_event = Event()
+        self.builder_stop_event = Event()
+        self.recording = False
+        self.recording_event = Event()  # recording, for the workers' backpressure policy
+        # held while checking recording and handing events to the writer, so none are handed over once it stops
+        self.record_lock = Lock()
+        # time between checks that the writer is still running, while waiting for room in its buffer (s)
+        self.record_timeout = 0.5
+        self.writer_lost = False
+
+        # waveforms are handed to the renderer only if there's a display
+        self.renderer = None
+
+        # Channels of every board, numbered from each board's offset
+        self.ch_offsets = [board_ch_offset(dig_dict, i) for i, dig_dict in enumerate(self.dig_dicts)]
+        self.ch_mapping = {}
+        for ch_offset in self.ch_offsets:
+            self.ch_mapping.update(get_ch_mapping(self.rec_dict, ch_offset))
+        self.num_ch = len(self.ch_mapping)
+
+        # Acquisition workers, one per board so that no board's readout waits on another's.
+        # They share the display buffer, without ever blocking on it
+        self.sw_timeout = self.rec_dict['software_timeout']
+        self.workers = []
+        for cmd_buffer, ch_offset in zip(self.cmd_buffers, self.ch_offsets):
+            self.workers.append(AcquisitionWorker(
+                cmd_buffer=cmd_buffer,
+                display_buffer=self.display_buffer,
+                stop_event=self.worker_stop_event,
+                sw_timeout = self.sw_timeout,
+                poll_policy = self.rec_dict.get('poll_policy', 'adaptive'),
+                poll_max_wait = self.rec_dict.get('poll_max_wait', 1e-3),
+                ch_offset = ch_offset,
+                metrics = self.tracker.metrics,
+                recording = self.recording_event,
+                backpressure = self.rec_dict.get('backpressure', 'block'),
+                high_water = self.rec_dict.get('high_water', 0.9),
+                spill_dir = self.rec_dict.get('spill_dir')
+            ))
+        self.worker = self.workers[0]
+
+        # events are built from the readout of every channel and board by timestamp, before display and writing
+        self.builder = EventBuilder(input_buffer = self.display_buffer,
+                                    dispatch     = self.dispatch,
+                                    stop_event   = self.builder_stop_event,
+                                    channels     = list(self.ch_mapping.keys()),
+                                    n_boards     = len(self.workers),
+                                    window       = self.rec_dict.get('coincidence_window', 0),
+                                    depth        = self.rec_dict.get('builder_depth', 65536),
+                                    idle_timeout = self.rec_dict.get('builder_timeout', 0.5))
+        self.builder.start()
+
+        # Start acquisition worker threads and log
+        for worker in self.workers:
+            worker.start()
+        logging.info(f"{len(self.workers)} acquisition worker thread(s) started.")
+
+        # waveforms of channels that didn't fire are suppressed before they reach the writer
+        self.suppressor = ZeroSuppressor(self.rec_dict) if self.rec_dict.get('zero_suppression') else None
+
+        # Multi channel writes to h5
+        self.h5_flush_size = self.rec_dict['h5_flush_size']
+        self.writer_buffer = Queue(maxsize=1024)
+        # the writer runs as a thread or, to keep HDF5 encoding off the GIL, as a separate process
+        writer_class = ProcessWriter if self.rec_dict.get('writer_mode', 'thread') == 'process' else Writer
+        self.writer = writer_class(
+                            ch_map        = self.ch_mapping,
+                            flush_size    = self.h5_flush_size,
+                            write_buffer  = self.writer_buffer,
+                            stop_event    = self.writer_stop_event,
+                            rec_config    = read_config_file(self.rec_config),
+                            dig_config    = [read_config_file(config) for config in self.dig_configs],
+                            TIMESTAMP     = datetime.now().strftime("%H:%M:%S"),
+                            tracker       = self.tracker
+                        )
+
+        # latest waveforms and status served to remote viewers (carp-viewer), if a port is given
+        self.monitor = None
+        if self.rec_dict.get('monitor_port') is not None:
+            self.monitor = MonitorServer(status     = self.status,
+                                         channels   = list(self.ch_mapping.keys()),
+                                         host       = self.rec_dict.get('monitor_host', '127.0.0.1'),
+                                         port       = self.rec_dict['monitor_port'],
+                                         fps        = self.rec_dict.get('monitor_fps', 10),
+                                         max_points = self.rec_dict.get('monitor_points', 1024))
+            self.monitor.start()
+            self.monitor.listening.wait(timeout=5)
+
+        # queue depths and events built, sampled whenever the metrics are read
+        metrics = self.tracker.metrics
+        metrics.gauge('display_buffer_depth', 'Readouts waiting for the event builder.', fn = self.display_buffer.qsize)
+        metrics.gauge('writer_buffer_depth', 'Entries waiting for the writer.', fn = self.writer_buffer.qsize)
+        metrics.gauge('cmd_buffer_depth', 'Commands waiting for the acquisition workers.',
+                      fn = lambda: sum(cmd_buffer.qsize() for cmd_buffer in self.cmd_buffers))
+        metrics.gauge('events_built', 'Events built so far.', fn = lambda: self.builder.n_events)
+        metrics.gauge('writer_alive', '1 while the writer is running.', fn = lambda: int(self.writer.is_alive()))
+        metrics.gauge('spill_depth', 'Readouts spilled to disk, waiting for the event builder.',
+                      fn = lambda: sum(worker.spilled() for worker in self.workers))
+        # shared with the workers, whose 'alert' backpressure policy also discards readouts while recording
+        self.n_lost = metrics.counter('record_dropped_total')
+
+        # metrics served to Prometheus on localhost and written to a JSON file, if asked for
+        self.metrics_server = None
+        if self.rec_dict.get('metrics_port') is not None:
+            self.metrics_server = MetricsServer(metrics, port = self.rec_dict['metrics_port'])
+            self.metrics_server.start()
+        self.snapshot_writer = None
+        if self.rec_dict.get('metrics_file'):
+            self.snapshot_writer = SnapshotWriter(metrics, self.rec_dict['metrics_file'],
+                                                  interval = self.rec_dict.get('metrics_interval', 1.0))
+            self.snapshot_writer.start()
+
+
+    def dispatch(self, ring, slots, evts):
+        '''
+        Hand events numbered by the event builder to the renderer and monitor, if any, and, when
+        recording, the writer. Runs on the builder thread, so waveforms are only handed to the
+        renderer here, never drawn. Releases the slots once done with them.
+        '''
+        try:
+            for slot in slots:
+                # you must pass wf_size and ADCs through.
+                for wf_size, ADCs, ch, timestamp in ring.event(slot):
+
+                    # offer to the renderer, replacing any frame not drawn yet
+                    if self.renderer is not None:
+                        self.renderer.push(ch, ADCs[:wf_size], ring.adc_bits)
+                    if self.monitor is not None:
+                        self.monitor.push(ch, ADCs[:wf_size])
+
+                    # ping the tracker (make this optional)
+                    self.tracker.track(ADCs.nbytes)
+
+            # readout to display latency
+            self.tracker.track_latency('display', time.perf_counter() - ring.read_time[slots])
+
+            with self.record_lock:
+                if self.recording:
+                    self.record(ring, slots, evts)
+
+        except Exception as e:
+            logging.exception(f"Error updating display: {e}")
+
+        finally:
+            # display is done with the slots
+            ring.release(slots)
+
+
+    def record(self, ring, slots, evts):
+        '''
+        Hand slots to the writer, less the waveforms zero suppression drops. The writer
+        is given the mask of waveforms to keep, and releases the slots once written.
+        '''
+        keep = None
+        if self.suppressor is not None:
+            keep = self.suppressor.keep(ring, slots)
+            if self.suppressor.mode == 'drop':
+                # slots with no channel left aren't written at all
+                fired = keep.any(axis=1)
+                slots, evts, keep = slots[fired], evts[fired], keep[fired]
+            if keep.all():
+                keep = None
+        if len(slots) == 0:
+            return
+
+        # push the slot references to writer buffer, the writer releases them once written
+        ring.hold(slots)
+        while True:
+            if not self.writer.is_alive() or self.writer.failed:
+                # nothing will take them, so the slots go back to the digitiser rather than stalling readout
+                ring.release(slots)
+                self.n_lost.add(len(slots))
+                break
+            try:
+                self.writer_buffer.put((ring, slots, evts, keep), timeout=self.record_timeout)
+            except Full:
+                continue
+            # a failing writer empties its buffer, which may have been just before the put
+            if not self.writer.failed:
+                return
+            break
+
+        self.release_unwritten()
+        if not self.writer_lost:
+            logging.error("Writer has stopped while recording, events are no longer written.")
+            self.writer_lost = True
+
+    def release_unwritten(self):
+        '''
+        Release the slots of the entries left in the writer buffer, once the writer has stopped.
+        '''
+        n = 0
+        while True:
+            try:
+                ring, slots, *_ = self.writer_buffer.get_nowait()
+            except Empty:
+                break
+            ring.release(slots)
+            n += len(slots)
+        if n:
+            self.n_lost.add(n)
+            logging.warning(f"{n} readouts left unwritten by the writer, released.")
+
+
+    def status(self) -> dict:
+        '''
+        Acquisition status, as served to remote monitors.
+        '''
+        return {'recording'     : self.recording,
+                'events_built'  : self.builder.n_events,
+                'writer_alive'  : self.writer.is_alive(),
+                'writer_buffer' : self.writer_buffer.qsize(),
+                **self.tracker.rates()}
+
+
+    def connect_digitiser(self):
+        '''
+        Connect to the digitiser using the provided configuration file.
+        This is a placeholder function and should be replaced with actual
+        digitiser connection logic.
+
+        Need to allow for changing config files after initial application launch.
+        '''
+
+        # Load in new configs
+        # self.dig_dict = some other dig_config
+        # self.rec_dict = some other rec_config
+
+        dig_configs = self.dig_config if isinstance(self.dig_config, list) else [self.dig_config]
+        if len(dig_configs) != len(self.cmd_buffers):
+            logging.error(f"{len(dig_configs)} digitiser configs given for {len(self.cmd_buffers)} digitisers.")
+            return
+        for cmd_buffer, dig_config in zip(self.cmd_buffers, dig_configs):
+            cmd_buffer.put(Command(CommandType.CONNECT, (dig_config, self.rec_config)))
+
+
+    def start_acquisition(self):
+        '''
+        Start digitiser acquisition.
+        '''
+        logging.info("Starting acquisition.")
+        for cmd_buffer in self.cmd_buffers:
+            cmd_buffer.put(Command(CommandType.START))
+
+    def stop_acquisition(self):
+        '''
+        Stop digitiser acquisition.
+        '''
+        logging.info("Stopping acquisition.")
+        for cmd_buffer in self.cmd_buffers:
+            cmd_buffer.put(Command(CommandType.STOP))
+
+    def start_recording(self):
+        '''
+        Start recording data.
+        '''
+        # started first, as events are only handed to a running writer
+        if not self.writer.is_alive():
+            self.writer.start()
+            logging.info(f'Writer thread started.')
+        with self.record_lock:
+            self.recording = True
+            self.writer_lost = False
+        self.recording_event.set()
+
+        logging.info("Starting recording.")
+
+    def stop_recording(self):
+        '''
+        Stop recording data.
+        '''
+        with self.record_lock:
+            self.recording = False
+        self.recording_event.clear()
+        self.writer_stop_event.set()
+
+        self.writer.join(timeout=2)
+        if not self.writer.is_alive():
+            self.release_unwritten()
+
+        if self.suppressor is not None:
+            self.suppressor.log_stats()
+        logging.info("Writer thread stopping recording.")
+
+    def run(self, duration: Optional[float] = None, n_events: Optional[int] = None) -> bool:
+        '''
+        Record without a display until duration (s) has passed, n_events events have been
+        built or SIGINT is received, logging progress every second. Shuts down afterwards,
+        returning whether the shutdown was clean.
+        '''
+        interrupted = Event()
+        signal.signal(signal.SIGINT, lambda signum, frame: interrupted.set())
+
+        self.connect_digitiser()
+        self.start_recording()
+        self.start_acquisition()
+        limits = [f'{duration} s' if duration else None, f'{n_events} events' if n_events else None]
+        logging.info(f"Recording headless until {' or '.join(l for l in limits if l) or 'interrupted'}.")
+
+        t_start = time.perf_counter()
+        while not interrupted.wait(timeout=1.0):
+            elapsed = time.perf_counter() - t_start
+            self.tracker.log_progress(elapsed, self.builder.n_events)
+            if (duration and elapsed >= duration) or (n_events and self.builder.n_events >= n_events):
+                break
+        if interrupted.is_set():
+            logging.info("Interrupted, stopping.")
+
+        # the builder and writer drain what has been read out, while still recording
+        self.stop_acquisition()
+        clean = self.shutdown(timeout=10)
+        if self.suppressor is not None:
+            self.suppressor.log_stats()
+        return clean
+
+    def shutdown(self, timeout: float = 2) -> bool:
+        '''
+        Carefully shut down acquisition and worker thread, waiting up to timeout (s) for each.
+        Returns whether every thread stopped.
+        '''
+        logging.info("Shutting down controller.")
+
+        if self.renderer is not None:
+            self.renderer.stop()
+        if self.monitor is not None:
+            self.monitor.stop(timeout=timeout)
+
+        # Acquisition Worker threads
+        for cmd_buffer in self.cmd_buffers:
+            cmd_buffer.put(Command(CommandType.EXIT))
+        self.worker_stop_event.set()
+        for worker in self.workers:
+            worker.join(timeout=timeout)
+
+        # Event builder, emptied into the writer before it stops
+        self.builder_stop_event.set()
+        self.builder.join(timeout=timeout)
+
+        # Writer threads, only started once recording
+        self.writer_stop_event.set()
+        if self.writer.ident is not None:
+            self.writer.join(timeout=timeout)
+        if not self.writer.is_alive():
+            self.release_unwritten()
+
+        clean_shutdown = True
+
+        for worker in self.workers:
+            if worker.is_alive():
+                clean_shutdown = False
+                logging.warning("AcquisitionWorker did not stop cleanly.")
+
+        if self.builder.is_alive():
+            clean_shutdown = False
+            logging.warning("Event builder did not stop cleanly.")
+
+        if self.writer.is_alive():
+            clean_shutdown = False
+            logging.warning("Writer did not stop cleanly.")
+
+        # after the writer, so the last snapshot holds the whole run
+        if self.snapshot_writer is not None:
+            self.snapshot_writer.stop(timeout=timeout)
+        if self.metrics_server is not None:
+            self.metrics_server.stop(timeout=timeout)
+
+        if clean_shutdown:
+            logging.info("Controller shutdown complete.")
+
+        else:
+            logging.info("Controller shutdown failed.")
+        return clean_shutdown
@@ -1,3 +1,4 @@
+import numpy as np
 import tables as tb
 from typing import Type
 
@@ -29,3 +30,10 @@ def return_rwf_class(WD_version : str, shape : int) -> Type[tb.IsDescription]:
             rwf       = tb.Float32Col(shape = (shape,))
 
     return rwf_df
+
+
+def return_rwf_dtype(WD_version : str, shape : int) -> np.dtype:
+    '''
+    numpy structured dtype matching the rows of return_rwf_class, for building blocks of rows.
+    '''
+    return tb.description.dtype_from_descr(return_rwf_class(WD_version, shape))
@@ -0,0 +1,244 @@
+'''
+Event builder, grouping the readout of every channel and digitiser by timestamp.
+
+Workers push (ring, slots) blocks onto a shared input buffer without waiting,
+and the builder sorts the fragments (ring slots) into one stream. Fragments
+within `window` timestamp ticks of the first fragment of an event are grouped
+into that event. A SCOPE fragment holds every channel of its board, a DPP-PSD
+fragment a single channel.
+
+Each source (a SCOPE board, or one channel of a DPP-PSD board) reads out in
+time order, so an event still short of channels is only emitted once every
+source has reported past it, or has gone quiet for `idle_timeout`, so a channel
+that stops triggering doesn't hold back the others. Events then still missing
+channels are emitted as partial events, and fragments arriving after their
+event was emitted are emitted alone and counted as orphans.
+'''
+import time
+import logging
+import numpy as np
+from queue import Queue, Empty
+from threading import Thread, Event
+
+
+class EventBuilder(Thread):
+    '''
+    Builds events from the (ring, slots) blocks put on input_buffer, handing them
+    to dispatch(ring, slots, event_nos) once per ring, in timestamp order.
+
+    The builder takes over the reference each slot holds, dispatch is responsible
+    for releasing it.
+    '''
+    def __init__(self,
+                 input_buffer : Queue,
+                 dispatch     : callable,
+                 stop_event   : Event,
+                 channels     : list,
+                 n_boards     : int   = 1,
+                 window       : int   = 0,
+                 depth        : int   = 65536,
+                 idle_timeout : float = 0.5):
+        '''
+        channels     : every channel recorded, an event holding all of them is complete
+        n_boards     : digitisers read out, events are held until each has reported or gone quiet
+        window       : coincidence window, in timestamp ticks
+        depth        : most fragments held, beyond which the oldest are emitted early
+        idle_timeout : time after which a quiet source no longer holds back the others (s)
+        '''
+        super().__init__(daemon=True)
+        self.input_buffer = input_buffer
+        self.dispatch     = dispatch
+        self.stop_event   = stop_event
+        self.n_channels   = len(channels)
+        self.n_boards     = n_boards
+        self.window       = window
+        self.depth        = depth
+        self.idle_timeout = idle_timeout
+
+        # rings by index, and the latest timestamp and arrival time of each source, by (ring, ch)
+        self.rings      = []
+        self.ring_index = {}
+        self.latest_ts  = {}
+        self.last_seen  = {}
+        self.t_start    = None      # arrival of the first fragment
+
+        # buffered fragments, in timestamp order: timestamp, ring index, slot, channels held, and
+        # source, ring index and channel in one key, so a source's fragments only count once per event
+        self.pending   = []
+        self.ts        = np.empty(0, dtype=np.int64)
+        self.ring_no   = np.empty(0, dtype=np.int64)
+        self.slot      = np.empty(0, dtype=np.int64)
+        self.cover     = np.empty(0, dtype=np.int64)
+        self.source    = np.empty(0, dtype=np.int64)
+        self.emitted   = -1     # end of the window of the latest event emitted
+
+        self.n_events   = 0     # events built, also the next event number
+        self.n_complete = 0     # events holding every channel
+        self.n_partial  = 0     # events emitted without every channel
+        self.n_orphans  = 0     # fragments that arrived after their event was emitted
+        self.n_forced   = 0     # events emitted early as the buffer was full
+
+    def add(self, ring, slots: np.ndarray):
+        '''
+        Buffer a block of fragments.
+        '''
+        if self.t_start is None:
+            self.t_start = time.perf_counter()
+        if ring not in self.ring_index:
+            self.ring_index[ring] = len(self.rings)
+            self.rings.append(ring)
+            self.register(ring)
+        ts = ring.timestamp[slots].astype(np.int64)
+        # SCOPE fragments hold every channel of the board, under source -1
+        if ring.channel is None:
+            chs   = np.full(len(slots), -1)
+            cover = np.full(len(slots), len(ring.ch_list))
+        else:
+            chs   = ring.channel[slots].astype(np.int64)
+            cover = np.ones(len(slots), dtype=np.int64)
+
+        now = time.perf_counter()
+        for ch in np.unique(chs):
+            source = (ring, int(ch))
+            latest = ts[chs == ch]
+            # sources read out in time order, going back means the timestamps were reset (a new run)
+            if latest[0] < self.latest_ts.get(source, -1):
+                logging.info("Timestamps reset, emitting every buffered event.")
+                self.restart()
+            self.latest_ts[source] = latest.max()
+            self.last_seen[source] = now
+
+        # fragments whose event was already emitted can't join it
+        late = ts <= self.emitted
+        if late.any():
+            n = int(late.sum())
+            self.n_orphans += n
+            self.dispatch(ring, slots[late], np.arange(self.n_events, self.n_events + n))
+            self.n_events  += n
+            ts, slots, chs, cover = ts[~late], slots[~late], chs[~late], cover[~late]
+
+        ring_no = np.full(len(ts), self.ring_index[ring])
+        self.pending.append((ts, ring_no, slots, cover, (ring_no << 32) + chs + 1))
+
+    def register(self, ring):
+        '''
+        Expect fragments from every source of a ring, holding back events until each has
+        reported or gone quiet.
+        '''
+        now = time.perf_counter()
+        for ch in ([-1] if ring.channel is None else ring.ch_list):
+            self.latest_ts[(ring, ch)] = -1
+            self.last_seen[(ring, ch)] = now
+
+    def restart(self):
+        '''
+        Emit everything buffered, and forget the timestamps seen so far.
+        '''
+        self.build(flush = True)
+        self.latest_ts.clear()
+        self.last_seen.clear()
+        for ring in self.rings:
+            self.register(ring)
+        self.emitted = -1
+
+    def watermark(self) -> float:
+        '''
+        Timestamp every active source has reported past, no more fragments are due before it.
+        '''
+        now    = time.perf_counter()
+        # a board not heard from yet may still send fragments from the start
+        if len(self.rings) < self.n_boards and now - self.t_start < self.idle_timeout:
+            return -1
+        active = [ts for source, ts in self.latest_ts.items() if now - self.last_seen[source] < self.idle_timeout]
+        return min(active) if active else np.inf
+
+    def build(self, flush: bool = False):
+        '''
+        Emit every event that is complete or can't gain any more fragments (all of them
+        if flush), plus the oldest events beyond depth.
+        '''
+        if self.pending:
+            ts, ring_no, slot, cover, source = (np.concatenate(x) for x in zip(*self.pending))
+            self.pending.clear()
+            ts      = np.concatenate([self.ts, ts])
+            ring_no = np.concatenate([self.ring_no, ring_no])
+            slot    = np.concatenate([self.slot, slot])
+            cover   = np.concatenate([self.cover, cover])
+            source  = np.concatenate([self.source, source])
+            order   = np.argsort(ts, kind='stable')
+            self.ts, self.ring_no, self.slot = ts[order], ring_no[order], slot[order]
+            self.cover, self.source = cover[order], source[order]
+        if len(self.ts) == 0:
+            return
+
+        limit = np.inf if flush else self.watermark()
+        # group greedily from the oldest fragment, each event spanning window ticks
+        evts = np.empty(len(self.ts), dtype=np.int64)
+        stop = 0
+        while stop < len(self.ts):
+            start    = stop
+            end      = self.ts[start] + self.window
+            stop     = int(np.searchsorted(self.ts, end, side='right'))
+            # channels held, counting each source once, as one may trigger twice in the window (pile-up)
+            _, first = np.unique(self.source[start:stop], return_index=True)
+            complete = bool(self.cover[start:stop][first].sum() >= self.n_channels)
+            if end >= limit and not complete:
+                if len(self.ts) - start <= self.depth:
+                    stop = start
+                    break
+                self.n_forced += 1
+            evts[start:stop] = self.n_events
+            self.n_events   += 1
+            self.n_complete += complete
+            self.n_partial  += not complete
+            self.emitted     = max(self.emitted, end)
+
+        if stop == 0:
+            return
+        self.emit(self.ring_no[:stop], self.slot[:stop], evts[:stop])
+        self.ts, self.ring_no, self.slot = self.ts[stop:], self.ring_no[stop:], self.slot[stop:]
+        self.cover, self.source = self.cover[stop:], self.source[stop:]
+
+    def emit(self, ring_no: np.ndarray, slot: np.ndarray, evts: np.ndarray):
+        for i, ring in enumerate(self.rings):
+            mask = ring_no == i
+            if mask.any():
+                self.dispatch(ring, slot[mask], evts[mask])
+
+    def stats(self) -> dict:
+        return {'events'   : self.n_events,
+                'complete' : self.n_complete,
+                'partial'  : self.n_partial,
+                'orphans'  : self.n_orphans,
+                'forced'   : self.n_forced,
+                'buffered' : len(self.ts) + sum(len(p[0]) for p in self.pending)}
+
+    def run(self):
+        logging.info("Event builder started.")
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    ring, slots = self.input_buffer.get(timeout=self.idle_timeout / 10)
+                    self.add(ring, slots)
+                    # take whatever else has arrived before building
+                    while True:
+                        ring, slots = self.input_buffer.get_nowait()
+                        self.add(ring, slots)
+                except Empty:
+                    pass
+                self.build()
+
+            # emit everything still buffered
+            while True:
+                try:
+                    self.add(*self.input_buffer.get_nowait())
+                except Empty:
+                    break
+            self.build(flush = True)
+
+        except Exception as e:
+            logging.exception(f"Fatal error in event builder: {e}")
+
+        stats = self.stats()
+        logging.info(f"Event builder exited cleanly, {stats['events']} events built: {stats['complete']} complete, "
+                     f"{stats['partial']} partial, {stats['orphans']} orphans, {stats['forced']} emitted early.")
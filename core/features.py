@@ -0,0 +1,76 @@
+'''
+Per-channel feature extraction, run on whole blocks of waveforms at once.
+
+For every waveform the baseline is taken as the mean of the pre-trigger
+samples, and the pulse, flipped to be positive for negative polarity
+channels, gives the amplitude, the sample it peaks at and its integral over
+each gate. Gates are set in ns from the trigger, as the record length and
+pre-trigger are, so:
+
+    features = {'gates' : [(-16, 100), (-16, 1000)], 'baseline_margin' : 16}
+
+integrates a short and a long gate, both opening 16 ns before the trigger,
+with the baseline taken up to 16 ns before the trigger.
+'''
+import logging
+import numpy as np
+
+
+def feature_dtype(n_gates: int) -> np.dtype:
+    '''
+    Rows of the ch_N/features table.
+    '''
+    return np.dtype([('evt_no',      np.uint32),
+                     ('channel',     np.uint32),
+                     ('timestamp',   np.uint64),
+                     ('baseline',    np.float32),
+                     ('amplitude',   np.float32),
+                     ('peak_sample', np.uint32),
+                     ('charge',      np.float32, (n_gates,))])
+
+
+class FeatureExtractor:
+    '''
+    Extracts the features of blocks of wf_size sample waveforms, recorded with the
+    record length, pre-trigger and channel polarities of rec_config.
+    '''
+    def __init__(self, rec_config: dict, wf_size: int):
+        settings = rec_config['features']
+        self.dtype = feature_dtype(len(settings['gates']))
+
+        # ns to samples, from the record length the waveforms were recorded with
+        samples_per_ns = wf_size / rec_config['record_length']
+        trigger = int(rec_config['pre_trigger'] * samples_per_ns)
+        margin  = int(settings.get('baseline_margin', 0) * samples_per_ns)
+        self.n_baseline = min(max(trigger - margin, 1), wf_size)
+
+        self.gates = []
+        for start, stop in settings['gates']:
+            start = min(max(trigger + int(start * samples_per_ns), 0), wf_size)
+            stop  = min(max(trigger + int(stop * samples_per_ns), start + 1), wf_size)
+            self.gates.append((start, stop))
+        logging.info(f'Feature extraction: baseline over {self.n_baseline} samples, gates {self.gates} (samples).')
+
+        # signal sign of each channel, by channel number on its digitiser
+        self.sign = {}
+        for key, value in rec_config.items():
+            if key.startswith('ch') and key[2:].isdigit():
+                self.sign[int(key[2:])] = -1 if value.get('polarity') == 'negative' else 1
+
+    def extract(self, waveforms: np.ndarray, ch: int, out: np.ndarray):
+        '''
+        Fill the baseline, amplitude, peak_sample and charge of out from a (events, samples)
+        block of channel ch's waveforms, ch being the channel number on its digitiser.
+        '''
+        wf       = waveforms.astype(np.float32)
+        baseline = wf[:, :self.n_baseline].mean(axis=1)
+        # baseline subtracted pulse, positive whatever the polarity
+        wf      -= baseline[:, None]
+        wf      *= self.sign.get(ch, 1)
+
+        peak = wf.argmax(axis=1)
+        out['baseline']    = baseline
+        out['amplitude']   = wf[np.arange(len(wf)), peak]
+        out['peak_sample'] = peak
+        for i, (start, stop) in enumerate(self.gates):
+            out['charge'][:, i] = wf[:, start:stop].sum(axis=1)
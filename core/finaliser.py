@@ -0,0 +1,94 @@
+'''
+Background finalisation of finished output files: closing, optional
+repacking and checksum generation, so the writer moves straight on to the next file.
+'''
+import os
+import shutil
+import hashlib
+import logging
+import subprocess
+from queue import Queue
+from threading import Thread, Lock
+import tables as tb
+
+# HDF5 calls from the writer and the finaliser must not overlap
+HDF5_LOCK = Lock()
+
+
+class Finaliser(Thread):
+    '''
+    Closes the h5 files handed to it, then optionally repacks them with ptrepack
+    and writes a <file>.sha256 checksum alongside. Paths of files already closed
+    (raw output) are only checksummed.
+    '''
+    def __init__(self, repack : bool = False, checksum : bool = True):
+        super().__init__(daemon=True)
+        self.repack   = repack
+        self.checksum = checksum
+        self.queue    = Queue()
+
+    def put(self, h5file : tb.File | str):
+        '''
+        Hand over a finished file, the caller must not touch it afterwards.
+        '''
+        self.queue.put(h5file)
+
+    def stop(self):
+        '''
+        Finalise the files already handed over, then exit.
+        '''
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        while (h5file := self.queue.get()) is not None:
+            try:
+                self.finalise(h5file)
+            except Exception as e:
+                logging.exception(f"Failed to finalise output file: {e}")
+
+    def finalise(self, h5file : tb.File | str):
+        if isinstance(h5file, str):
+            path = h5file
+        else:
+            path = h5file.filename
+            with HDF5_LOCK:
+                h5file.close()
+
+        if self.repack and path.endswith('.h5'):
+            self.repack_file(path)
+        if self.checksum:
+            self.write_checksum(path)
+        logging.info(f"Output file {path} finalised.")
+
+    def repack_file(self, path : str):
+        '''
+        Rewrite the file with ptrepack, reclaiming unused space and keeping each table's filters.
+        Runs as a separate process, so it doesn't hold the HDF5 lock.
+        '''
+        ptrepack = shutil.which('ptrepack')
+        if ptrepack is None:
+            logging.warning("ptrepack not found, output files will not be repacked.")
+            self.repack = False
+            return
+
+        tmp_path = f'{path}.repack'
+        args     = [ptrepack, '--chunkshape=keep', '--keep-source-filters', f'{path}:/', f'{tmp_path}:/']
+        result   = subprocess.run(args, capture_output=True, text=True)
+        if result.returncode != 0:
+            logging.error(f"ptrepack of {path} failed:\n{result.stderr}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        os.replace(tmp_path, path)
+
+    def write_checksum(self, path : str):
+        '''
+        Write <path>.sha256 in the format read by sha256sum -c.
+        '''
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(1 << 24):
+                digest.update(chunk)
+        with open(f'{path}.sha256', 'w') as f:
+            f.write(f'{digest.hexdigest()}  {os.path.basename(path)}\n')
@@ -1,21 +1,53 @@
+import numpy as np
 
-def get_ch_mapping(rec_dict):
+
+
+def get_ch_mapping(rec_dict, ch_offset = 0):
     '''
     Extract what channels are being used map them: ch -> index
 
     So shape will be:
     mapping = {0 : 0, 3 : 1, 5 : 2}
     for the case where ch0, 3, and 5 are enabled
+
+    ch_offset is added to the channel numbers, see board_ch_offset
     '''
     mapping = {}
     i = 0
     for entry in rec_dict:
-        if 'ch' in entry:
+        # only chN entries, other keys (checksum, chunk_events...) can contain 'ch'
+        if entry.startswith('ch') and entry[2:].isdigit():
             if rec_dict[entry]['enabled']:
                 ch = int(entry[2:])
-                mapping[ch] = i
+                mapping[ch + ch_offset] = i
                 i += 1
 
     return mapping
 
 
+def board_ch_offset(dig_dict, board):
+    '''
+    Offset added to the channel numbers of a board, so that several boards don't
+    share them. Taken from ch_offset in the digitiser config, by default boards are
+    numbered in steps of 64 channels (the most of any CAEN digitiser).
+    '''
+    return int(dig_dict.get('ch_offset', 64 * board))
+
+
+def minmax_decimate(x: np.ndarray, y: np.ndarray, n_bins: int):
+    '''
+    Reduce a waveform to the min and max of n_bins equal bins, returning 2 * n_bins points
+    so that single-sample spikes survive. The bins are taken from the start, the last
+    one may be shorter.
+    '''
+    step  = -(-len(y) // n_bins)
+    n_out = -(-len(y) // step)
+    pad   = n_out * step - len(y)
+    # repeat the last sample to fill the last bin, it doesn't change its min or max
+    bins  = np.concatenate([y, np.repeat(y[-1:], pad)]).reshape(n_out, step)
+
+    y_out = np.empty(2 * n_out, dtype=y.dtype)
+    y_out[0::2] = bins.min(axis=1)
+    y_out[1::2] = bins.max(axis=1)
+    x_out = np.repeat(x[::step], 2)
+    return x_out, y_out
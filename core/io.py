@@ -1,7 +1,3 @@
-import pandas as pd
-import tables as tb
-import core.df_classes as df_class 
-
 import ast
 import configparser
 import logging
@@ -47,8 +43,11 @@ def read_config_file(file_path  :  str) -> dict:
     return arg_dict
 
 
-def create_config_table(h5file : tb.File, dictionary : dict, name : str, description = "config"):
-        
+def create_config_table(h5file : 'tb.File', dictionary : dict, name : str, description = "config"):
+        # tables is only loaded when writing HDF5, so reading configs stays quick
+        import tables as tb
+        import core.df_classes as df_class
+
         # create config node if it doesnt exist already
         try:
                 group = h5file.get_node("/", "config")
@@ -65,10 +64,59 @@ def create_config_table(h5file : tb.File, dictionary : dict, name : str, descrip
                 for key_2, value_2 in values.items():
                     #print(key_2)
                     config_details['key'] = f'{key}/{key_2}'
-                    config_details['value'] = value_2
+                    # sequences (eg. feature gates) are stored as their text
+                    config_details['value'] = str(value_2) if isinstance(value_2, (list, tuple)) else value_2
                     config_details.append()
             else:
                 config_details['key']   = key
-                config_details['value'] = values
+                config_details['value'] = str(values) if isinstance(values, (list, tuple)) else values
                 config_details.append()
         table.flush()
+
+
+# shorthands accepted for complib in [output_settings]
+COMPLIB_ALIASES = {
+    'zstd' : 'blosc2:zstd',
+    'lz4'  : 'blosc2:lz4',
+}
+
+
+def get_filters(rec_dict : dict) -> 'tb.Filters':
+    '''
+    Build the HDF5 filters for the raw waveform tables from [output_settings].
+
+    Parameters
+    ----------
+
+    rec_dict (dict)  :  Recording config, using the keys
+                        complib   - compression library: blosc2, zstd, lz4 or any PyTables complib (None to disable)
+                        complevel - compression level, 0-9
+                        shuffle   - byte 'shuffle', 'bitshuffle' or None
+
+    Returns
+    -------
+
+    filters (tb.Filters)  :  Filters to apply when creating tables
+    '''
+    import tables as tb
+
+    complib   = rec_dict.get('complib', None)
+    complevel = rec_dict.get('complevel', 0 if complib is None else 4)
+    shuffle   = rec_dict.get('shuffle', 'shuffle')
+
+    if complib is None or complevel == 0:
+        return tb.Filters(complevel = 0)
+
+    complib = COMPLIB_ALIASES.get(complib, complib)
+    if complib not in tb.filters.all_complibs or tb.which_lib_version(complib.split(':')[0]) is None:
+        logging.warning(f"Compression library '{complib}' not available, falling back to zlib.")
+        complib = 'zlib'
+
+    if shuffle not in ('shuffle', 'bitshuffle', None):
+        logging.warning(f"Unknown shuffle '{shuffle}', falling back to byte shuffle.")
+        shuffle = 'shuffle'
+
+    return tb.Filters(complevel  = complevel,
+                      complib    = complib,
+                      shuffle    = shuffle == 'shuffle',
+                      bitshuffle = shuffle == 'bitshuffle')
@@ -0,0 +1,270 @@
+'''
+Registry of the acquisition's counters, gauges and latency histograms, read by
+the GUI stats box, a Prometheus text endpoint and a periodic JSON snapshot file.
+
+Metrics are updated on the hot paths without locks: counters are sharded per
+thread, each thread adding only to its own cell, and are summed when read.
+Gauges are set by a single thread, or sampled from a function when read
+(queue depths). Reads may lag an update in progress by one event, never more.
+'''
+import os
+import json
+import time
+import logging
+import threading
+import numpy as np
+from threading import Thread, Event, Lock
+from typing import Callable, Optional
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class Counter:
+    '''
+    Count that only goes up, sharded per thread. add() takes a lock only the first
+    time a thread adds to it.
+    '''
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str = ''):
+        self.name  = name
+        self.help  = help
+        self.cells = []
+        self.local = threading.local()
+        self.lock  = Lock()
+
+    def add(self, n: int = 1):
+        try:
+            self.local.cell[0] += n
+        except AttributeError:
+            cell = self.local.cell = [n]
+            with self.lock:
+                self.cells.append(cell)
+
+    @property
+    def value(self) -> int:
+        return sum(cell[0] for cell in list(self.cells))
+
+
+class Gauge:
+    '''
+    Value that goes up and down, set by one thread or sampled from fn() when read.
+    '''
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str = '', fn: Optional[Callable[[], float]] = None):
+        self.name   = name
+        self.help   = help
+        self.fn     = fn
+        self.value_ = 0
+
+    def set(self, value: float):
+        self.value_ = value
+
+    @property
+    def value(self) -> float:
+        return self.fn() if self.fn is not None else self.value_
+
+
+class LatencyHistogram:
+    '''
+    Histogram of latencies in log-spaced bins from 1 us to 100 s, cheap
+    enough to fill per event and merge into percentiles on request.
+    '''
+    kind  = 'summary'
+    edges = np.logspace(-6, 2, 401)     # s, ~5% bin width
+
+    def __init__(self, name: str = '', help: str = ''):
+        self.name = name
+        self.help = help
+        # first and last bins catch under and overflow
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64)
+        self.total  = 0.0
+
+    def add(self, latency):
+        '''
+        Add a latency (s), or an array of them.
+        '''
+        np.add.at(self.counts, np.searchsorted(self.edges, latency), 1)
+        self.total += float(np.sum(latency))
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def percentile(self, q: float) -> float:
+        '''
+        Upper edge of the bin holding the q-th percentile (s), nan if empty.
+        '''
+        total = self.count
+        if total == 0:
+            return float('nan')
+        i = int(np.searchsorted(np.cumsum(self.counts), q / 100 * total))
+        return float(self.edges[min(i, len(self.edges) - 1)])
+
+    def summary(self) -> dict:
+        '''
+        Count and p50/p99/max latency (s), the latencies None while empty, as JSON has no nan.
+        '''
+        if self.count == 0:
+            return {'count' : 0, 'p50' : None, 'p99' : None, 'max' : None}
+        return {'count' : self.count,
+                'p50'   : self.percentile(50),
+                'p99'   : self.percentile(99),
+                'max'   : self.percentile(100)}
+
+    @property
+    def value(self) -> dict:
+        return self.summary()
+
+
+def exposition(value) -> str:
+    '''
+    Metric value as written in the Prometheus text format.
+    '''
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    value = float(value)
+    return 'NaN' if np.isnan(value) else repr(value)
+
+
+def json_value(value):
+    '''
+    Metric value as written in JSON, which has no nan, None in its place.
+    '''
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+class Registry:
+    '''
+    Named metrics, created on first use and shared by everything asking for the
+    same name. Names are exported with prefix.
+    '''
+    def __init__(self, prefix: str = 'carp_'):
+        self.prefix  = prefix
+        self.metrics = {}
+        self.lock    = Lock()
+
+    def get(self, cls, name: str, help: str = '', **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already a {metric.kind}.")
+            return metric
+
+    def counter(self, name: str, help: str = '') -> Counter:
+        return self.get(Counter, name, help)
+
+    def gauge(self, name: str, help: str = '', fn: Optional[Callable[[], float]] = None) -> Gauge:
+        gauge = self.get(Gauge, name, help)
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+    def latency(self, name: str, help: str = '') -> LatencyHistogram:
+        return self.get(LatencyHistogram, name, help)
+
+    def snapshot(self) -> dict:
+        '''
+        Value of every metric, latencies as their count and p50/p99/max (s), None while empty.
+        '''
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {metric.name : json_value(metric.value) for metric in metrics}
+
+    def prometheus(self) -> str:
+        '''
+        Every metric in the Prometheus text exposition format.
+        '''
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            name = self.prefix + metric.name
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            if metric.kind == 'summary':
+                for q in (0.5, 0.99):
+                    lines.append(f'{name}{{quantile="{q}"}} {exposition(metric.percentile(100 * q))}')
+                lines.append(f'{name}_sum {metric.total}')
+                lines.append(f'{name}_count {metric.count}')
+            else:
+                lines.append(f'{name} {exposition(metric.value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer(Thread):
+    '''
+    Serves the registry as Prometheus text on http://host:port/metrics, and as JSON
+    on /metrics.json. port 0 picks a free port, found in self.port.
+    '''
+    def __init__(self, registry: Registry, host: str = '127.0.0.1', port: int = 0):
+        super().__init__(daemon=True)
+        self.registry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path == '/metrics':
+                    body, content_type = registry.prometheus().encode(), 'text/plain; version=0.0.4'
+                elif handler.path == '/metrics.json':
+                    body, content_type = json.dumps(registry.snapshot(), allow_nan=False).encode(), 'application/json'
+                else:
+                    handler.send_error(404)
+                    return
+                handler.send_response(200)
+                handler.send_header('Content-Type', content_type)
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                # scrapes aren't worth a log line each
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port   = self.server.server_address[1]
+
+    def run(self):
+        logging.info(f"Metrics served on http://{self.server.server_address[0]}:{self.port}/metrics.")
+        self.server.serve_forever()
+
+    def stop(self, timeout: float = 2):
+        self.server.shutdown()
+        self.server.server_close()
+        self.join(timeout=timeout)
+
+
+class SnapshotWriter(Thread):
+    '''
+    Writes the registry to path as JSON every interval (s), replacing the file whole
+    so that readers never see it half written.
+    '''
+    def __init__(self, registry: Registry, path: str, interval: float = 1.0):
+        super().__init__(daemon=True)
+        self.registry = registry
+        self.path     = path
+        self.interval = interval
+        self.stopping = Event()
+
+    def write(self):
+        tmp_path = f'{self.path}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'time' : time.time(), 'metrics' : self.registry.snapshot()}, f, indent=1, allow_nan=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Metrics snapshot not written to {self.path}: {e}")
+
+    def run(self):
+        while not self.stopping.wait(timeout=self.interval):
+            self.write()
+        # last values of the run
+        self.write()
+
+    def stop(self, timeout: float = 2):
+        self.stopping.set()
+        self.join(timeout=timeout)
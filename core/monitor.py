@@ -0,0 +1,257 @@
+'''
+Remote monitoring of a run over TCP, without Qt.
+
+MonitorServer runs an asyncio loop on its own thread, sending every connected
+client the latest waveform of each channel, min/max decimated, and the acquisition
+status (rates, events built and written, writer load) at a fixed rate. As with the
+Renderer, the acquisition side only copies waveforms into a back buffer. Each client
+acknowledges every message with a byte, and is sent the next only once it has. Until
+then it holds only the newest message, replaced when the next is ready, so a slow
+client drops frames, and is never sent a backlog, rather than holding back the others
+or the acquisition.
+
+Messages are two big-endian uint32s, the lengths of a JSON header and a binary
+payload, followed by both. The header lists the waveforms packed in the payload
+as {'ch', 'samples', 'points', 'step', 'dtype'}, step being the samples per min/max
+pair once decimated (1 if not).
+
+MonitorClient reads them back, for carp-viewer or scripts.
+'''
+import json
+import time
+import socket
+import struct
+import asyncio
+import logging
+import numpy as np
+from threading import Thread, Event, Lock
+from typing import Callable, Optional
+
+from core.functions import minmax_decimate
+
+FRAME = struct.Struct('!II')    # header and payload lengths
+
+
+def encode(header: dict, payload: bytes = b'') -> bytes:
+    header = json.dumps(header).encode()
+    return FRAME.pack(len(header), len(payload)) + header + payload
+
+
+class Client:
+    '''
+    Sending side of one connection, holding the newest message not yet sent.
+    '''
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader    = reader
+        self.writer    = writer
+        self.pending   = None
+        self.ready     = asyncio.Event()
+        self.n_sent    = 0
+        self.n_dropped = 0  # messages replaced before they were sent
+        self.task      = asyncio.current_task()
+        self.closing   = False
+
+    def offer(self, message: bytes):
+        if self.pending is not None:
+            self.n_dropped += 1
+        self.pending = message
+        self.ready.set()
+
+    def close(self):
+        '''
+        Stop sending, ending send() whether it's waiting on a message or an acknowledgement.
+        '''
+        self.closing = True
+        self.ready.set()
+        self.writer.close()
+
+    async def send(self):
+        '''
+        Send messages as they're offered, waiting for each to be acknowledged.
+        '''
+        while True:
+            await self.ready.wait()
+            if self.closing:
+                return
+            self.ready.clear()
+            message, self.pending = self.pending, None
+            self.writer.write(message)
+            await self.writer.drain()
+            await self.reader.readexactly(1)
+            self.n_sent += 1
+
+
+class MonitorServer(Thread):
+    '''
+    Serves the latest waveforms and status() to TCP clients on host:port at fps messages
+    per second, waveforms decimated to at most max_points points. push() may be called from
+    any thread. port 0 picks a free port, found in self.port once listening.
+    '''
+    def __init__(self,
+                 status       : Callable[[], dict],
+                 channels     : list,
+                 host         : str   = '127.0.0.1',
+                 port         : int   = 0,
+                 fps          : float = 10,
+                 max_points   : int   = 1024):
+        super().__init__(daemon=True)
+        self.status       = status
+        self.channels     = list(channels)
+        self.host         = host
+        self.port         = port
+        self.fps          = fps
+        self.max_points   = max_points
+
+        self.lock      = Lock()
+        self.back      = {}   # ch -> newest waveform, written by push()
+        self.sizes     = {}   # ch -> samples of the newest waveform
+        self.x_cache   = {}   # wf_size -> x axis used for decimation
+        self.clients   = set()
+        self.listening = Event()
+        self.loop      = None
+        self.stopping  = None
+
+    def push(self, ch: int, ADCs: np.ndarray):
+        '''
+        Offer a waveform to the clients, replacing any of ch not sent yet.
+        ADCs is copied, so it may be a view into the ring.
+        '''
+        n = len(ADCs)
+        with self.lock:
+            back = self.back.get(ch)
+            if back is None or len(back) < n or back.dtype != ADCs.dtype:
+                back = self.back[ch] = np.empty(n, dtype=ADCs.dtype)
+            back[:n] = ADCs
+            self.sizes[ch] = n
+
+    def snapshot(self) -> bytes:
+        '''
+        Message of the latest waveform of each channel, decimated, and the status.
+        '''
+        with self.lock:
+            frames = {ch : self.back[ch][:n].copy() for ch, n in self.sizes.items()}
+
+        waveforms, payload = [], []
+        for ch, y in sorted(frames.items()):
+            n, step = len(y), 1
+            if n > self.max_points:
+                x = self.x_cache.get(n)
+                if x is None:
+                    x = self.x_cache[n] = np.arange(n)
+                x, y = minmax_decimate(x, y, self.max_points // 2)
+                step = int(x[2] - x[0]) if len(x) > 2 else n
+            waveforms.append({'ch' : ch, 'samples' : n, 'points' : len(y), 'step' : step, 'dtype' : y.dtype.str})
+            payload.append(y.tobytes())
+
+        header = {'type' : 'frame', 'time' : time.time(), 'status' : self.status(), 'waveforms' : waveforms}
+        return encode(header, b''.join(payload))
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            logging.exception(f"Monitor server failed: {e}")
+        finally:
+            # don't leave anyone waiting on a server that never started
+            self.listening.set()
+
+    async def serve(self):
+        self.loop     = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        self.listening.set()
+        logging.info(f"Monitor serving on {self.host}:{self.port}.")
+
+        async with server:
+            while not self.stopping.is_set():
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), timeout = 1 / self.fps)
+                except TimeoutError:
+                    pass
+                # one message shared by every client, only built if anyone is listening
+                if self.clients:
+                    message = self.snapshot()
+                    for client in self.clients:
+                        client.offer(message)
+
+            # clients are let go before the server closes, which waits on them
+            tasks = [client.task for client in self.clients]
+            for client in list(self.clients):
+                client.close()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        '''
+        Serve one client until it disconnects or the server stops.
+        '''
+        peer = writer.get_extra_info('peername')
+        client = Client(reader, writer)
+        client.offer(encode({'type' : 'hello', 'channels' : self.channels, 'fps' : self.fps}))
+        self.clients.add(client)
+        logging.info(f"Monitor client {peer} connected.")
+        try:
+            await client.send()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients.discard(client)
+            writer.close()
+            logging.info(f"Monitor client {peer} disconnected, {client.n_sent} messages sent, {client.n_dropped} dropped.")
+
+    def stop(self, timeout: float = 2):
+        if self.loop is not None and self.stopping is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+        self.join(timeout=timeout)
+
+
+class MonitorClient:
+    '''
+    Blocking client of a MonitorServer. The channels served and the server's frame
+    rate are read from its first message on connecting.
+    '''
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, timeout: Optional[float] = 5.0):
+        self.sock = socket.create_connection((host, port), timeout = timeout)
+        hello, _  = self.receive()
+        self.channels = hello['channels']
+        self.fps      = hello['fps']
+
+    def read_exactly(self, n: int) -> bytes:
+        buffer = bytearray(n)
+        view   = memoryview(buffer)
+        while view:
+            n_read = self.sock.recv_into(view)
+            if n_read == 0:
+                raise ConnectionError("Monitor server closed the connection.")
+            view = view[n_read:]
+        return bytes(buffer)
+
+    def receive(self) -> tuple:
+        '''
+        Next message, as (header, {ch : (x, y)}), x being the sample number of each point.
+        '''
+        header_len, payload_len = FRAME.unpack(self.read_exactly(FRAME.size))
+        header  = json.loads(self.read_exactly(header_len))
+        payload = self.read_exactly(payload_len)
+        # ready for the next
+        self.sock.sendall(b'\x01')
+
+        waveforms, offset = {}, 0
+        for wf in header.get('waveforms', []):
+            y = np.frombuffer(payload, dtype=wf['dtype'], count=wf['points'], offset=offset)
+            offset += y.nbytes
+            if wf['step'] == 1:
+                x = np.arange(wf['points'])
+            else:
+                x = np.repeat(np.arange(wf['points'] // 2) * wf['step'], 2)
+            waveforms[wf['ch']] = (x, y)
+        return header, waveforms
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,176 @@
+'''
+Writer with the h5 output running in a separate process, so that HDF5
+encoding and compression don't compete for the GIL with acquisition and the GUI.
+
+The feeder thread in the acquisition process gathers the buffered events
+straight into multiprocessing.shared_memory slabs, and only small
+((channel, table), wf_size, slab, rows) descriptors travel over the queue. Each
+descriptor is sent as soon as its block is filled, so the writer process appends
+it to the h5 file and hands the slab back while the next is gathered, however
+many channels there are. Slabs hold a whole ring of rows, the most one channel's
+block can hold. Feature blocks, a few bytes per event, and any block too large
+for a slab are sent whole in place of the slab.
+'''
+import time
+import logging
+import logging.handlers
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from queue import Queue, Empty
+from threading import Event
+import numpy as np
+
+import core.df_classes as df_class
+from core.writer import Writer, output_class
+
+
+def writer_main(ch_map      : dict,
+                rec_config  : dict,
+                dig_config  : dict | list,
+                TIMESTAMP   : str,
+                block_queue : mp.Queue,
+                free_slabs  : mp.Queue,
+                log_queue   : mp.Queue):
+    '''
+    Writer process, appends the blocks described on block_queue to the output file
+    until None is received.
+    '''
+    # log through the handlers of the acquisition process
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(logging.DEBUG)
+
+    logging.info("Writer process started.")
+    output = output_class(rec_config)(ch_map, rec_config, dig_config, TIMESTAMP)
+    slabs  = {}
+    try:
+        while (descriptor := block_queue.get()) is not None:
+            key, wf_size, name, rows = descriptor
+            if output.wf_size is None:
+                output.create_tables(wf_size)
+                rwf_dtype = df_class.return_rwf_dtype(output.dig_config['dig_gen'], wf_size)
+            # small blocks (features) are sent whole
+            if name is None:
+                output.write({key : rows})
+                continue
+            if name not in slabs:
+                slabs[name] = shared_memory.SharedMemory(name=name)
+
+            output.write({key : np.ndarray(rows, dtype=rwf_dtype, buffer=slabs[name].buf)})
+            free_slabs.put(name)
+
+    except Exception as e:
+        logging.exception(f"Fatal error in writer process: {e}")
+
+    output.close()
+    for slab in slabs.values():
+        slab.close()
+    logging.info("Writer process exited cleanly.")
+
+
+class ProcessWriter(Writer):
+    '''
+    Writer handing its blocks to a writer process through shared memory.
+    Keeps the Writer interface, so the controller starts and stops it identically.
+    '''
+    def __init__(self, *args, **kwargs):
+        self.slabs  = {}
+        self.slab   = None  # slab of the block being filled, None if it isn't in one
+        self.nbytes = 0     # bytes sent in the current flush
+        super().__init__(*args, **kwargs)
+
+    def open_output(self):
+        '''
+        Prepare the writer process, which opens the output file itself.
+        '''
+        # spawn rather than fork, the acquisition process runs threads and Qt
+        ctx = mp.get_context('spawn')
+        self.block_queue = ctx.Queue()
+        self.free_slabs  = ctx.Queue()
+        self.log_queue   = ctx.Queue()
+        self.log_listener = logging.handlers.QueueListener(self.log_queue, *logging.getLogger().handlers)
+        self.process = ctx.Process(target = writer_main,
+                                   args   = (self.ch_map, self.rec_config, self.dig_configs, self.TIMESTAMP,
+                                             self.block_queue, self.free_slabs, self.log_queue),
+                                   name   = 'CARP writer',
+                                   daemon = True)
+        return None
+
+    def start(self):
+        '''
+        Start the writer process alongside the feeder thread.
+        '''
+        self.log_listener.start()
+        self.process.start()
+        super().start()
+
+    def create_tables(self):
+        '''
+        Allocate shm_slabs shared memory slabs, each holding one channel's raw waveform
+        block in flight. The writer process creates the tables.
+        '''
+        if 'rwf' not in self.tables:
+            return
+        # the local buffer never holds more than a ring's slots of one ring, and gathers each ring separately
+        self.slab_rows = self.rec_config.get('ring_slots', 1024)
+        for _ in range(self.rec_config.get('shm_slabs', 8)):
+            slab = shared_memory.SharedMemory(create=True, size=self.slab_rows * self.rwf_dtype.itemsize)
+            self.slabs[slab.name] = slab
+            self.free_slabs.put(slab.name)
+
+    def slab_block(self, n_rows : int) -> np.ndarray:
+        '''
+        Block of n_rows held in a free slab. Waits for the writer process to hand
+        one back, so the feeder is throttled to the rate the disk sustains.
+        '''
+        if n_rows > self.slab_rows:
+            logging.warning(f"Block of {n_rows} rows larger than the shared memory slabs, sending it whole.")
+            self.slab = None
+            return np.empty(n_rows, dtype=self.rwf_dtype)
+        while True:
+            try:
+                name = self.free_slabs.get(timeout=1)
+                break
+            except Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError("Writer process is not running.")
+        self.slab = name
+        return np.ndarray(n_rows, dtype=self.rwf_dtype, buffer=self.slabs[name].buf)
+
+    def send_block(self, key : tuple, block : np.ndarray):
+        '''
+        Pass a filled block to the writer process, by its slab if it's in one.
+        '''
+        if key[1] == 'rwf' and self.slab is not None:
+            self.block_queue.put((key, self.wf_size, self.slab, len(block)))
+            self.slab = None
+        else:
+            self.block_queue.put((key, self.wf_size, None, block))
+        self.nbytes += block.nbytes
+
+    def write_h5(self):
+        '''
+        Gather the local buffer into slabs, passing each block to the writer process once filled.
+        '''
+        t_flush = time.perf_counter()
+        self.nbytes = 0
+        self.gather(alloc = self.slab_block, emit = self.send_block)
+        # measured up to the hand over, the write itself is in the other process
+        if self.tracker:
+            self.tracker.track_flush(time.perf_counter() - t_flush, len(self.read_times), self.nbytes)
+            self.tracker.track_latency('disk', time.perf_counter() - self.read_times)
+
+    def cleanup(self):
+        '''
+        Let the writer process write out what it has been sent, then release the slabs.
+        '''
+        self.block_queue.put(None)
+        self.process.join(timeout=10)
+        if self.process.is_alive():
+            logging.warning("Writer process did not stop cleanly, terminating.")
+            self.process.terminate()
+
+        for slab in self.slabs.values():
+            slab.close()
+            slab.unlink()
+        self.log_listener.stop()
@@ -0,0 +1,237 @@
+'''
+Preallocated ring of event record slots shared between the digitiser and
+its consumers (display and writer).
+
+The endpoint reads events straight into free slots, and only (ring, slots)
+references travel through the queues, slots being an array of consecutive
+slot indices read together. Each slot is reference counted, and is handed
+back to the digitiser once every consumer holding it has released it.
+
+Readouts the event builder has no room for while recording may be spilled
+to disk (SpillFile), freeing their slots, and copied back once it has.
+'''
+import logging
+import tempfile
+import numpy as np
+from threading import Lock
+from typing import Optional
+
+from felib.formats import NUMPY_TYPES
+
+
+class SlotField:
+    '''
+    Stand-in for caen_felib.device.Data pointing into one slot of the ring,
+    so that endpoint.read_data() writes directly into the ring.
+    '''
+    __slots__ = ('name', 'value', 'arg', 'iliffe')
+
+    def __init__(self, name: str, value: np.ndarray):
+        self.name  = name
+        self.value = value
+        if value.ndim < 2:
+            self.iliffe = None
+            self.arg    = value.ctypes
+        else:
+            # FeLib expects 2D fields as Iliffe vectors (an array of row pointers),
+            # kept here to prevent garbage collection
+            self.iliffe = np.fromiter((row.ctypes.data for row in value), dtype=np.uintp)
+            self.arg    = self.iliffe.ctypes
+
+
+class EventRing:
+    '''
+    Ring of n_slots event records, with one numpy array per field of the
+    data format, shaped (n_slots, *field_shape).
+
+    Slots are claimed in order by the producer and released by the consumers.
+    If the next slot is still in use the ring is full and claim() returns None,
+    leaving the data on the digitiser until a slot frees up.
+    '''
+
+    def __init__(self, data_format: list, n_slots: int, ch_mapping: dict, layout: dict, ch_offset: int = 0):
+        '''
+        data_format : FeLib data format (see felib/formats.py)
+        n_slots     : number of events held by the ring
+        ch_mapping  : enabled channels, as given by get_ch_mapping
+        layout      : field names of the firmware (see felib/formats.py)
+        ch_offset   : added to the digitiser's channel numbers, so that several boards don't share them
+        '''
+        self.n_slots   = n_slots
+        self.ch_list   = list(ch_mapping.keys())
+        self.ch_offset = ch_offset
+
+        # allocate once, everything after this is a view
+        self.fields = {}
+        for field in data_format:
+            shape = (n_slots, *field.get('shape', []))
+            self.fields[field['name']] = np.zeros(shape, dtype=NUMPY_TYPES[field['type']])
+
+        # read arguments for each slot, in data format order
+        self.slots = [tuple(SlotField(field['name'], self.slot_view(field['name'], slot)) for field in data_format)
+                      for slot in range(n_slots)]
+
+        self.timestamp     = self.fields[layout['timestamp']]
+        self.waveform      = self.fields[layout['waveform']]
+        self.waveform_size = self.fields[layout['waveform_size']]
+        self.channel       = self.fields[layout['channel']] if 'channel' in layout else None
+
+        # perf_counter time each slot was read out, for latency tracking
+        self.read_time = np.zeros(n_slots)
+        # ADC resolution of the board (bits), set once the digitiser is configured
+        self.adc_bits  = None
+
+        self.refs      = np.zeros(n_slots, dtype=np.int64)
+        self.head      = 0
+        self.n_used    = 0      # slots held by anyone
+        self.n_full    = 0      # claims refused due to a full ring
+        self.lock      = Lock()
+
+        nbytes = sum(arr.nbytes for arr in self.fields.values())
+        logging.info(f'Event ring allocated: {n_slots} slots, {nbytes / 1e6:.1f} MB.')
+
+    def slot_view(self, name: str, slot: int) -> np.ndarray:
+        '''
+        Writable view of one slot of a field. Scalar fields are returned as 0D arrays.
+        '''
+        arr = self.fields[name]
+        if arr.ndim == 1:
+            return arr[slot:slot+1].reshape(())
+        return arr[slot]
+
+    def claim(self, n: int = 1) -> Optional[np.ndarray]:
+        '''
+        Claim up to n consecutive free slots from the head, holding a single reference to each.
+        Claims don't wrap around the end of the ring, so each field of the claimed slots is one
+        contiguous (events, ...) block. Returns the slots, or None if the ring is full.
+        '''
+        with self.lock:
+            start = self.head
+            stop  = min(start + n, self.n_slots)
+            busy  = np.flatnonzero(self.refs[start:stop])
+            if len(busy):
+                stop = start + busy[0]
+            if stop == start:
+                self.n_full += 1
+                return None
+            self.refs[start:stop] = 1
+            self.head = stop % self.n_slots
+            self.n_used += stop - start
+            return np.arange(start, stop)
+
+    def unclaim(self, slots: np.ndarray):
+        '''
+        Hand back the unused tail of the latest claim, so the next claim starts from it.
+        Only valid for the single producer, before anything else is claimed.
+        '''
+        if len(slots) == 0:
+            return
+        with self.lock:
+            self.refs[slots] = 0
+            self.head = int(slots[0])
+            self.n_used -= len(slots)
+
+    def hold(self, slots, n: int = 1):
+        '''
+        Add n references to a slot or array of slots, for each extra consumer they're handed to.
+        '''
+        with self.lock:
+            self.refs[slots] += n
+
+    def release(self, slots, n: int = 1):
+        '''
+        Drop n references to a slot or array of slots, freeing them once none remain.
+        '''
+        with self.lock:
+            self.refs[slots] -= n
+            self.n_used -= np.count_nonzero(self.refs[slots] == 0)
+
+    def event(self, slot: int) -> list:
+        '''
+        Returns [(wf_size, ADCs, ch, timestamp), ...] for the channels held by a slot.
+        ADCs are views into the ring, only valid until the slot is released.
+        '''
+        timestamp = self.timestamp[slot]
+        # DPP-PSD holds one channel per event, SCOPE holds them all
+        if self.channel is not None:
+            return [(self.waveform_size[slot], self.waveform[slot], int(self.channel[slot]) + self.ch_offset, timestamp)]
+        return [(self.waveform_size[slot, ch], self.waveform[slot, ch], ch + self.ch_offset, timestamp) for ch in self.ch_list]
+
+    def split_channels(self, slots: np.ndarray):
+        '''
+        Yields (ch, index) for each channel held by the given slots, where index
+        selects the entries of slots that hold that channel.
+        '''
+        if self.channel is None:
+            every = np.arange(len(slots))
+            for ch in self.ch_list:
+                yield ch + self.ch_offset, every
+        else:
+            chs = self.channel[slots]
+            for ch in np.unique(chs):
+                yield int(ch) + self.ch_offset, np.flatnonzero(chs == ch)
+
+    def waveforms(self, slots: np.ndarray, ch: int) -> np.ndarray:
+        '''
+        Waveforms of a single channel for the given slots, copied into a (len(slots), samples) array.
+        '''
+        if self.channel is None:
+            return self.waveform[slots, ch - self.ch_offset]
+        return self.waveform[slots]
+
+
+class SpillFile:
+    '''
+    First in, first out store on disk of readouts taken out of a ring, holding every
+    field of their slots and their readout times. Readouts are copied back into free
+    slots of the ring in the order they were spilled.
+    '''
+
+    def __init__(self, ring: EventRing, directory: Optional[str] = None):
+        self.ring  = ring
+        self.dtype = np.dtype([(name, arr.dtype, arr.shape[1:]) for name, arr in ring.fields.items()]
+                              + [('read_time', np.float64)])
+        # removed by the OS once closed, even if the run ends abruptly
+        self.file  = tempfile.TemporaryFile(dir=directory)
+        self.head  = 0      # records read back
+        self.tail  = 0      # records written
+
+    def __len__(self) -> int:
+        return self.tail - self.head
+
+    def write(self, slots: np.ndarray):
+        '''
+        Append the readouts held by slots, which may then be released.
+        '''
+        records = np.empty(len(slots), dtype=self.dtype)
+        for name, arr in self.ring.fields.items():
+            records[name] = arr[slots]
+        records['read_time'] = self.ring.read_time[slots]
+        self.file.seek(self.tail * self.dtype.itemsize)
+        self.file.write(records.tobytes())
+        self.tail += len(slots)
+
+    def read(self, n: int) -> Optional[np.ndarray]:
+        '''
+        Copy up to n of the oldest readouts back into newly claimed slots of the ring,
+        returning the slots, or None if the ring is full.
+        '''
+        slots = self.ring.claim(min(n, len(self)))
+        if slots is None:
+            return None
+        records = np.empty(len(slots), dtype=self.dtype)
+        self.file.seek(self.head * self.dtype.itemsize)
+        self.file.readinto(records)
+        for name, arr in self.ring.fields.items():
+            arr[slots] = records[name]
+        self.ring.read_time[slots] = records['read_time']
+
+        self.head += len(slots)
+        # start over once emptied, so the file only grows as far as the deepest backlog
+        if self.head == self.tail:
+            self.head = self.tail = 0
+            self.file.truncate(0)
+        return slots
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,104 @@
+'''
+Software zero suppression, keeping only the waveforms of channels that fired.
+
+A waveform fired if, flipped to be positive for a negative polarity channel,
+it rises more than the channel's `threshold` (ADCs) above its baseline, the
+mean of the pre-trigger samples. Waveforms that didn't are dropped from the
+recording in 'drop' mode, or written as zeros in 'truncate' mode, keeping a
+row per event on every channel that compresses away to almost nothing.
+Channels set with 'zero_suppress' : False are always kept.
+
+Decisions are made a block of ring slots at a time, before the block is
+handed to the writer, and the waveforms suppressed are counted per channel.
+'''
+import logging
+import numpy as np
+from threading import Lock
+
+
+MODES = ('drop', 'truncate')
+
+
+class ZeroSuppressor:
+    '''
+    Zero suppression of the channels of rec_config, in rec_config['zero_suppression'] mode.
+    '''
+    def __init__(self, rec_config: dict):
+        self.mode = rec_config['zero_suppression']
+        if self.mode not in MODES:
+            raise ValueError(f"zero_suppression must be one of {MODES} or None, not {self.mode!r}.")
+        self.record_length = rec_config['record_length']
+        self.pre_trigger   = rec_config['pre_trigger']
+
+        # settings by channel number on the digitiser
+        channels = {int(key[2:]) : value for key, value in rec_config.items()
+                    if key.startswith('ch') and key[2:].isdigit() and isinstance(value, dict)}
+        n_ch = max(channels, default=-1) + 1
+        self.threshold = np.zeros(n_ch)
+        self.negative  = np.zeros(n_ch, dtype=bool)
+        self.active    = np.zeros(n_ch, dtype=bool)
+        for ch, settings in channels.items():
+            self.threshold[ch] = settings.get('threshold', 0)
+            self.negative[ch]  = settings.get('polarity') == 'negative'
+            self.active[ch]    = settings.get('enabled', False) and settings.get('zero_suppress', True)
+
+        # waveforms seen and suppressed, and the bytes they held, by channel
+        self.n_seen       = {}
+        self.n_suppressed = {}
+        self.bytes_suppressed = 0
+        self.lock = Lock()
+        logging.info(f"Zero suppression ({self.mode}) on channels {np.flatnonzero(self.active).tolist()}.")
+
+    def keep(self, ring, slots: np.ndarray) -> np.ndarray:
+        '''
+        Which waveforms of the slots to record, as a (len(slots), channels) mask with a column
+        per channel of ring.ch_list for SCOPE rings, and a single column for DPP-PSD rings.
+        '''
+        wf_size = int(ring.event(slots[0])[0][0])
+        if ring.channel is None:
+            chs = np.array(ring.ch_list)
+            wfs = ring.waveform[slots[:, None], chs, :wf_size]
+            chs = np.broadcast_to(chs, (len(slots), len(chs)))
+        else:
+            chs = ring.channel[slots].astype(np.int64)[:, None]
+            wfs = ring.waveform[slots, :wf_size][:, None, :]
+
+        n_baseline = min(max(int(self.pre_trigger * wf_size / self.record_length), 1), wf_size)
+        baseline   = wfs[..., :n_baseline].mean(axis=-1)
+        # height of the pulse above the baseline, whatever the polarity
+        height = np.where(self.negative[chs], baseline - wfs.min(axis=-1), wfs.max(axis=-1) - baseline)
+        keep   = (height > self.threshold[chs]) | ~self.active[chs]
+
+        self.count(chs + ring.ch_offset, keep, wfs.itemsize * wf_size)
+        return keep
+
+    def count(self, chs: np.ndarray, keep: np.ndarray, wf_bytes: int):
+        '''
+        Add the waveforms seen and suppressed of each channel.
+        '''
+        seen       = np.bincount(chs.ravel())
+        suppressed = np.bincount(chs.ravel(), weights=~keep.ravel(), minlength=len(seen))
+        with self.lock:
+            for ch in np.flatnonzero(seen):
+                self.n_seen[ch]       = self.n_seen.get(ch, 0) + int(seen[ch])
+                self.n_suppressed[ch] = self.n_suppressed.get(ch, 0) + int(suppressed[ch])
+            self.bytes_suppressed += int(suppressed.sum()) * wf_bytes
+
+    def stats(self) -> dict:
+        '''
+        Waveforms seen and suppressed over the run, in total and the suppressed fraction by channel.
+        '''
+        with self.lock:
+            seen       = sum(self.n_seen.values())
+            suppressed = sum(self.n_suppressed.values())
+            return {'mode'          : self.mode,
+                    'waveforms'     : seen,
+                    'suppressed'    : suppressed,
+                    'MB_suppressed' : self.bytes_suppressed / 1e6,
+                    'fraction'      : {int(ch) : self.n_suppressed[ch] / n for ch, n in sorted(self.n_seen.items())}}
+
+    def log_stats(self):
+        stats = self.stats()
+        fractions = ', '.join(f'ch_{ch} {100 * f:.1f}%' for ch, f in stats['fraction'].items())
+        logging.info(f"Zero suppression: {stats['suppressed']} of {stats['waveforms']} waveforms suppressed "
+                     f"({stats['MB_suppressed']:.1f} MB), {fractions}.")
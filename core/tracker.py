@@ -1,33 +1,120 @@
 import logging
 import time
 from threading import Lock
+from typing import Optional
+
+from core.metrics import Registry, LatencyHistogram
+
 
 class Tracker:
     '''
     Tracking class that keeps track of:
         - number of collected events
         - speed at which data is being collected
+        - writer CPU usage, idle time, flush time and bytes written
+        - latency from readout to each stage (display, disk)
+        - progress of runs without a display
+        - the last measured rates, for remote monitoring
+
+    Everything is held in the metrics registry (see core/metrics.py), shared
+    with the rest of the acquisition and exported from there.
     '''
 
-    def __init__(self):
+    def __init__(self, metrics: Optional[Registry] = None):
+        self.metrics    = metrics if metrics is not None else Registry()
         self.start_time = time.perf_counter()
-        self.bytes_ps   = 0
-        self.events_ps  = 0
         self.last_time  = self.start_time
         self.lock       = Lock()
 
+        self.events_displayed = self.metrics.counter('events_displayed_total', 'Channel waveforms handed to the display.')
+        self.bytes_displayed  = self.metrics.counter('bytes_displayed_total', 'Bytes of waveforms handed to the display.')
+        self.events_written   = self.metrics.counter('events_written_total', 'Events handed to the output.')
+        self.bytes_written    = self.metrics.counter('bytes_written_total', 'Bytes of rows handed to the output.')
+        self.event_rate       = self.metrics.gauge('event_rate', 'Channel waveforms displayed per second, over the last whole second.')
+        self.MB_rate          = self.metrics.gauge('MB_rate', 'MB of waveforms displayed per second, over the last whole second.')
+        self.writer_cpu       = self.metrics.gauge('writer_cpu_percent', 'Writer CPU use, % of one core.')
+        self.writer_idle      = self.metrics.gauge('writer_idle_percent', '% of wall time the writer spent waiting for data.')
+        self.flush_latency    = self.metrics.latency('writer_flush_seconds', 'Time to write one flush of the writer buffer (s).')
+
+        # counts at the last rate report
+        self.last_events = 0
+        self.last_bytes  = 0
+
+        # readout to stage latencies, over the whole run
+        self.latency = {stage : self.metrics.latency(f'{stage}_latency_seconds', f'Readout to {stage} latency (s).')
+                        for stage in ('display', 'disk')}
+
     def track(self, nbytes: int = 0):
         '''
-        Tracker outputting the number of events that arrive per second
+        Count a waveform of nbytes reaching the display, logging the rates once per second.
+        Takes no lock, other than for the report.
+        '''
+        self.events_displayed.add(1)
+        self.bytes_displayed.add(nbytes)
+
+        t_check = time.perf_counter()
+        if t_check - self.last_time >= 1.0:
+            self.report_rates(t_check)
+
+    def report_rates(self, t_check: float):
+        '''
+        Log the events and data displayed since the last report, setting the rate gauges.
+        '''
+        with self.lock:
+            if t_check - self.last_time < 1.0:
+                return
+            events, nbytes = self.events_displayed.value, self.bytes_displayed.value
+            events_ps = events - self.last_events
+            MB = (nbytes - self.last_bytes) / 1000000
+            logging.info(f'|| {events_ps} events/sec || {MB:.2f} MB/sec ||')
+            self.event_rate.set(events_ps)
+            self.MB_rate.set(MB)
+            self.last_time, self.last_events, self.last_bytes = t_check, events, nbytes
+
+    def track_writer(self, cpu_time: float, idle_time: float, wall_time: float):
+        '''
+        Writer load over the last wall_time seconds, given the CPU time the writer
+        thread used and the time it spent blocked waiting on the write buffer.
+        '''
+        self.writer_cpu.set(100 * cpu_time / wall_time)
+        self.writer_idle.set(100 * idle_time / wall_time)
+        logging.info(f'|| writer CPU {self.writer_cpu.value:.1f}% || writer idle {self.writer_idle.value:.1f}% ||')
+
+    def track_flush(self, flush_time: float, n_events: int, nbytes: int):
+        '''
+        Record a writer flush of n_events events and nbytes bytes, taking flush_time (s).
+        '''
+        with self.lock:
+            self.flush_latency.add(flush_time)
+        self.events_written.add(n_events)
+        self.bytes_written.add(nbytes)
+
+    def track_latency(self, stage: str, latency):
+        '''
+        Record the latency (s) from readout to stage, for one event or an array of them.
+        '''
+        with self.lock:
+            self.latency[stage].add(latency)
+
+    def log_progress(self, elapsed: float, n_built: int):
+        '''
+        Log the time elapsed (s), events built and events written so far, for runs without a display.
+        '''
+        logging.info(f'|| {elapsed:.0f} s || {n_built} events built || {self.events_written.value} events written ||')
+
+    def rates(self) -> dict:
+        '''
+        Last measured event and data rates, writer load and events written so far.
+        '''
+        return {'events_ps'      : self.event_rate.value,
+                'MB_ps'          : self.MB_rate.value,
+                'writer_cpu'     : self.writer_cpu.value,
+                'writer_idle'    : self.writer_idle.value,
+                'events_written' : self.events_written.value}
+
+    def latency_summary(self) -> dict:
+        '''
+        Count and p50/p99/max latency (s) of each stage.
         '''
         with self.lock:
-            self.events_ps += 1
-            self.bytes_ps += nbytes
-
-            t_check = time.perf_counter()
-            if t_check - self.last_time >= 1.0:
-                MB = self.bytes_ps / 1000000
-                logging.info(f'|| {self.events_ps} events/sec || {MB:.2f} MB/sec ||')
-                self.last_time = t_check
-                self.bytes_ps = 0
-                self.events_ps = 0
+            return {stage : hist.summary() for stage, hist in self.latency.items()}
@@ -1,10 +1,56 @@
-from queue import Queue, Empty
+from queue import Queue, Empty, Full
 from threading import Thread, Event, Lock
 import logging
 import time
+from typing import Optional
 from core.commands import CommandType, Command
 from felib.digitiser import Digitiser
 from core.io import read_config_file
+from core.metrics import Registry
+from core.ring import SpillFile
+
+
+class Poller:
+    '''
+    Poll policy for the readout loop, applied only when the digitiser returns no data.
+    Supported policies:
+        - busy     : poll again immediately
+        - adaptive : exponential backoff from min_wait up to max_wait, reset on data
+        - sleep    : fixed sleep of sleep_time (the old software_timeout behaviour)
+    '''
+
+    policies = ('busy', 'adaptive', 'sleep')
+
+    def __init__(self, policy: str = 'adaptive', sleep_time: float = 0, min_wait: float = 1e-5, max_wait: float = 1e-3):
+        if policy not in self.policies:
+            logging.warning(f"Unknown poll policy '{policy}', falling back to 'adaptive'.")
+            policy = 'adaptive'
+        self.policy     = policy
+        self.sleep_time = sleep_time
+        self.min_wait   = min_wait
+        self.max_wait   = max_wait
+        self.wait_time  = min_wait
+
+    def reset(self):
+        '''
+        Data arrived, so the next empty poll starts backing off from scratch.
+        '''
+        self.wait_time = self.min_wait
+
+    def idle(self):
+        '''
+        Wait according to the poll policy after an empty poll.
+        '''
+        match self.policy:
+            case 'busy':
+                return
+            case 'adaptive':
+                time.sleep(self.wait_time)
+                self.wait_time = min(2 * self.wait_time, self.max_wait)
+            case 'sleep':
+                if self.sleep_time > 0:
+                    time.sleep(self.sleep_time)
+
 
 class AcquisitionWorker(Thread):
     '''
@@ -12,9 +58,28 @@ class AcquisitionWorker(Thread):
 
     This class is designed to be thread-safe and independent from Qt threading.
     All commands and data flow through thread-safe mechanisms (queue, locks, events).
+
+    Readouts are handed to the event builder through display_buffer, which feeds both
+    the display and the writer. If it's full while only the display needs the readouts,
+    the oldest is discarded. While recording, the backpressure policy applies instead, as
+    soon as it's full or more than high_water (a fraction) of the ring's slots are held
+    downstream, before the digitiser is left without slots to read into:
+        - block : wait for room, leaving further data on the digitiser, whose own buffer fills next
+        - spill : write readouts to a file in spill_dir, freeing their ring slots, and
+                  feed them back in order once there's room
+        - alert : discard the oldest readout, warning of the loss (at most once per second)
     '''
 
-    def __init__(self, cmd_buffer: Queue, display_buffer: Queue, stop_event: Event, sw_timeout: float):
+    # maximum time spent blocked on the command buffer while not acquiring (s)
+    idle_timeout = 0.1
+    backpressure_policies = ('block', 'spill', 'alert')
+    # most spilled readouts fed back at once
+    spill_batch = 64
+
+    def __init__(self, cmd_buffer: Queue, display_buffer: Queue, stop_event: Event, sw_timeout: float,
+                 poll_policy: str = 'adaptive', poll_max_wait: float = 1e-3, ch_offset: int = 0,
+                 metrics: Optional[Registry] = None, recording: Optional[Event] = None,
+                 backpressure: str = 'block', high_water: float = 0.9, spill_dir: Optional[str] = None):
         super().__init__(daemon=True)
         self.digitiser = None
         self.stop_event = stop_event
@@ -25,6 +90,26 @@ class AcquisitionWorker(Thread):
         self.dig_config = None
         self.rec_config = None
         self.sw_timeout = sw_timeout     # set in config file (s)
+        self.poller     = Poller(poll_policy, sleep_time = sw_timeout, max_wait = poll_max_wait)
+        self.ch_offset  = ch_offset      # default channel offset of the board, see Digitiser
+
+        if backpressure not in self.backpressure_policies:
+            logging.warning(f"Unknown backpressure policy '{backpressure}', falling back to 'block'.")
+            backpressure = 'block'
+        self.backpressure = backpressure
+        self.recording    = recording if recording is not None else Event()   # set while recording
+        self.high_water   = high_water
+        self.spill_dir    = spill_dir
+        self.spills       = {}   # ring -> SpillFile of readouts waiting for room, oldest first
+        self.t_warned     = 0    # last high-water warning
+
+        # counted in the registry shared by every board, if given
+        metrics = metrics if metrics is not None else Registry()
+        self.n_read     = metrics.counter('events_read_total', 'Channel readouts taken from the digitiser(s).')
+        self.n_dropped  = metrics.counter('display_dropped_total', 'Readouts discarded while not recording, as the display fell behind.')
+        self.n_lost     = metrics.counter('record_dropped_total', "Readouts discarded while recording, by the 'alert' backpressure policy or as the writer had stopped.")
+        self.n_spilled  = metrics.counter('events_spilled_total', "Readouts spilled to disk while recording, by the 'spill' backpressure policy.")
+        self.t_blocked  = metrics.counter('acquisition_blocked_seconds_total', "Time readout waited for room, by the 'block' backpressure policy (s).")
 
     def enqueue_cmd(self, cmd_type: CommandType, *args):
         '''
@@ -90,6 +175,7 @@ class AcquisitionWorker(Thread):
         if dig_dict is None:
             logging.error("Digitiser configuration file not found or invalid.")
             return
+        dig_dict.setdefault('ch_offset', self.ch_offset)
 
         self.digitiser = Digitiser(dig_dict)
         self.digitiser.connect()
@@ -101,58 +187,183 @@ class AcquisitionWorker(Thread):
             if (self.digitiser is not None) and self.digitiser.isConnected:
                 self.digitiser.configure(dig_dict, rec_dict)
 
+    def handle_commands(self):
+        '''
+        Drain the command buffer without blocking.
+        '''
+        while True:
+            try:
+                cmd = self.cmd_buffer.get_nowait()
+            except Empty:   # exit cmd loop if cmd buffer is empty
+                break
+            self.handle_command(cmd)
+
     def run(self):
         '''
         Data acquisition hot loop. Hot loop runs until stop_event is set either manually
         or via the EXIT command.
+
+        While acquiring, the only blocking wait is endpoint.has_data inside digitiser.acquire(),
+        commands are polled without blocking and empty polls are handled by the poll policy.
+        While idle, the loop blocks on the command buffer so that commands wake it immediately.
         '''
         logging.info("AcquisitionWorker thread started.")
         try:
             while not self.stop_event.is_set():
                 # Handle commands
-                while True:
-                    try:
-                        cmd = self.cmd_buffer.get(timeout=0.01)
-                        self.handle_command(cmd)
-                    except Empty:   # exit cmd loop if cmd buffer is empty
-                        break
+                self.handle_commands()
+
+                # spilled readouts go back in as soon as there's room, acquiring or not
+                if self.spills:
+                    self.unspill()
 
-                # Acquire data if running
-                if self.digitiser and self.digitiser.isAcquiring:
+                # Nothing to read, wait for the next command instead
+                if not (self.digitiser and self.digitiser.isAcquiring):
                     try:
-                        data = self.digitiser.acquire()
-                        if data is None:
-                            continue
-                        # extract each channel separately and push to buffers
-                        for channel_data in data:
-                            # Non-blocking put to visual buffer
-                            if self.display_buffer.full():
-                                try:
-                                    self.display_buffer.get_nowait()  # discard oldest
-                                except Empty:
-                                    pass
-
-                            # Push to display buffer (etc.)
-                            if not self.display_buffer.full():
-                                self.display_buffer.put_nowait(channel_data)
-
-                            # Notify controller/UI
-                            if self.data_ready_callback:
-                                self.data_ready_callback()
-
-                    except Exception as e:
-                        logging.exception(f"Acquisition error: {e}")
-
-                # to avoid busy digitiser - add software timeout as member variable
-                time.sleep(self.sw_timeout)
+                        self.handle_command(self.cmd_buffer.get(timeout=self.idle_timeout))
+                    except Empty:
+                        pass
+                    continue
+
+                # Acquire data
+                try:
+                    data = self.digitiser.acquire()
+                    if data is None:
+                        self.poller.idle()
+                        continue
+                    self.poller.reset()
+                    # push (ring, slots) references to the display buffer, the data stays in the ring
+                    for event in data:
+                        self.n_read.add(len(event[1]))
+                        self.put_readout(*event)
+
+                        # Notify controller/UI
+                        if self.data_ready_callback:
+                            self.data_ready_callback()
+
+                except Exception as e:
+                    logging.exception(f"Acquisition error: {e}")
 
         except Exception as e:
             logging.exception(f"Fatal error in AcquisitionWorker: {e}")
 
+        # the event builder is still running, so whatever was spilled can still be recorded
+        self.drain_spills()
+
         # when stop_event() is set, call destructor of digitiser inside cleanup()
         self.cleanup()
         logging.info("AcquisitionWorker thread exited cleanly.")
 
+    def put_readout(self, ring, slots):
+        '''
+        Hand a readout to the event builder, its slot references passing with it. Past the high-water
+        mark the oldest readout is discarded, unless recording, when the backpressure policy applies.
+        '''
+        # once spilling, every readout is spilled until the backlog is fed back, keeping them in order
+        spill = self.spills.get(ring)
+        if spill is not None and len(spill):
+            self.spill(ring, slots)
+            return
+
+        if not self.recording.is_set():
+            if self.display_buffer.full():
+                self.drop_oldest(self.n_dropped)
+        elif self.past_high_water(ring):
+            if self.backpressure == 'block':
+                self.warn_high_water('blocking readout')
+                self.wait_for_room(ring)
+            elif self.backpressure == 'spill':
+                self.warn_high_water('spilling to disk')
+                self.spill(ring, slots)
+                return
+            else:
+                self.drop_oldest(self.n_lost)
+                self.warn_high_water(f'{self.n_lost.value} readouts lost so far')
+
+        try:
+            self.display_buffer.put_nowait((ring, slots))
+        except Full:
+            ring.release(slots)
+            (self.n_lost if self.recording.is_set() else self.n_dropped).add(len(slots))
+
+    def drop_oldest(self, counter):
+        '''
+        Discard the oldest readout waiting for the event builder, counting it with counter.
+        '''
+        try:
+            ring, slots = self.display_buffer.get_nowait()
+            ring.release(slots)
+            counter.add(len(slots))
+        except Empty:
+            pass
+
+    def past_high_water(self, ring) -> bool:
+        '''
+        Whether the display buffer is full, or more than high_water of the ring's slots are in use.
+        '''
+        return ring.n_used > self.high_water * ring.n_slots or self.display_buffer.full()
+
+    def wait_for_room(self, ring):
+        '''
+        Block until the ring and display buffer are back under their high-water mark, or the worker is stopped.
+        '''
+        t_start = time.perf_counter()
+        while self.past_high_water(ring) and not self.stop_event.wait(timeout=self.poller.min_wait):
+            pass
+        self.t_blocked.add(time.perf_counter() - t_start)
+
+    def spill(self, ring, slots):
+        '''
+        Write a readout to the spill file of its ring and release its slots.
+        '''
+        if ring not in self.spills:
+            self.spills[ring] = SpillFile(ring, self.spill_dir)
+        self.spills[ring].write(slots)
+        ring.release(slots)
+        self.n_spilled.add(len(slots))
+
+    def unspill(self):
+        '''
+        Feed spilled readouts back to the event builder, oldest first, while it has room.
+        '''
+        for ring, spill in self.spills.items():
+            while len(spill) and not self.past_high_water(ring):
+                slots = spill.read(self.spill_batch)
+                if slots is None:
+                    break
+                # only ever waits if another board's worker took the room first
+                self.display_buffer.put((ring, slots))
+
+    def drain_spills(self, timeout: float = 5):
+        '''
+        Feed every spilled readout back before exiting, waiting up to timeout (s) for room.
+        '''
+        t_end = time.perf_counter() + timeout
+        while any(len(spill) for spill in self.spills.values()) and time.perf_counter() < t_end:
+            self.unspill()
+            time.sleep(1e-3)
+        for spill in self.spills.values():
+            if len(spill):
+                logging.warning(f"{len(spill)} spilled readouts couldn't be fed back, and are lost.")
+                self.n_lost.add(len(spill))
+            spill.close()
+        self.spills.clear()
+
+    def spilled(self) -> int:
+        '''
+        Readouts waiting in the spill files.
+        '''
+        return sum(len(spill) for spill in list(self.spills.values()))
+
+    def warn_high_water(self, action: str):
+        '''
+        Warn, at most once per second, that readouts are backing up past the high-water mark while recording.
+        '''
+        t_check = time.perf_counter()
+        if t_check - self.t_warned >= 1.0:
+            logging.warning(f"Event builder falling behind readout while recording, {action}.")
+            self.t_warned = t_check
+
     def cleanup(self):
         '''
         Cleans up digitiser by calling stop_acquisition and its destructor.
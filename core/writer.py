@@ -1,27 +1,368 @@
 from queue import Queue, Empty
 from threading import Thread, Event, Lock
+import os
+import json
 import logging
+import time
+import numpy as np
 import tables as tb
+from typing import Optional
 
 import core.df_classes as df_class
 import core.io as io
+from core.finaliser import Finaliser, HDF5_LOCK
+from core.tracker import Tracker
+from core.features import FeatureExtractor, feature_dtype
+
+# rows per chunk of the feature tables, PyTables would size them for the whole run
+FEATURE_CHUNK = 4096
+
+# bytes of the .npy header of the raw output files, fixed so the row count can be rewritten in place
+NPY_HEADER = 4096
+# buffers per os.writev call
+IOV_MAX    = os.sysconf('SC_IOV_MAX') if hasattr(os, 'sysconf') else 1024
+
+
+def output_tables(rec_config : dict) -> tuple:
+    '''
+    Tables written per channel: 'rwf' for the raw waveforms, unless store_waveforms
+    is False, and 'features' if feature extraction is set.
+    '''
+    tables = []
+    if rec_config.get('store_waveforms', True):
+        tables.append('rwf')
+    if rec_config.get('features') is not None:
+        tables.append('features')
+    if not tables:
+        logging.warning('store_waveforms is False without features set, storing the raw waveforms.')
+        tables.append('rwf')
+    return tuple(tables)
+
+
+class Output:
+    '''
+    Output files of a run, the interface of the output backends chosen by output_format
+    (see OUTPUTS): create_tables once the waveform size is known, write blocks of rows
+    keyed by (channel, table), and close.
+
+    With rollover_mb or rollover_events set, a new file is started once the current one
+    reaches that size or number of events. Finished files are handed to a Finaliser, which
+    closes, optionally repacks and checksums them in the background.
+    '''
+    def __init__(self,
+                 ch_map     : dict,
+                 rec_config : dict,
+                 dig_config : dict | list,
+                 TIMESTAMP  : str,
+                 file_stem  : Optional[str] = None):
+        '''
+        file_stem, if given, replaces the file name built from file_name and TIMESTAMP.
+        '''
+        self.ch_map     = ch_map
+        self.rec_config = rec_config
+        self.TIMESTAMP  = TIMESTAMP
+        # one config per digitiser, the first sets the table format
+        self.dig_configs = dig_config if isinstance(dig_config, list) else [dig_config]
+        self.dig_config  = self.dig_configs[0]
+        self.wf_size    = None
+        self.tables     = output_tables(self.rec_config)
+        # the table counted for rollover, with a row per event
+        self.row_table  = self.tables[0]
+
+        # file rollover
+        self.rollover_mb     = self.rec_config.get('rollover_mb', None)
+        self.rollover_events = self.rec_config.get('rollover_events', None)
+        self.rollover        = (self.rollover_mb is not None) or (self.rollover_events is not None)
+        self.file_index      = 0
+
+        if file_stem is not None:
+            self.file_stem = file_stem
+        elif 'file_name' in self.rec_config:
+            file_path = self.rec_config['file_name']
+            self.file_stem = f'{file_path}_data_{TIMESTAMP}'
+        else:
+            self.file_stem = f'data_{TIMESTAMP}'
+
+        self.finaliser = Finaliser(repack   = self.rec_config.get('repack', False),
+                                   checksum = self.rec_config.get('checksum', True))
+        self.finaliser.start()
+
+        self.open_file()
+
+    def file_base(self) -> str:
+        '''
+        Path of the current file without its extension, numbered when rolling over.
+        '''
+        if self.rollover:
+            return f'{self.file_stem}_{self.file_index:04d}'
+        return self.file_stem
+
+    def rollover_due(self) -> bool:
+        if self.rollover_events is not None and max(self.n_rows.values()) >= self.rollover_events:
+            return True
+        if self.rollover_mb is not None and self.file_size() >= self.rollover_mb * 1e6:
+            return True
+        return False
+
+    def roll_over(self):
+        '''
+        Hand the current file to the finaliser and carry on in the next one.
+        '''
+        logging.info(f'Rolling over from output file {self.file_base()}.')
+        self.finalise()
+        self.file_index += 1
+        self.open_file()
+
+    def close(self):
+        '''
+        Finalise the current file, waiting for the finaliser to finish.
+        '''
+        self.finalise()
+        self.finaliser.stop()
+
+
+class H5Output(Output):
+    '''
+    HDF5 output file, holding the configs and per channel the raw waveform table
+    and/or the feature table (see output_tables).
+    '''
+    def __init__(self,
+                 ch_map     : dict,
+                 rec_config : dict,
+                 dig_config : dict | list,
+                 TIMESTAMP  : str,
+                 file_stem  : Optional[str] = None):
+        # compression and chunking of the raw waveform tables
+        self.filters       = io.get_filters(rec_config)
+        self.chunk_events  = rec_config.get('chunk_events', None)
+        self.expected_rows = rec_config.get('expected_rows', 10000)
+        super().__init__(ch_map, rec_config, dig_config, TIMESTAMP, file_stem)
+
+    def file_path(self) -> str:
+        return f'{self.file_base()}.h5'
+
+    def open_file(self):
+        '''
+        Open a new output file with the configs written, and the raw waveform tables if the size is known.
+        '''
+        file_path = self.file_path()
+        with HDF5_LOCK:
+            # initialise the h5, one per channel, each handled on a separate thread
+            try:
+                self.h5file = tb.open_file(f'{file_path}', mode='a')
+            except FileNotFoundError as e:
+                logging.error(f'FileNotFoundError: Cannot create output file at path {file_path}')
+                exit()
+            # configs written
+            io.create_config_table(self.h5file, self.rec_config, 'rec_conf', 'recording config')
+            io.create_config_table(self.h5file, self.dig_config, 'dig_conf', 'digitiser config')
+            for i, dig_config in enumerate(self.dig_configs[1:], start=1):
+                io.create_config_table(self.h5file, dig_config, f'dig_conf_{i}', f'digitiser {i} config')
+            # raw waveform group constructed
+            self.rwf_group = {}
+            for ch in self.ch_map.keys():
+                self.rwf_group[ch] = self.h5file.create_group('/', f'ch_{ch}', 'raw waveform')
+            self.rwf_table     = {}
+            self.feature_table = {}
+            self.n_rows    = dict.fromkeys(self.ch_map.keys(), 0)
+
+        if self.wf_size is not None:
+            self.create_tables(self.wf_size)
+
+    def create_tables(self, wf_size):
+        '''
+        Create the tables of every channel, once the waveform size is known.
+        '''
+        self.wf_size   = int(wf_size)
+        self.rwf_class = df_class.return_rwf_class(self.dig_config['dig_gen'], self.wf_size)
+        chunkshape     = None if self.chunk_events is None else (self.chunk_events,)
+        with HDF5_LOCK:
+            for ch in self.ch_map.keys():
+                if 'rwf' in self.tables:
+                    self.rwf_table[ch] = self.h5file.create_table(self.rwf_group[ch], 'rwf', self.rwf_class, "raw waveforms",
+                                                                  filters      = self.filters,
+                                                                  chunkshape   = chunkshape,
+                                                                  expectedrows = self.expected_rows)
+                if 'features' in self.tables:
+                    n_gates = len(self.rec_config['features']['gates'])
+                    self.feature_table[ch] = self.h5file.create_table(self.rwf_group[ch], 'features', feature_dtype(n_gates),
+                                                                      "waveform features",
+                                                                      filters      = self.filters,
+                                                                      chunkshape   = (FEATURE_CHUNK,),
+                                                                      expectedrows = self.expected_rows)
+
+    def write(self, blocks : dict):
+        '''
+        Append a block of rows to each channel's tables and flush, rolling over if due.
+        Blocks are keyed by (channel, table), table being 'rwf' or 'features'.
+        '''
+        with HDF5_LOCK:
+            for (ch, table), block in blocks.items():
+                self.table(ch, table).append(block)
+                if table == self.row_table:
+                    self.n_rows[ch] += len(block)
+
+            # flush as fast as the buffer provides
+            for ch, table in blocks.keys():
+                self.table(ch, table).flush()
+
+            rollover_due = self.rollover_due()
+
+        if rollover_due:
+            self.roll_over()
+
+    def table(self, ch, table : str) -> tb.Table:
+        return self.rwf_table[ch] if table == 'rwf' else self.feature_table[ch]
+
+    def file_size(self) -> int:
+        return self.h5file.get_filesize()
+
+    def finalise(self):
+        self.finaliser.put(self.h5file)
+
+
+class RawOutput(Output):
+    '''
+    Raw binary output, for burst capture beyond what HDF5 sustains. Each table is an
+    append-only stream of fixed-size rows with the dtype of its HDF5 table, <file>.rwf.npy
+    and <file>.features.npy, alongside <file>.json holding the configs. Every write is a
+    single os.writev of the channel blocks per table, uncompressed.
+
+    The files are .npy files, readable with np.load(path, mmap_mode='r'). The row count
+    in their header is rewritten in place after every write, so they stay readable if
+    the run ends abruptly. core/convert.py converts them to the HDF5 layout.
+    '''
+    def file_path(self, table : str) -> str:
+        return f'{self.file_base()}.{table}.npy'
+
+    def open_file(self):
+        '''
+        Start a new set of files with the configs written, and the table files if the size is known.
+        '''
+        self.files   = {}
+        self.dtypes  = {}
+        self.rows    = {}
+        self.n_bytes = 0
+        self.n_rows  = dict.fromkeys(self.ch_map.keys(), 0)
+        self.write_meta()
+
+        if self.wf_size is not None:
+            self.create_tables(self.wf_size)
+
+    def write_meta(self):
+        '''
+        Write <file>.json, everything the converter needs besides the rows.
+        '''
+        meta = {'TIMESTAMP'   : self.TIMESTAMP,
+                'channels'    : list(self.ch_map.keys()),
+                'tables'      : list(self.tables),
+                'wf_size'     : self.wf_size,
+                'rec_config'  : self.rec_config,
+                'dig_configs' : self.dig_configs}
+        with open(f'{self.file_base()}.json', 'w') as f:
+            json.dump(meta, f, indent=4, default=str)
+
+    def create_tables(self, wf_size):
+        '''
+        Open the table files, once the waveform size is known.
+        '''
+        self.wf_size = int(wf_size)
+        self.write_meta()
+        for table in self.tables:
+            if table == 'rwf':
+                dtype = df_class.return_rwf_dtype(self.dig_config['dig_gen'], self.wf_size)
+            else:
+                dtype = feature_dtype(len(self.rec_config['features']['gates']))
+            fd = os.open(self.file_path(table), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            os.write(fd, npy_header(dtype, 0))
+            self.files[table], self.dtypes[table], self.rows[table] = fd, dtype, 0
+
+    def write(self, blocks : dict):
+        '''
+        Append blocks of rows keyed by (channel, table), one os.writev per table, rolling over if due.
+        '''
+        buffers = {}
+        for (ch, table), block in blocks.items():
+            buffers.setdefault(table, []).append(block)
+            if table == self.row_table:
+                self.n_rows[ch] += len(block)
+
+        for table, table_blocks in buffers.items():
+            fd = self.files[table]
+            self.n_bytes += write_all(fd, [np.ascontiguousarray(block).view(np.uint8) for block in table_blocks])
+            self.rows[table] += sum(len(block) for block in table_blocks)
+            os.pwrite(fd, npy_header(self.dtypes[table], self.rows[table]), 0)
+
+        if self.rollover_due():
+            self.roll_over()
+
+    def file_size(self) -> int:
+        return self.n_bytes
+
+    def finalise(self):
+        for table, fd in self.files.items():
+            os.close(fd)
+            self.finaliser.put(self.file_path(table))
+        self.files = {}
+
+
+# output backends by output_format
+OUTPUTS = {'hdf5' : H5Output,
+           'raw'  : RawOutput}
+
+
+def output_class(rec_config : dict) -> type:
+    '''
+    Output backend set by output_format in [output_settings], HDF5 by default.
+    '''
+    return OUTPUTS[rec_config.get('output_format', 'hdf5')]
+
+
+def npy_header(dtype : np.dtype, n_rows : int) -> bytes:
+    '''
+    .npy header of a 1D array of n_rows, padded to NPY_HEADER bytes so it can be rewritten in place.
+    '''
+    header = f"{{'descr': {np.lib.format.dtype_to_descr(dtype)!r}, 'fortran_order': False, 'shape': ({n_rows},), }}"
+    # magic string, version and header length take 10 bytes, the header ends in a newline
+    header = header.ljust(NPY_HEADER - 11) + '\n'
+    return np.lib.format.MAGIC_PREFIX + bytes([1, 0]) + len(header).to_bytes(2, 'little') + header.encode('latin1')
+
+
+def write_all(fd : int, buffers : list) -> int:
+    '''
+    Write every buffer to fd with os.writev, resuming after partial writes. Returns the bytes written.
+    '''
+    buffers = [memoryview(buffer).cast('B') for buffer in buffers]
+    total   = sum(len(buffer) for buffer in buffers)
+    while buffers:
+        n = os.writev(fd, buffers[:IOV_MAX])
+        while buffers and n >= len(buffers[0]):
+            n -= len(buffers.pop(0))
+        if buffers and n:
+            buffers[0] = buffers[0][n:]
+    return total
 
 
 class Writer(Thread):
     '''
-    Writes channel data to h5 file.
+    Writes channel data to the output files (see Output).
     '''
+    # the local buffer is also written once it holds this fraction of a ring's slots, so that
+    # readout never waits on the writer for free slots, whatever the flush size
+    ring_fraction = 0.5
+
     def __init__(self,
                  ch_map       : dict,
                  flush_size   : int,
                  write_buffer : Queue,
                  stop_event   : Event,
                  rec_config   : dict,
-                 dig_config   : dict,
-                 TIMESTAMP    : str,):
+                 dig_config   : dict | list,
+                 TIMESTAMP    : str,
+                 tracker      : Optional[Tracker] = None):
         '''
         TIMESTAMP should be provided to all channels identically before the
-        writer threads are initialised.
+        writer threads are initialised. dig_config may list the config of each digitiser.
         '''
 
         super().__init__(daemon=True)
@@ -30,96 +371,263 @@ class Writer(Thread):
         self.write_buffer = write_buffer
         self.stop_event = stop_event
         self.rec_config = rec_config
-        self.dig_config = dig_config
+        self.dig_configs = dig_config if isinstance(dig_config, list) else [dig_config]
+        self.dig_config  = self.dig_configs[0]
+        self.TIMESTAMP  = TIMESTAMP
+        self.tracker    = tracker
         self.local_buffer = []
+        self.n_buffered   = 0       # events held in the local buffer
+        self.ring_held    = {}      # ring -> slots held by the local buffer
+        self.ring_full    = False   # a ring is ring_fraction held by the local buffer
+        self.failed       = False   # a fatal error stopped the writer, which then releases what it's handed
         self.wf_size   = None
+        self.tables    = output_tables(self.rec_config)
+        self.extractor = None
+        self.suppression = self.rec_config.get('zero_suppression')
 
-        if 'file_name' in self.rec_config:
-            file_path = self.rec_config['file_name']
-            file_path = f'{file_path}_data_{TIMESTAMP}.h5'
-        else:
-            file_path = f'data_{TIMESTAMP}.h5'
-        # initialise the h5, one per channel, each handled on a separate thread
-        try:
-            self.h5file = tb.open_file(f'{file_path}', mode='a')
-        except FileNotFoundError as e:
-            logging.error(f'FileNotFoundError: Cannot create output file at path {file_path}')
-            exit()
-        # configs written
-        io.create_config_table(self.h5file, self.rec_config, 'rec_conf', 'recording config')
-        io.create_config_table(self.h5file, self.dig_config, 'dig_conf', 'digitiser config')
-        # raw waveform group constructed
-        self.rwf_group = {}
-        for ch in self.ch_map.keys():
-            self.rwf_group[ch] = self.h5file.create_group('/', f'ch_{ch}', 'raw waveform')
-        self.rwf_table = {}
+        # the local buffer is written once it holds flush_size events or its oldest is flush_age old (s)
+        self.flush_age   = self.rec_config.get('flush_age', 1.0)
+        self.get_timeout = min(0.1, self.flush_age)
 
-    def write_h5(self):
+        self.output = self.open_output()
+
+    def open_output(self):
         '''
-        Write local buffer to h5 file and then clear local buffer.
+        Open the output file written to by this writer, with the backend set by output_format.
+        '''
+        return output_class(self.rec_config)(self.ch_map, self.rec_config, self.dig_configs, self.TIMESTAMP)
+
+    def set_wf_size(self, wf_size):
+        '''
+        Fix the waveform size once the first event arrives, creating the output tables.
+        '''
+        self.wf_size   = int(wf_size)
+        # structured dtype matching the table rows, used to build blocks
+        self.rwf_dtype = df_class.return_rwf_dtype(self.dig_config['dig_gen'], self.wf_size)
+        if 'features' in self.tables:
+            self.extractor = FeatureExtractor(self.rec_config, self.wf_size)
+        self.create_tables()
+
+    def create_tables(self):
+        self.output.create_tables(self.wf_size)
+
+    def build_blocks(self, ring, slots : np.ndarray, evts : np.ndarray, alloc = None, keep = None, emit = None) -> dict:
+        '''
+        Gather events held in the ring into one contiguous structured array per channel and table,
+        matching rwf_class (or feature_dtype), so each is written with a single Table.append.
+        Features are extracted from the whole block of each channel at once.
+
+        keep, the zero suppression mask (see core/suppression.py), drops the waveforms not kept
+        or, in truncate mode, writes them as zeros.
+
+        alloc(n) may be given to provide the memory for each raw waveform block, otherwise np.empty is used.
+        emit((channel, table), block) may be given to take each block as soon as it's filled, in place of
+        returning them.
+        '''
+        blocks = {}
+        put    = blocks.__setitem__ if emit is None else emit
+        for i, (ch, index) in enumerate(ring.split_channels(slots)):
+            suppressed = None
+            if keep is not None:
+                fired = keep[index, i if ring.channel is None else 0]
+                if self.suppression == 'drop':
+                    index = index[fired]
+                else:
+                    suppressed = ~fired
+            if len(index) == 0:
+                continue
+
+            waveforms  = ring.waveforms(slots[index], ch)[:, :self.wf_size]
+            timestamps = ring.timestamp[slots[index]]
+            if 'rwf' in self.tables:
+                block = np.empty(len(index), dtype=self.rwf_dtype) if alloc is None else alloc(len(index))
+                block['evt_no']    = evts[index]
+                block['channel']   = ch
+                block['timestamp'] = timestamps
+                block['rwf']       = waveforms
+                if suppressed is not None:
+                    block['rwf'][suppressed] = 0
+                put((ch, 'rwf'), block)
+            if 'features' in self.tables:
+                block = np.empty(len(index), dtype=self.extractor.dtype)
+                block['evt_no']    = evts[index]
+                block['channel']   = ch
+                block['timestamp'] = timestamps
+                self.extractor.extract(waveforms, ch - ring.ch_offset, block)
+                put((ch, 'features'), block)
+        return blocks
+
+    def gather(self, alloc = None, emit = None) -> list:
+        '''
+        Build the blocks for the whole local buffer, releasing the ring slots once copied.
+        Returns the blocks of each ring, alloc and emit being passed to build_blocks.
 
         assumption is that the local buffer contains tuples of:
-        (waveform_size, ADCs, event_no)
-        where ADCs is the actual raw waveform array
+        (ring, slots, event_nos) or (ring, slots, event_nos, keep)
+        where the raw waveforms are held in the ring slots, see core/ring.py, and keep
+        is the zero suppression mask, None to keep everything.
+        Single slots and event numbers are accepted in place of arrays.
         '''
 
-        for wf_size, ch, rwf, evt, ts in self.local_buffer:
-        # if we know the size of the waveforms already, don't create the class again.
+        # group by ring, there is only more than one if the digitiser was reconnected
+        by_ring = {}
+        for ring, slots, evts, *keep in self.local_buffer:
+            by_ring.setdefault(ring, []).append((np.atleast_1d(slots), np.atleast_1d(evts), keep[0] if keep else None))
+
+        blocks = []
+        read_times = []
+        gathered = []
+        for ring, entries in by_ring.items():
+            slots, evts = (np.concatenate(x) for x in list(zip(*entries))[:2])
+            read_times.append(ring.read_time[slots])
+
+            # keep every waveform of the entries without a mask
+            keep = None
+            if any(k is not None for _, _, k in entries):
+                n_cols = len(ring.ch_list) if ring.channel is None else 1
+                keep   = np.concatenate([np.ones((len(s), n_cols), dtype=bool) if k is None else k for s, _, k in entries])
+
+            # if we know the size of the waveforms already, don't create the class again.
             if self.wf_size is None:
-                self.wf_size = wf_size
-                self.rwf_class = df_class.return_rwf_class(self.dig_config['dig_gen'], self.wf_size)
-                # generate all tables once
-                for ch in self.ch_map.keys():
-                    self.rwf_table[ch] = self.h5file.create_table(self.rwf_group[ch], 'rwf', self.rwf_class, "raw waveforms")
-            # open up the rows for the table
-            self.rows      =  self.rwf_table[ch].row
-
-            self.rows['evt_no']    = evt
-            self.rows['rwf']       = rwf
-            self.rows['channel']   = ch
-            self.rows['timestamp'] = ts
-            self.rows.append()
+                self.set_wf_size(ring.event(slots[0])[0][0])
+
+            blocks.append(self.build_blocks(ring, slots, evts, alloc, keep, emit))
+            gathered.append((ring, slots))
+
+        # block data is copied, so the slots can be reused. Only once every ring is, so that if
+        # a block fails the whole local buffer is still held, see release_buffered()
+        for ring, slots in gathered:
+            ring.release(slots)
 
         self.local_buffer.clear()
+        self.n_buffered = 0
+        self.ring_held.clear()
+        self.ring_full  = False
+        # readout times of the gathered events, for latency tracking
+        self.read_times = np.concatenate(read_times) if read_times else np.empty(0)
+        return blocks
 
-        # flush as fast as the buffer provides
-        for ch_local in self.ch_map.keys():
-            self.rwf_table[ch_local].flush()
-        pass
+    def write_h5(self):
+        '''
+        Write local buffer to h5 file and then clear local buffer.
+        '''
+        t_flush = time.perf_counter()
+        nbytes  = 0
+        for blocks in self.gather():
+            self.output.write(blocks)
+            nbytes += sum(block.nbytes for block in blocks.values())
+        if self.tracker:
+            self.tracker.track_flush(time.perf_counter() - t_flush, len(self.read_times), nbytes)
+            self.tracker.track_latency('disk', time.perf_counter() - self.read_times)
 
 
+    def flush_due(self) -> bool:
+        '''
+        Whether the local buffer holds flush_size events, or enough of a ring's slots that it should be written now.
+        '''
+        return self.n_buffered >= self.flush_size or self.ring_full
+
+    def fill_local_buffer(self) -> float:
+        '''
+        Block on the write buffer for the first entry, then take entries without blocking
+        until a flush is due. Returns the time spent blocked.
+        '''
+        t_wait = time.perf_counter()
+        try:
+            self.buffer_entry(self.write_buffer.get(timeout=self.get_timeout))
+        except Empty:
+            return time.perf_counter() - t_wait
+        idle = time.perf_counter() - t_wait
+
+        while not self.flush_due():
+            try:
+                self.buffer_entry(self.write_buffer.get_nowait())
+            except Empty:   # exit loop if shared buffer is empty
+                break
+        return idle
+
+    def buffer_entry(self, entry : tuple):
+        '''
+        Add a (ring, slots, event_nos) entry to the local buffer, counting its events and the ring slots it holds.
+        '''
+        ring, n = entry[0], np.size(entry[1])
+        self.local_buffer.append(entry)
+        self.n_buffered += n
+        self.ring_held[ring] = self.ring_held.get(ring, 0) + n
+        if self.ring_held[ring] >= self.ring_fraction * ring.n_slots:
+            self.ring_full = True
+
     def run(self):
         '''
         Writer hot loop.
         '''
         logging.info(f"Writer thread started.")
+        oldest = None   # arrival time of the oldest entry in the local buffer
+
+        # load reported to the tracker every second
+        t_report = time.perf_counter()
+        cpu_report = time.thread_time()
+        idle = 0
+
         try:
             while not self.stop_event.is_set():
-                # First load data from shared buffer into local buffer
-                for _ in range(self.flush_size):
-                    try:
-                        self.local_buffer.append(self.write_buffer.get_nowait())
-                    except Empty:   # exit for loop if shared buffer is empty
-                        break
+                # Load data from shared buffer into local buffer
+                was_empty = len(self.local_buffer) == 0
+                idle += self.fill_local_buffer()
+                if was_empty and self.local_buffer:
+                    oldest = time.perf_counter()
+
+                # Write all data in local buffer to h5 file once the batch is full or old enough
+                if self.local_buffer and (self.flush_due() or (time.perf_counter() - oldest >= self.flush_age)):
+                    self.write_h5()
 
-                # If no data was added to local buffer, don't write to h5 file
-                if len(self.local_buffer) == 0:
-                    continue
+                t_check = time.perf_counter()
+                if self.tracker and (t_check - t_report >= 1.0):
+                    cpu_check = time.thread_time()
+                    self.tracker.track_writer(cpu_check - cpu_report, idle, t_check - t_report)
+                    t_report, cpu_report, idle = t_check, cpu_check, 0
 
-                # Write all data in local buffer to h5 file
+            # write out whatever is still buffered in batches, releasing its ring slots
+            while True:
+                while not self.flush_due():
+                    try:
+                        self.buffer_entry(self.write_buffer.get_nowait())
+                    except Empty:
+                        break
+                if not self.local_buffer:
+                    break
                 self.write_h5()
 
         except Exception as e:
             logging.exception(f"Fatal error in Writer: {e}")
+            self.failed = True
+            self.release_buffered()
 
         # When stop_event() is set, call cleanup()
         self.cleanup()
         logging.info(f"Writer thread exited cleanly.")
 
+    def release_buffered(self):
+        '''
+        Release the ring slots of the local and write buffers without writing them, once the writer can't.
+        '''
+        while True:
+            try:
+                self.local_buffer.append(self.write_buffer.get_nowait())
+            except Empty:
+                break
+        if self.local_buffer:
+            logging.warning(f"{len(self.local_buffer)} buffered entries not written, releasing their slots.")
+        for ring, slots, *_ in self.local_buffer:
+            ring.release(slots)
+        self.local_buffer.clear()
+        self.n_buffered = 0
+        self.ring_held.clear()
+        self.ring_full  = False
+
     def cleanup(self):
         '''
         Handles cleanup of writer thread and h5 file.
         '''
         # close the h5 file
-        self.h5file.close()
-        pass
+        self.output.close()
@@ -0,0 +1,34 @@
+from typing import Optional
+
+
+def generate_digitiser_uri(con_type       :  str,
+                           address        :  Optional[str] = None,
+                           pid            :  Optional[int] = None,
+                           dig_authority  :  Optional[str] = 'caen.internal',
+                           ) -> str:
+    """
+    Generate a URI for a generation 2 (x27xx) digitiser.
+
+    Parameters:
+    ----------
+
+        con_type (str)       :  The connection type, 'eth' or 'usb'
+        address (str)        :  IP address or hostname of the digitiser, for 'eth'
+        pid (int)            :  The digitiser's serial number (PID), for 'usb'
+        dig_authority (str)  :  The authority for USB digitisers (default is 'caen.internal')
+
+    Returns:
+    -------
+        str: A URI string representing the digitiser connection.
+    """
+    match con_type.lower():
+        case 'eth':
+            if address is None:
+                raise ValueError("Ethernet digitisers need an address.")
+            return f'dig2://{address}'
+        case 'usb':
+            if pid is None:
+                raise ValueError("USB digitisers need a pid.")
+            return f'dig2://{dig_authority}/usb/{pid}'
+        case _:
+            raise ValueError(f"Connection type {con_type} not recognised, should be 'eth' or 'usb'.")
@@ -10,10 +10,10 @@ import time
 
 from core.functions import get_ch_mapping
 from felib.dig1_utils import generate_digitiser_uri
-
-import felib.formats as formats
-
-from caen_felib import lib, device, error
+from felib import dig2_utils
+from felib.simulator import SimDevice
+from felib.parameters import DeviceParameters
+from felib.readers import READERS
 
 
 class Digitiser():
@@ -25,10 +25,12 @@ class Digitiser():
         self.dig_dict = dig_dict
         self.dig_name = dig_dict.get('dig_name')
         self.dig_gen = int(dig_dict.get('dig_gen'))
+        # channels are numbered from ch_offset, to tell apart several boards
+        self.ch_offset = int(dig_dict.get('ch_offset', 0))
 
         # check for debugger
         if self.dig_name == 'debug':
-            logging.debug('Debugging mode enabled. Digitiser will fake connection')
+            logging.debug('Debugging mode enabled. Digitiser will be simulated')
 
         if self.dig_gen == 1:
             self.con_type = dig_dict.get('con_type')
@@ -37,9 +39,10 @@ class Digitiser():
             self.vme_base_address = dig_dict.get('vme_base_address', 0)
             self.dig_authority = dig_dict.get('dig_authority', 'caen.internal')
         elif self.dig_gen == 2:
-            # not implemented yet, raise error
-            logging.error("Digitiser generation 2 not implemented yet.")
-            #raise NotImplementedError("Digitiser generation 2 not implemented yet.")
+            self.con_type = dig_dict.get('con_type')
+            self.address = dig_dict.get('address')
+            self.pid = dig_dict.get('pid')
+            self.dig_authority = dig_dict.get('dig_authority', 'caen.internal')
         else:
             logging.error("Invalid digitiser generation specified in the configuration.")
             #raise ValueError("Invalid digitiser generation specified in the configuration.")
@@ -51,6 +54,11 @@ class Digitiser():
 
         self.data_format = []
         self.endpoint = None
+        self.ring = None
+        self.params = None
+        self.reader = None
+        self.record = None
+        self.acquisition_reads = 0  # device parameter reads during the last acquisition
 
     def generate_uri(self):
         '''
@@ -68,10 +76,12 @@ class Digitiser():
                 dig_authority=self.dig_authority
             )
         elif self.dig_gen == 2:
-            # not implemented yet, raise error
-            # you should never reach this code
-            logging.error("Digitiser generation 2 not implemented yet.")
-            #raise NotImplementedError("Digitiser generation 2 not implemented yet.")
+            return dig2_utils.generate_digitiser_uri(
+                con_type=self.con_type,
+                address=self.address,
+                pid=self.pid,
+                dig_authority=self.dig_authority
+            )
         else:
             logging.error("Invalid digitiser generation specified in the configuration.")
             #raise ValueError("Invalid digitiser generation specified in the configuration.")
@@ -84,29 +94,25 @@ class Digitiser():
 
         logging.info(f'Attemping connection to digitiser {self.dig_name} at {self.URI}.')
 
-        # fake connection for debugging
-        if self.dig_name == 'debug':
-            self.dig = None
-            self.isConnected = True
-            self.dig_info = {
-                'n_ch'        : 4,
-                'sample_rate' : 1000,
-                'ADCs'        : 12,
-                'firmware'    : 'debug',
-            }
-            logging.info(f'Digitiser connected in debug mode.\n{self.dig_info}')
-            return None
-
         try:
-            self.dig = device.connect(self.URI)
+            # simulated digitiser for debugging and load testing
+            if self.dig_name == 'debug':
+                self.dig = SimDevice(self.dig_dict)
+            else:
+                # FeLib is loaded on the first connection to hardware
+                from caen_felib import device
+                self.dig = device.connect(self.URI)
             self.dig.cmd.RESET()
             self.isConnected = True
+            # static parameters are read once here, and cached from then on
+            self.params = DeviceParameters(self.dig)
+            self.firmware = self.params['FWTYPE']
             # extract relevant information from the digitiser
             self.dig_info = {
-                'n_ch'        : int(self.dig.par.NUMCH.value),
-                'sample_rate' : float(self.dig.par.ADC_SAMPLRATE.value), # Msps
-                'ADCs'        : int(self.dig.par.ADC_NBIT.value),
-                'firmware'    : self.dig.par.FWTYPE.value,
+                'n_ch'        : int(self.params['NUMCH']),
+                'sample_rate' : float(self.params['ADC_SAMPLRATE']), # Msps
+                'ADCs'        : int(self.params['ADC_NBIT']),
+                'firmware'    : self.firmware,
             }
             logging.info(f'Digitiser connected.\n{self.dig_info}')
         except Exception as e:
@@ -128,105 +134,66 @@ class Digitiser():
         self.record_length = rec_dict.get('record_length')
         self.pre_trigger   = rec_dict.get('pre_trigger')
         self.trigger_mode  = rec_dict.get('trigger_mode')
+        self.ring_slots    = rec_dict.get('ring_slots', 1024)
+        # events read per acquire() call, and the longest the first of them waits for the rest (s)
+        self.batch_size        = rec_dict.get('batch_size', 1)
+        self.batch_max_latency = rec_dict.get('batch_max_latency', 0.01)
 
         # extract channel mapping
         self.ch_mapping    = get_ch_mapping(rec_dict)
 
         try:
 
-            self.dig.par.RECLEN.value = f'{self.record_length}'
-            self.dig.par.STARTMODE.value = 'START_MODE_SW' # currently only software modes enabled
-            match self.trigger_mode:
-                case 'SWTRIG':
-                    self.dig.par.TRG_SW_ENABLE.value = 'TRUE'
-                case _:
-                    self.dig.par.TRG_SW_ENABLE.value = 'FALSE'
+            # generation and firmware specific settings and readout, chosen once here
+            if (self.dig_gen, self.firmware) not in READERS:
+                available = ', '.join(fw for gen, fw in READERS if gen == self.dig_gen)
+                raise ValueError(f"Firmware type {self.firmware} not recognised.\nCurrent FWs available are {available}")
+            self.reader = READERS[(self.dig_gen, self.firmware)](self.dig, self.params)
+            self.reader.configure_board(self.record_length, self.pre_trigger, self.trigger_mode)
 
             # configure channels
-            for i, ch in enumerate(self.dig.ch):
+            for i in range(self.dig_info['n_ch']):
 
                 # extract channel config of interest
                 ch_dict = rec_dict.get(f'ch{i}')
 
                 # disable channel if not explicitly called
                 if ch_dict is None:
-                    ch.par.CH_ENABLED.value = 'FALSE'
+                    self.reader.disable_channel(i)
                     continue
 
-                # normal channel management
-                ch.par.CH_ENABLED.value = 'TRUE' if ch_dict['enabled'] else 'FALSE'
-                # for SCOPE, this doesnt need to be set per channel, but i prefer these to be set together
-                # even if its a bit redundant
-                if   self.dig.par.FWTYPE.value == 'DPP-PSD' : ch.par.CH_PRETRIG.value = f'{self.pre_trigger}'
-                elif self.dig.par.FWTYPE.value == 'SCOPE'   : self.dig.par.POSTTRG.value    = f'{self.record_length - self.pre_trigger}'
-
                 # ensure self trigger only enabled when you don't have SWTRIG enabled
                 # recall that this functions like so for DPP-PSD, with SCOPE, if a channel is enabled the self-trigger is also enabled
-                if (ch_dict['self_trigger'] and self.trigger_mode != 'SWTRIG'):
-                    if self.dig.par.FWTYPE.value    == 'DPP-PSD' : ch.par.CH_SELF_TRG_ENABLE.value = 'TRUE'
-                    if self.dig.par.FWTYPE.value    == 'SCOPE'   : ch.par.CH_TRG_GLOBAL_GEN.value  = 'TRUE'
-
-                    ch.par.CH_THRESHOLD.value       = str(ch_dict['threshold'])
-                else:
-                    # doesn't reset by default! so forcing this here
-                    if self.dig.par.FWTYPE.value    == 'DPP-PSD' : ch.par.CH_SELF_TRG_ENABLE.value = 'FALSE'
-                    if self.dig.par.FWTYPE.value    == 'SCOPE'   : ch.par.CH_TRG_GLOBAL_GEN.value  = 'FALSE'
-
-                if ch_dict['polarity'] == 'positive':
-                    ch.par.CH_POLARITY.value        = 'POLARITY_POSITIVE'
-                elif ch_dict['polarity'] == 'negative':
-                    ch.par.CH_POLARITY.value        = 'POLARITY_NEGATIVE'
-
+                self_trigger = ch_dict['self_trigger'] and self.trigger_mode != 'SWTRIG'
+                self.reader.configure_channel(i, ch_dict, self.pre_trigger, self_trigger)
 
+            # calculate the true reclen value for outputting
+            self.reclen = self.reader.record_samples(self.dig_info['sample_rate'])
 
+            # set up data format, and the preallocated event slots that the endpoint reads directly into
+            self.data_format = self.reader.configure(self.record_length, self.pre_trigger, self.reclen)
+            self.ring = self.reader.open(self.data_format, self.ring_slots, self.ch_mapping, self.batch_max_latency,
+                                         ch_offset = self.ch_offset)
+            self.ring.adc_bits = self.dig_info['ADCs']
+            self.endpoint = self.reader.endpoint
 
-            # calculate the true reclen value for outputting
-            reclen_ns = int(self.dig.par.RECLEN.value)
-            self.reclen    = int(reclen_ns / int(1e3 / self.dig_info['sample_rate']))
-
-            # set up data format
-            match self.dig.par.FWTYPE.value:
-                case 'DPP-PSD':
-                    # enforce waveform formatting
-                    self.dig.par.WAVEFORMS.value = 'TRUE'
-                    self.data_format = formats.DPP(  int(self.dig.par.NUMCH.value), int(self.reclen))
-                    # setting up probe types (READ UP ON THIS)
-                    self.dig.vtrace[0].par.VTRACE_PROBE.value = 'VPROBE_INPUT'
-                case 'SCOPE':
-                    self.data_format = formats.SCOPE(int(self.dig.par.NUMCH.value), int(self.reclen))
-                case _:
-                    logging.exception(f"Firmware type {self.dig.par.FWTYPE.value} not recognised.\nCurrent FWs available are DPP-PSD and SCOPE")
-
-            endpoint_path = (self.dig.par.FWTYPE.value).replace('-', '')
-            self.endpoint = self.dig.endpoint[endpoint_path]
-            self.data = self.endpoint.set_read_data_format(self.data_format)
-
-
-            # generalised extraction of data parameters
-            match self.dig.par.FWTYPE.value:
-                case 'DPP-PSD':
-                    self.channel       = self.data[0].value
-                    self.timestamp     = self.data[1].value
-                    self.waveform_size = self.data[7].value
-                    self.waveform      = self.data[3].value
-                case 'SCOPE':
-                    # no channel parameter as channels are treated differently
-                    # all channels are within the dataset, check the data format to understand the shape
-                    self.timestamp     = self.data[1].value
-                    self.waveform_size = self.data[3].value
-                    self.waveform      = self.data[2].value
+            # readout for the trigger mode, chosen once here
+            match self.trigger_mode:
+                case 'SWTRIG':
+                    self.record = self.SW_record
+                case 'SELFTRIG':
+                    self.record = self.SELFTRIG_record
                 case _:
-                    logging.exception(f"Firmware type {self.dig.par.FWTYPE.value} not recognised.\nCurrent FWs available are DPP-PSD and SCOPE")
-
+                    self.record = None
 
+            self.params.log_reads('while configuring')
             logging.info(f"Digitiser configured:\nrecord length {self.record_length}, pre-trigger {self.pre_trigger}, trigger mode {self.trigger_mode}.")
         except Exception as e:
             logging.exception(f"Failed to configure recording parameters.\n{e}")
 
 
         try:
-            self.dig.cmd.CALIBRATEADC()
-            logging.info("Digitiser calibrated.")
+            self.reader.calibrate()
         except Exception as e:
             logging.exception(f"Failed to calibrate digitiser.\n{e}")
             #raise RuntimeError(f"Failed to calibrate digitiser.\n{e}")
@@ -238,7 +205,8 @@ class Digitiser():
         '''
         self.isAcquiring = True
         try:
-            self.dig.cmd.ARMACQUISITION()
+            self.params.reads_per_second()  # count from here, see stop_acquisition
+            self.reader.arm()
         except Exception as e:
             logging.exception(f"Starting acquisition failed: {e}")
 
@@ -260,94 +228,48 @@ class Digitiser():
         #self.dig.cmd.STOP() # This in reality looks like dig.cmd.DISARMACQUISITION()
         try:
             self.isAcquiring = False
-            self.dig.cmd.DISARMACQUISITION()
+            self.reader.disarm()
             logging.info("Digitiser acquisition stopped.")
+            # should be none, readout only uses cached parameters
+            self.acquisition_reads = self.params.log_reads('during acquisition')
         except Exception as e:
             logging.exception("Stopping acsquisition failed:")
 
     def acquire(self):
         '''
-        Must return data with format (wf_size, ADCs, ch)
+        Must return data with format [(ring, slots), ...], see core/ring.py
         '''
-        match self.trigger_mode:
-            case 'SWTRIG':
-                return self.SW_record()
-            case 'SELFTRIG':
-                return self.SELFTRIG_record()
-            case _:
-                logging.info(f'Trigger mode {self.trigger_mode} not currently implemented.')
-                self.stop_acquisition()
+        if self.record is None:
+            logging.info(f'Trigger mode {self.trigger_mode} not currently implemented.')
+            self.stop_acquisition()
+            return None
+        return self.record()
 
 
     def SW_record(self):
         '''
-        Send software trigger and read the data out.
+        Send software triggers and read the data out, one trigger per claimed slot.
         '''
-        check_timeout = 100
-        read_timeout  = 50
-        self.dig.cmd.SENDSWTRIGGER()
-        try:
-            self.endpoint.has_data(check_timeout)
-            self.endpoint.read_data(read_timeout, self.data) # timeout first number in ms
-
-            # SCOPE sends everything, even the disabled channels, so parse the relevant channels here
-            if self.dig.par.FWTYPE.value == 'SCOPE':
-                output = []
-                # using the mapping extract the relevant channels
-                for ch in self.ch_mapping.keys():
-                    output.append((self.waveform_size[ch], self.waveform[ch], ch, self.timestamp))
-            # DPP-PSD triggers per channel, so needs to be treated as such
-            elif self.dig.par.FWTYPE.value == 'DPP-PSD':
-                output = [(self.waveform_size, self.waveform, self.channel, self.timestamp)]
-
-            return output
-
-        except error.Error as ex:
-            #logging.exception("Error in readout:")
-            if ex.code is error.ErrorCode.TIMEOUT:
-                logging.warning("Trigger timed out before receiving data. Increase timeout to avoid this warning") # Resolved by increasing timeout
-            if ex.code is error.ErrorCode.STOP:
-                logging.exception("STOP")
-                raise ex
-
-        # ensure the input and trigger are acceptable (I think?)
-        #assert self.data[3].value == 1 # VPROBE INPUT? I need to understand this
-        #assert self.data[6].value == 1 # VPROBE TRIGGER?
-
-        #waveform_size = self.data[7].value
-        #valid_sample_range = np.arange(0, waveform_size, dtype = waveform_size.dtype)
+        # don't trigger if there is nowhere to put the events
+        slots = self.ring.claim(self.batch_size)
+        if slots is None:
+            return None
 
+        for _ in slots:
+            self.reader.sw_trigger()
+        return self.reader.read_block(slots)
 
 
     def SELFTRIG_record(self):
         '''
         Trigger on channels
         '''
-        check_timeout = 100
-        read_timeout  = 50
-        try:
-            self.endpoint.has_data(check_timeout)
-            self.endpoint.read_data(read_timeout, self.data)
-
-            # SCOPE sends everything, even the disabled channels, so parse the relevant channels here
-            if self.dig.par.FWTYPE.value == 'SCOPE':
-                output = []
-                # using the mapping extract the relevant channels
-                for ch in self.ch_mapping.keys():
-                    output.append((self.waveform_size[ch], self.waveform[ch], ch, self.timestamp))
-            # DPP-PSD triggers per channel, so needs to be treated as such
-            elif self.dig.par.FWTYPE.value == 'DPP-PSD':
-                output = [(self.waveform_size, self.waveform, self.channel, self.timestamp)]
-
-            return output
-
-        except error.Error as ex:
-            #logging.exception("Error in readout:")
-            if ex.code is error.ErrorCode.TIMEOUT:
-                logging.warning("Trigger timed out before receiving data. Increase timeout to avoid this warning") # Resolved by increasing timeout
-            if ex.code is error.ErrorCode.STOP:
-                logging.exception("STOP")
-                raise ex
+        # leave the events on the digitiser until a slot is free
+        slots = self.ring.claim(self.batch_size)
+        if slots is None:
+            return None
+
+        return self.reader.read_block(slots)
 
 
     def __del__(self):
@@ -1,4 +1,21 @@
 # location for defining all the data formats of the differing firmwares
+import numpy as np
+
+# numpy equivalents of the FeLib data types used in the formats below
+NUMPY_TYPES = {
+    'U8'     : np.uint8,
+    'U16'    : np.uint16,
+    'U32'    : np.uint32,
+    'U64'    : np.uint64,
+    'I8'     : np.int8,
+    'I16'    : np.int16,
+    'I32'    : np.int32,
+    'I64'    : np.int64,
+    'SIZE_T' : np.uintp,
+    'FLOAT'  : np.float32,
+    'DOUBLE' : np.float64,
+}
+
 
 def DPP(nch, record_length):
     '''
@@ -55,6 +72,15 @@ def DPP(nch, record_length):
     return data_format
 
 
+# fields of the DPP format passed downstream
+DPP_LAYOUT = {
+    'channel'       : 'CHANNEL',
+    'timestamp'     : 'TIMESTAMP',
+    'waveform'      : 'ANALOG_PROBE_1',
+    'waveform_size' : 'WAVEFORM_SIZE',
+}
+
+
 def SCOPE(nch, record_length):
     '''
     SCOPE format
@@ -66,10 +92,12 @@ def SCOPE(nch, record_length):
         {
             'name': 'EVENT_SIZE',
             'type': 'SIZE_T',
+            'dim': 0,
         },
         {
             'name': 'TIMESTAMP',
             'type': 'U64',
+            'dim': 0,
         },
         {
             'name': 'WAVEFORM',
@@ -86,3 +114,124 @@ def SCOPE(nch, record_length):
     ]
 
     return data_format
+
+
+# fields of the SCOPE format passed downstream
+# no channel field as all channels are within each event
+SCOPE_LAYOUT = {
+    'timestamp'     : 'TIMESTAMP',
+    'waveform'      : 'WAVEFORM',
+    'waveform_size' : 'WAVEFORM_SIZE',
+}
+
+
+def DIG2_DPP(nch, record_length):
+    '''
+    Digitiser generation 2 (x27xx) DPP-PSD/DPP-PHA format, fields common to both
+    nch - number of channels
+    '''
+
+    # Configure endpoint
+    data_format = [
+        {
+            'name': 'CHANNEL',
+            'type': 'U8',
+            'dim' : 0,
+        },
+        {
+            'name': 'TIMESTAMP',
+            'type': 'U64',
+            'dim': 0,
+        },
+        {
+            'name': 'FINE_TIMESTAMP',
+            'type': 'U16',
+            'dim': 0,
+        },
+        {
+            'name': 'ENERGY',
+            'type': 'U16',
+            'dim': 0,
+        },
+        {
+            'name': 'FLAGS_LOW_PRIORITY',
+            'type': 'U16',
+            'dim': 0,
+        },
+        {
+            'name': 'FLAGS_HIGH_PRIORITY',
+            'type': 'U16',
+            'dim': 0,
+        },
+        {
+            'name': 'ANALOG_PROBE_1',
+            'type': 'I32',
+            'dim': 1,
+            'shape': [record_length],
+        },
+        {
+            'name': 'ANALOG_PROBE_1_TYPE',
+            'type': 'U8',
+            'dim': 0,
+        },
+        {
+            'name': 'WAVEFORM_SIZE',
+            'type': 'SIZE_T',
+            'dim': 0,
+        },
+        {
+            'name': 'EVENT_SIZE',
+            'type': 'SIZE_T',
+            'dim': 0,
+        }
+    ]
+
+    return data_format
+
+
+# fields of the generation 2 DPP format passed downstream
+DIG2_DPP_LAYOUT = DPP_LAYOUT
+
+
+def DIG2_SCOPE(nch, record_length):
+    '''
+    Digitiser generation 2 (x27xx) SCOPE format
+    nch - number of channels
+    '''
+
+    # Configure endpoint
+    data_format = [
+        {
+            'name': 'TIMESTAMP',
+            'type': 'U64',
+            'dim': 0,
+        },
+        {
+            'name': 'TRIGGER_ID',
+            'type': 'U32',
+            'dim': 0,
+        },
+        {
+            'name': 'WAVEFORM',
+            'type': 'U16',
+            'dim': 2,
+            'shape': [nch, record_length],
+        },
+        {
+            'name': 'WAVEFORM_SIZE',
+            'type': 'SIZE_T',
+            'dim': 1,
+            'shape': [nch],
+        },
+        {
+            'name': 'EVENT_SIZE',
+            'type': 'SIZE_T',
+            'dim': 0,
+        }
+    ]
+
+    return data_format
+
+
+# fields of the generation 2 SCOPE format passed downstream
+DIG2_SCOPE_LAYOUT = SCOPE_LAYOUT
@@ -0,0 +1,63 @@
+'''
+Cached access to digitiser parameters.
+
+Every FeLib parameter read is a query to the device, so the parameters that
+can't change while connected are read once at connect and served from the
+cache afterwards. Reads that do reach the device are counted, so the
+acquisition can confirm none happen during readout.
+'''
+import time
+import logging
+from threading import Lock
+
+
+class DeviceParameters:
+    '''
+    Parameter reads of a connected FeLib device, through a cache of its static parameters.
+    '''
+    # fixed by the board and firmware, read once at connect
+    static = ('FWTYPE', 'NUMCH', 'ADC_SAMPLRATE', 'ADC_NBIT')
+
+    def __init__(self, dig):
+        self.dig     = dig
+        self.n_reads = 0
+        self.lock    = Lock()
+        self.cache   = {name : self.read(name) for name in self.static}
+
+        self.last_reads = 0
+        self.last_time  = time.perf_counter()
+
+    def __getitem__(self, name: str) -> str:
+        '''
+        Value of a parameter, from the cache if it's static.
+        '''
+        if name in self.cache:
+            return self.cache[name]
+        return self.read(name)
+
+    def read(self, name: str, node = None) -> str:
+        '''
+        Read a parameter from the device, from node.par if given (eg. a channel), otherwise the board.
+        '''
+        with self.lock:
+            self.n_reads += 1
+        return getattr((node or self.dig).par, name).value
+
+    def reads_per_second(self) -> float:
+        '''
+        Device reads per second since the previous call.
+        '''
+        with self.lock:
+            t_check = time.perf_counter()
+            rate = (self.n_reads - self.last_reads) / (t_check - self.last_time)
+            self.last_reads, self.last_time = self.n_reads, t_check
+        return rate
+
+    def log_reads(self, context: str) -> int:
+        '''
+        Log and return the number of device reads made since the previous call.
+        '''
+        n = self.n_reads - self.last_reads
+        rate = self.reads_per_second()
+        logging.info(f'{n} device parameter reads {context} ({rate:.2f}/sec).')
+        return n
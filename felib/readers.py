@@ -0,0 +1,382 @@
+'''
+Firmware specific configuration and readout, chosen once in Digitiser.configure
+so that nothing is looked up per event.
+'''
+import abc
+import sys
+import time
+import logging
+import numpy as np
+from typing import Optional
+
+import felib.formats as formats
+from core.ring import EventRing
+from felib.simulator import SimError, TIMEOUT, STOP
+
+
+def felib_error_code(ex: Exception) -> Optional[int]:
+    '''
+    FeLib error code of ex, None if it isn't a FeLib error. caen_felib is only looked at once
+    connecting to hardware has imported it, so the simulator runs without the library.
+    '''
+    if isinstance(ex, SimError):
+        return ex.code
+    error = sys.modules.get('caen_felib.error')
+    if error is not None and isinstance(ex, error.Error):
+        return int(ex.code)
+    return None
+
+
+class Reader(abc.ABC):
+    '''
+    Base reader, reading events from the endpoint straight into ring slots.
+    Subclasses give the digitiser generation's settings and commands, and the
+    firmware's endpoint, data format and channel settings.
+    '''
+    endpoint_path = None
+    layout        = None
+
+    def __init__(self, dig, params):
+        self.dig      = dig
+        self.params   = params
+        self.endpoint = None
+        self.ring     = None
+
+    @abc.abstractmethod
+    def configure_board(self, record_length: int, pre_trigger: int, trigger_mode: str):
+        '''
+        Board settings common to every firmware of the generation.
+        '''
+
+    @abc.abstractmethod
+    def configure_channel(self, i: int, ch_dict: dict, pre_trigger: int, self_trigger: bool):
+        '''
+        Settings of channel i, ch_dict being its recording config.
+        '''
+
+    @abc.abstractmethod
+    def disable_channel(self, i: int):
+        '''
+        Disable channel i, left out of the recording config.
+        '''
+
+    @abc.abstractmethod
+    def record_samples(self, sample_rate: float) -> int:
+        '''
+        Record length the board settled on, in samples.
+        '''
+
+    @abc.abstractmethod
+    def configure(self, record_length: int, pre_trigger: int, reclen: int) -> list:
+        '''
+        Board settings of the firmware, once the channels are set, returning its data format for reclen samples.
+        '''
+
+    @abc.abstractmethod
+    def calibrate(self):
+        '''
+        Calibrate the ADCs.
+        '''
+
+    @abc.abstractmethod
+    def arm(self):
+        '''
+        Arm and start the acquisition.
+        '''
+
+    @abc.abstractmethod
+    def disarm(self):
+        '''
+        Stop and disarm the acquisition.
+        '''
+
+    @abc.abstractmethod
+    def sw_trigger(self):
+        '''
+        Send a software trigger.
+        '''
+
+    def open(self, data_format: list, ring_slots: int, ch_mapping: dict, batch_max_latency: float,
+             ch_offset: int = 0) -> EventRing:
+        '''
+        Set the endpoint data format and allocate the ring it reads into.
+        '''
+        self.endpoint = self.dig.endpoint[self.endpoint_path]
+        self.endpoint.set_read_data_format(data_format)
+        self.ring = EventRing(data_format, ring_slots, ch_mapping, self.layout, ch_offset)
+        self.batch_max_latency = batch_max_latency
+        return self.ring
+
+    def read_block(self, slots : np.ndarray):
+        '''
+        Read up to len(slots) events from the endpoint directly into claimed, consecutive ring slots.
+        Waits up to check_timeout for the first event, then only as long as batch_max_latency
+        allows for the others. Slots left unread are handed back to the ring.
+        '''
+        check_timeout = 100
+        read_timeout  = 50
+        n_read = 0
+        try:
+            for slot in slots:
+                if n_read == 0:
+                    timeout = check_timeout
+                else:
+                    timeout = int(max(deadline - time.perf_counter(), 0) * 1e3)
+                if not self.endpoint.has_data(timeout):
+                    break
+                self.endpoint.read_data(read_timeout, self.ring.slots[slot]) # timeout first number in ms
+                self.ring.read_time[slot] = time.perf_counter()
+                if n_read == 0:
+                    deadline = self.ring.read_time[slot] + self.batch_max_latency
+                n_read += 1
+
+        except Exception as ex:
+            code = felib_error_code(ex)
+            if code is None or code == STOP:
+                self.ring.unclaim(slots[n_read:])
+                if code == STOP:
+                    logging.exception("STOP")
+                raise
+            if code == TIMEOUT:
+                logging.warning("Trigger timed out before receiving data. Increase timeout to avoid this warning") # Resolved by increasing timeout
+
+        self.ring.unclaim(slots[n_read:])
+        if n_read == 0:
+            return None
+        # channel parsing (SCOPE sends everything, even the disabled channels) is left to the ring
+        return [(self.ring, slots[:n_read])]
+
+
+class Dig1Reader(Reader):
+    '''
+    Digitiser generation 1 (x17xx, x27xx with dig1 firmware) settings and commands.
+    '''
+    def configure_board(self, record_length, pre_trigger, trigger_mode):
+        self.dig.par.RECLEN.value = f'{record_length}'
+        self.dig.par.STARTMODE.value = 'START_MODE_SW' # currently only software modes enabled
+        match trigger_mode:
+            case 'SWTRIG':
+                self.dig.par.TRG_SW_ENABLE.value = 'TRUE'
+            case _:
+                self.dig.par.TRG_SW_ENABLE.value = 'FALSE'
+
+    def configure_channel(self, i, ch_dict, pre_trigger, self_trigger):
+        ch = self.dig.ch[i]
+        # normal channel management
+        ch.par.CH_ENABLED.value = 'TRUE' if ch_dict['enabled'] else 'FALSE'
+
+        self.channel_trigger(ch, pre_trigger, self_trigger)
+        if self_trigger:
+            ch.par.CH_THRESHOLD.value       = str(ch_dict['threshold'])
+
+        if ch_dict['polarity'] == 'positive':
+            ch.par.CH_POLARITY.value        = 'POLARITY_POSITIVE'
+        elif ch_dict['polarity'] == 'negative':
+            ch.par.CH_POLARITY.value        = 'POLARITY_NEGATIVE'
+
+    def disable_channel(self, i):
+        self.dig.ch[i].par.CH_ENABLED.value = 'FALSE'
+
+    @abc.abstractmethod
+    def channel_trigger(self, ch, pre_trigger: int, self_trigger: bool):
+        '''
+        Trigger settings of the firmware, ch being the FeLib channel node.
+        '''
+
+    def record_samples(self, sample_rate):
+        # calculate the true reclen value for outputting
+        reclen_ns = int(self.params.read('RECLEN'))
+        return int(reclen_ns / int(1e3 / sample_rate))
+
+    def calibrate(self):
+        self.dig.cmd.CALIBRATEADC()
+        logging.info("Digitiser calibrated.")
+
+    def arm(self):
+        self.dig.cmd.ARMACQUISITION()
+
+    def disarm(self):
+        self.dig.cmd.DISARMACQUISITION()
+
+    def sw_trigger(self):
+        self.dig.cmd.SENDSWTRIGGER()
+
+
+class ScopeReader(Dig1Reader):
+    '''
+    SCOPE firmware, every event holds all channels.
+    '''
+    endpoint_path = 'SCOPE'
+    # no channel parameter as channels are treated differently
+    # all channels are within the dataset, check the data format to understand the shape
+    layout        = formats.SCOPE_LAYOUT
+
+    def configure(self, record_length, pre_trigger, reclen):
+        self.dig.par.POSTTRG.value = f'{record_length - pre_trigger}'
+        return formats.SCOPE(int(self.params['NUMCH']), int(reclen))
+
+    def channel_trigger(self, ch, pre_trigger, self_trigger):
+        # with SCOPE, if a channel is enabled the self-trigger is also enabled
+        # doesn't reset by default! so always set here
+        ch.par.CH_TRG_GLOBAL_GEN.value = 'TRUE' if self_trigger else 'FALSE'
+
+
+class DPPReader(Dig1Reader):
+    '''
+    DPP-PSD firmware, every event holds a single channel.
+    '''
+    endpoint_path = 'DPPPSD'
+    layout        = formats.DPP_LAYOUT
+
+    def configure(self, record_length, pre_trigger, reclen):
+        # enforce waveform formatting
+        self.dig.par.WAVEFORMS.value = 'TRUE'
+        # setting up probe types (READ UP ON THIS)
+        self.dig.vtrace[0].par.VTRACE_PROBE.value = 'VPROBE_INPUT'
+        return formats.DPP(int(self.params['NUMCH']), int(reclen))
+
+    def channel_trigger(self, ch, pre_trigger, self_trigger):
+        ch.par.CH_PRETRIG.value = f'{pre_trigger}'
+        # doesn't reset by default! so always set here
+        ch.par.CH_SELF_TRG_ENABLE.value = 'TRUE' if self_trigger else 'FALSE'
+
+
+class Dig2Reader(Reader):
+    '''
+    Digitiser generation 2 (x27xx) settings and commands. The decoded endpoint
+    read from is chosen with ActiveEndpoint, and acquisition runs once armed and
+    started by software command.
+    '''
+    def configure_board(self, record_length, pre_trigger, trigger_mode):
+        self.record_length = record_length
+        self.sw_mode       = trigger_mode == 'SWTRIG'
+        self.dig.par.StartSource.value = 'SWcmd' # currently only software modes enabled
+
+    def configure_channel(self, i, ch_dict, pre_trigger, self_trigger):
+        ch = self.dig.ch[i]
+        ch.par.ChEnable.value = 'True' if ch_dict['enabled'] else 'False'
+        self.channel_trigger(i, ch_dict, pre_trigger, self_trigger)
+
+    def disable_channel(self, i):
+        self.dig.ch[i].par.ChEnable.value = 'False'
+
+    @abc.abstractmethod
+    def channel_trigger(self, i: int, ch_dict: dict, pre_trigger: int, self_trigger: bool):
+        '''
+        Trigger settings of the firmware for channel i.
+        '''
+
+    def open(self, *args, **kwargs):
+        self.dig.endpoint.par.ActiveEndpoint.value = self.endpoint_path
+        return super().open(*args, **kwargs)
+
+    def calibrate(self):
+        # x27xx boards calibrate their ADCs themselves
+        logging.info("Digitiser generation 2 calibrates itself, no calibration sent.")
+
+    def arm(self):
+        self.dig.cmd.ArmAcquisition()
+        self.dig.cmd.SwStartAcquisition()
+
+    def disarm(self):
+        self.dig.cmd.SwStopAcquisition()
+        self.dig.cmd.DisarmAcquisition()
+
+    def sw_trigger(self):
+        self.dig.cmd.SendSwTrigger()
+
+
+class Dig2ScopeReader(Dig2Reader):
+    '''
+    Generation 2 Scope firmware, every event holds all channels. Self-triggering
+    channels are ORed into the board trigger through ITLA.
+    '''
+    endpoint_path = 'scope'
+    layout        = formats.DIG2_SCOPE_LAYOUT
+
+    def configure_board(self, record_length, pre_trigger, trigger_mode):
+        super().configure_board(record_length, pre_trigger, trigger_mode)
+        self.dig.par.RecordLengthT.value = f'{record_length}'
+        self.dig.par.PreTriggerT.value   = f'{pre_trigger}'
+        self.itla_mask = 0
+
+    def channel_trigger(self, i, ch_dict, pre_trigger, self_trigger):
+        if not self_trigger:
+            return
+        ch = self.dig.ch[i]
+        ch.par.TriggerThrMode.value  = 'Absolute'
+        ch.par.TriggerThr.value      = str(ch_dict['threshold'])
+        ch.par.SelfTriggerEdge.value = 'Fall' if ch_dict['polarity'] == 'negative' else 'Rise'
+        self.itla_mask |= 1 << i
+
+    def record_samples(self, sample_rate):
+        reclen_ns = int(self.params.read('RecordLengthT'))
+        return int(reclen_ns / (1e3 / sample_rate))
+
+    def configure(self, record_length, pre_trigger, reclen):
+        if self.sw_mode:
+            self.dig.par.AcqTriggerSource.value = 'SwTrg'
+        else:
+            self.dig.par.AcqTriggerSource.value = 'ITLA'
+            self.dig.par.ITLAMainLogic.value    = 'OR'
+            self.dig.par.ITLAMask.value         = f'{self.itla_mask}'
+        return formats.DIG2_SCOPE(int(self.params['NUMCH']), int(reclen))
+
+
+class Dig2DPPReader(Dig2Reader):
+    '''
+    Generation 2 DPP-PSD firmware, every event holds a single channel.
+    Record length and pre-trigger are set per channel.
+    '''
+    endpoint_path = 'dpppsd'
+    layout        = formats.DIG2_DPP_LAYOUT
+
+    def configure_board(self, record_length, pre_trigger, trigger_mode):
+        super().configure_board(record_length, pre_trigger, trigger_mode)
+        self.dig.par.GlobalTriggerSource.value = 'SwTrg' if self.sw_mode else 'Disabled'
+        self.first_enabled = None
+
+    def channel_trigger(self, i, ch_dict, pre_trigger, self_trigger):
+        ch = self.dig.ch[i]
+        if ch_dict['enabled'] and self.first_enabled is None:
+            self.first_enabled = ch
+        ch.par.ChRecordLengthT.value  = f'{self.record_length}'
+        ch.par.ChPreTriggerT.value    = f'{pre_trigger}'
+        ch.par.WaveAnalogProbe0.value = 'ADCInput'
+        ch.par.WaveSaving.value       = 'Always'
+        if self_trigger:
+            source = 'ChSelfTrigger'
+        elif self.sw_mode:
+            source = 'GlobalTriggerSource'
+        else:
+            source = 'Disabled'
+        ch.par.EventTriggerSource.value = source
+        ch.par.WaveTriggerSource.value  = source
+        ch.par.TriggerThr.value         = str(ch_dict['threshold'])
+        ch.par.PulsePolarity.value      = 'Negative' if ch_dict['polarity'] == 'negative' else 'Positive'
+
+    def record_samples(self, sample_rate):
+        if self.first_enabled is None:
+            return 0
+        reclen_ns = int(self.params.read('ChRecordLengthT', self.first_enabled))
+        return int(reclen_ns / (1e3 / sample_rate))
+
+    def configure(self, record_length, pre_trigger, reclen):
+        return formats.DIG2_DPP(int(self.params['NUMCH']), int(reclen))
+
+
+class Dig2PHAReader(Dig2DPPReader):
+    '''
+    Generation 2 DPP-PHA firmware, read through the fields it shares with DPP-PSD.
+    '''
+    endpoint_path = 'dpppha'
+
+
+# readers by digitiser generation and FWTYPE
+READERS = {
+    (1, 'SCOPE')   : ScopeReader,
+    (1, 'DPP-PSD') : DPPReader,
+    (2, 'Scope')   : Dig2ScopeReader,
+    (2, 'DPP_PSD') : Dig2DPPReader,
+    (2, 'DPP_PHA') : Dig2PHAReader,
+}
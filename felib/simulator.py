@@ -0,0 +1,354 @@
+'''
+Simulated digitiser, used in place of the hardware when dig_name = 'debug'.
+
+Mimics the parts of the CAEN FeLib node tree that Digitiser uses (par, cmd,
+ch, vtrace, endpoint) for the SCOPE and DPP-PSD firmwares of both digitiser
+generations (dig_gen), so connect, configure and the SW_record/SELFTRIG_record
+readout run unchanged. As in FeLib, node names are case insensitive. Events are
+pulses on a noisy baseline, self-triggered at a target rate or sent by
+software trigger.
+
+Simulation settings are read from the digitiser config:
+    sim_firmware    - 'SCOPE' or 'DPP-PSD'
+    sim_rate        - mean self-trigger rate (Hz), 0 for as fast as the readout allows
+    sim_n_ch        - number of channels
+    sim_sample_rate - sample rate (MS/s)
+    sim_adc_bits    - ADC resolution (bits)
+    sim_buffer      - events the board holds before dropping triggers
+    sim_jitter      - spread of the DPP-PSD channel timestamps of one trigger (ticks)
+
+With DPP-PSD each trigger is read out as one event per self-triggering
+channel, their timestamps within sim_jitter of each other, as when a pulse
+is seen by several channels.
+'''
+import time
+import logging
+import numpy as np
+from collections import deque
+
+# caen_felib.error.ErrorCode values, kept here as importing caen_felib loads the FeLib library
+TIMEOUT = -11
+STOP    = -12
+
+
+class SimError(RuntimeError):
+    '''
+    Stand-in for caen_felib.error.Error, raised by the simulated endpoint with a FeLib error code.
+    '''
+    def __init__(self, message: str, code: int, func: str):
+        super().__init__(message)
+        self.code = code
+        self.func = func
+
+
+class SimValue:
+    '''
+    Stand-in for a FeLib parameter node, holding its value as a string.
+    '''
+    __slots__ = ('value',)
+
+    def __init__(self, value: str = ''):
+        self.value = value
+
+
+class SimParameters:
+    '''
+    Parameter folder, parameters are created on first access as FeLib nodes always exist.
+    '''
+    def __init__(self, **defaults):
+        object.__setattr__(self, 'values', {name : SimValue(str(v)) for name, v in defaults.items()})
+
+    def __getattr__(self, name: str) -> SimValue:
+        return self.values.setdefault(name.upper(), SimValue())
+
+    def get(self, name: str, default = None):
+        value = self.values.get(name.upper())
+        return default if (value is None or value.value == '') else value.value
+
+
+class SimChannel:
+    def __init__(self):
+        self.par = SimParameters(CH_ENABLED = 'FALSE', CH_SELF_TRG_ENABLE = 'FALSE', CH_TRG_GLOBAL_GEN = 'FALSE',
+                                 CH_THRESHOLD = 0, CH_POLARITY = 'POLARITY_POSITIVE', CH_PRETRIG = 0)
+
+
+class SimCommands:
+    '''
+    Command folder, each command calls back into the device.
+    '''
+    def __init__(self, device):
+        self.device = device
+
+    def RESET(self):
+        self.device.armed = False
+
+    def CALIBRATEADC(self):
+        pass
+
+    def ARMACQUISITION(self):
+        self.device.arm()
+
+    def DISARMACQUISITION(self):
+        self.device.disarm()
+
+    def SENDSWTRIGGER(self):
+        self.device.sw_trigger()
+
+    # generation 2 acquisition runs from arm to disarm, started and stopped in between
+    def SWSTARTACQUISITION(self):
+        pass
+
+    def SWSTOPACQUISITION(self):
+        pass
+
+    def __getattr__(self, name: str):
+        if name.isupper():
+            raise AttributeError(name)
+        return getattr(self, name.upper())
+
+
+class SimData:
+    '''
+    Buffer for one field of the data format, as returned by set_read_data_format.
+    '''
+    def __init__(self, name: str, value: np.ndarray):
+        self.name  = name
+        self.value = value
+
+
+class SimEndpoint:
+    '''
+    Endpoint generating events into the data passed to read_data.
+    '''
+    def __init__(self, device):
+        self.device = device
+        self.fmt    = []
+
+    def set_read_data_format(self, fmt: list) -> tuple:
+        from felib.formats import NUMPY_TYPES
+        self.fmt = fmt
+        return tuple(SimData(f['name'], np.zeros(f.get('shape', []), dtype=NUMPY_TYPES[f['type']])) for f in fmt)
+
+    def has_data(self, timeout: int) -> bool:
+        return self.device.wait_trigger(timeout / 1000)
+
+    def read_data(self, timeout: int, data):
+        if not self.device.wait_trigger(timeout / 1000):
+            raise SimError('Timeout', TIMEOUT, 'CAEN_FELib_ReadData')
+        self.device.fill_event({d.name : d.value for d in data})
+
+
+class SimEndpoints(dict):
+    '''
+    Endpoint folder, by case insensitive name, with the ActiveEndpoint parameter of generation 2.
+    '''
+    def __init__(self, endpoints: dict):
+        super().__init__({name.upper() : endpoint for name, endpoint in endpoints.items()})
+        self.par = SimParameters()
+
+    def __getitem__(self, name: str):
+        return super().__getitem__(name.upper())
+
+
+# FWTYPE reported by generation 2 boards
+DIG2_FIRMWARE = {'SCOPE' : 'Scope', 'DPP-PSD' : 'DPP_PSD'}
+
+
+class SimDevice:
+    '''
+    Simulated FeLib digitiser.
+    '''
+    def __init__(self, dig_dict: dict):
+        self.firmware    = dig_dict.get('sim_firmware', 'SCOPE')
+        self.rate        = float(dig_dict.get('sim_rate', 1000))
+        self.n_ch        = int(dig_dict.get('sim_n_ch', 8))
+        self.sample_rate = float(dig_dict.get('sim_sample_rate', 500))
+        self.adc_bits    = int(dig_dict.get('sim_adc_bits', 14))
+        self.buffer      = int(dig_dict.get('sim_buffer', 1024))
+        self.jitter      = int(dig_dict.get('sim_jitter', 4))
+        self.gen         = int(dig_dict.get('dig_gen', 1))
+
+        fwtype   = self.firmware if self.gen == 1 else DIG2_FIRMWARE[self.firmware]
+        self.par = SimParameters(FWTYPE = fwtype, NUMCH = self.n_ch, ADC_SAMPLRATE = self.sample_rate,
+                                 ADC_NBIT = self.adc_bits, RECLEN = 1024, POSTTRG = 512,
+                                 TRG_SW_ENABLE = 'FALSE', STARTMODE = 'START_MODE_SW', WAVEFORMS = 'FALSE')
+        self.cmd      = SimCommands(self)
+        self.ch       = [SimChannel() for _ in range(self.n_ch)]
+        self.vtrace   = [SimChannel()]
+        self.endpoint = SimEndpoints({self.firmware.replace('-', '') : SimEndpoint(self)})
+
+        self.rng      = np.random.default_rng()
+        self.armed    = False
+        self.triggers = deque()     # software triggers waiting to be read
+        self.pending  = deque()     # DPP-PSD channels of the current trigger still to be read
+        self.t_pending = 0
+        self.n_events = 0
+        self.n_lost   = 0           # self-triggers dropped as the board buffer was full
+
+    def close(self):
+        self.armed = False
+
+    def arm(self):
+        '''
+        Latch the configuration, as the board does when armed, and prepare the waveform generation.
+        '''
+        ns_per_sample  = 1e3 / self.sample_rate
+        reclen, pre_trigger, negative = self.latch_dig1() if self.gen == 1 else self.latch_dig2()
+        # SCOPE always records every enabled channel
+        if self.firmware == 'SCOPE' and self.self_trig:
+            self.self_trig = self.enabled
+
+        # pulse position from the pre-trigger
+        self.reclen         = int(reclen / ns_per_sample)
+        self.trigger_sample = min(max(int(pre_trigger / ns_per_sample), 0), self.reclen - 1)
+
+        # baseline near the bottom (positive) or top (negative) of the ADC range
+        full_scale    = 2 ** self.adc_bits - 1
+        self.polarity = np.where(negative, -1, 1)
+        self.baseline = np.where(self.polarity > 0, 0.1 * full_scale, 0.9 * full_scale)
+        self.max_amp  = 0.8 * full_scale
+
+        # noise bank sampled with a random offset per event, avoiding per-event RNG calls on every sample
+        self.noise    = self.rng.normal(0, 3, 16 * self.reclen + self.reclen).astype(np.float32)
+        # pulse shape: fast rise, exponential decay
+        t = np.arange(self.reclen - self.trigger_sample, dtype=np.float32)
+        self.template = (1 - np.exp(-t / 2)) * np.exp(-t / 40)
+        self.template /= self.template.max()
+
+        self.t0           = time.perf_counter()
+        self.next_trigger = self.t0
+        self.triggers.clear()
+        self.pending.clear()
+        self.armed        = True
+
+    def latch_dig1(self) -> tuple:
+        '''
+        Trigger settings of a generation 1 board, returning its record length and pre-trigger (ns)
+        and which channels are negative.
+        '''
+        self.sw_mode   = self.par.TRG_SW_ENABLE.value == 'TRUE'
+        self.enabled   = [i for i, ch in enumerate(self.ch) if ch.par.CH_ENABLED.value == 'TRUE']
+        self.self_trig = [i for i in self.enabled
+                          if 'TRUE' in (self.ch[i].par.CH_SELF_TRG_ENABLE.value, self.ch[i].par.CH_TRG_GLOBAL_GEN.value)]
+        reclen = int(self.par.RECLEN.value)
+        if self.firmware == 'DPP-PSD':
+            pre_trigger = int(self.ch[self.enabled[0]].par.CH_PRETRIG.value) if self.enabled else 0
+        else:
+            pre_trigger = reclen - int(self.par.POSTTRG.value)
+        negative = [ch.par.CH_POLARITY.value == 'POLARITY_NEGATIVE' for ch in self.ch]
+        return reclen, pre_trigger, negative
+
+    def latch_dig2(self) -> tuple:
+        '''
+        As latch_dig1, for a generation 2 board.
+        '''
+        self.enabled = [i for i, ch in enumerate(self.ch) if ch.par.get('ChEnable', '').lower() == 'true']
+        if self.firmware == 'DPP-PSD':
+            self.sw_mode   = self.par.get('GlobalTriggerSource', '') == 'SwTrg'
+            self.self_trig = [i for i in self.enabled if self.ch[i].par.get('EventTriggerSource') == 'ChSelfTrigger']
+            first    = self.ch[self.enabled[0]].par if self.enabled else SimParameters()
+            reclen   = int(first.get('ChRecordLengthT', 1024))
+            pre_trigger = int(first.get('ChPreTriggerT', 0))
+            negative = [ch.par.get('PulsePolarity') == 'Negative' for ch in self.ch]
+        else:
+            source = self.par.get('AcqTriggerSource', '')
+            mask   = int(self.par.get('ITLAMask', 0))
+            self.sw_mode   = 'SwTrg' in source
+            self.self_trig = [i for i in self.enabled if 'ITLA' in source and mask >> i & 1]
+            reclen   = int(self.par.get('RecordLengthT', 1024))
+            pre_trigger = int(self.par.get('PreTriggerT', 0))
+            negative = [ch.par.get('SelfTriggerEdge') == 'Fall' for ch in self.ch]
+        return reclen, pre_trigger, negative
+
+    def disarm(self):
+        if self.armed:
+            logging.info(f'Simulated digitiser disarmed: {self.n_events} events generated, {self.n_lost} lost to a full buffer.')
+        self.armed = False
+
+    def sw_trigger(self):
+        if self.armed and self.sw_mode:
+            self.triggers.append(time.perf_counter())
+
+    def wait_trigger(self, timeout: float) -> bool:
+        '''
+        Wait until an event is available, up to timeout (s).
+        '''
+        if not self.armed:
+            time.sleep(timeout)
+            return False
+        if self.pending:
+            return True
+        if self.sw_mode or not self.self_trig:
+            if self.triggers:
+                return True
+            time.sleep(timeout)
+            return False
+
+        now = time.perf_counter()
+        # drop triggers the board had no room for
+        if self.rate > 0 and (now - self.next_trigger) * self.rate > self.buffer:
+            lost = int((now - self.next_trigger) * self.rate) - self.buffer
+            self.n_lost       += lost
+            self.next_trigger += lost / self.rate
+        wait = self.next_trigger - now
+        if wait > timeout:
+            time.sleep(timeout)
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def next_time(self) -> float:
+        '''
+        Pop the time of the event being read.
+        '''
+        if self.sw_mode or not self.self_trig:
+            return self.triggers.popleft()
+        t = self.next_trigger
+        self.next_trigger += self.rng.exponential(1 / self.rate) if self.rate > 0 else 0
+        return t
+
+    def waveform(self, out: np.ndarray, ch: int, amplitude: float):
+        '''
+        Fill out with noise on the baseline of ch, plus a pulse of the given amplitude.
+        '''
+        offset = self.rng.integers(0, len(self.noise) - self.reclen)
+        wf     = self.noise[offset : offset + self.reclen] + self.baseline[ch]
+        wf[self.trigger_sample:] += self.polarity[ch] * amplitude * self.template
+        n = min(len(out), self.reclen)
+        out[:n] = wf[:n]
+
+    def amplitude(self) -> float:
+        return min(self.rng.exponential(0.2 * self.max_amp), self.max_amp)
+
+    def fill_event(self, fields: dict):
+        '''
+        Generate the next event into the fields of the data format.
+        '''
+        if self.firmware == 'DPP-PSD' and not self.pending:
+            self.t_pending = self.next_time()
+            self.pending.extend(self.self_trig or self.enabled)
+        t = self.t_pending if self.firmware == 'DPP-PSD' else self.next_time()
+        self.n_events += 1
+        fields['TIMESTAMP'][...] = int((t - self.t0) * self.sample_rate * 1e6)
+
+        match self.firmware:
+            case 'SCOPE':
+                for ch in self.enabled:
+                    amplitude = self.amplitude() if ch in self.self_trig else 0
+                    self.waveform(fields['WAVEFORM'][ch], ch, amplitude)
+                fields['WAVEFORM_SIZE'][...] = 0
+                fields['WAVEFORM_SIZE'][self.enabled] = self.reclen
+                if 'EVENT_SIZE' in fields:
+                    fields['EVENT_SIZE'][...] = len(self.enabled) * self.reclen * 2
+            case 'DPP-PSD':
+                # one channel per event, as DPP-PSD triggers per channel
+                ch = self.pending.popleft()
+                fields['TIMESTAMP'][...] = int(fields['TIMESTAMP']) + int(self.rng.integers(0, self.jitter + 1))
+                amplitude = self.amplitude()
+                self.waveform(fields['ANALOG_PROBE_1'], ch, amplitude)
+                fields['CHANNEL'][...]       = ch
+                fields['ENERGY'][...]        = int(amplitude)
+                fields['WAVEFORM_SIZE'][...] = self.reclen
+            case _:
+                logging.error(f"Simulated firmware {self.firmware} not recognised.")
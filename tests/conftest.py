@@ -0,0 +1,33 @@
+'''
+Shared fixtures of the tests, which run without a digitiser attached.
+'''
+import numpy as np
+import pytest
+
+from core.ring import EventRing
+import felib.formats as formats
+
+
+@pytest.fixture
+def make_ring():
+    '''
+    make_ring(n_slots, samples, channels) builds a SCOPE ring with a flat baseline on every
+    channel, each slot's timestamp being its index.
+    '''
+    def make(n_slots: int = 64, samples: int = 128, channels: int = 2, baseline: int = 8000) -> EventRing:
+        ring = EventRing(formats.SCOPE(channels, samples), n_slots, {ch : ch for ch in range(channels)}, formats.SCOPE_LAYOUT)
+        ring.waveform[:]      = baseline
+        ring.waveform_size[:] = samples
+        ring.timestamp[:]     = np.arange(n_slots)
+        return ring
+    return make
+
+
+@pytest.fixture
+def make_dpp_ring():
+    '''
+    make_dpp_ring(n_slots, samples, channels) builds a DPP-PSD ring, a channel per slot.
+    '''
+    def make(n_slots: int = 64, samples: int = 128, channels: int = 2) -> EventRing:
+        return EventRing(formats.DPP(channels, samples), n_slots, {ch : ch for ch in range(channels)}, formats.DPP_LAYOUT)
+    return make
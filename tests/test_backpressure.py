@@ -0,0 +1,147 @@
+import time
+import numpy as np
+import pytest
+from queue import Queue
+from threading import Event, Thread
+
+from core.worker import AcquisitionWorker
+
+
+def make_worker(policy: str, tmp_path, recording: bool = True) -> AcquisitionWorker:
+    '''
+    Worker outside of its thread, handing readouts to a buffer of 4, past the high-water
+    mark once more than half of a ring's slots are held.
+    '''
+    worker = AcquisitionWorker(cmd_buffer     = Queue(),
+                               display_buffer = Queue(maxsize=4),
+                               stop_event     = Event(),
+                               sw_timeout     = 0,
+                               recording      = Event(),
+                               backpressure   = policy,
+                               high_water     = 0.5,
+                               spill_dir      = str(tmp_path))
+    if recording:
+        worker.recording.set()
+    return worker
+
+
+def read_out(worker: AcquisitionWorker, ring, n: int = 4) -> np.ndarray:
+    '''
+    Hand a readout of n slots, their timestamps being their slot numbers, to the worker.
+    '''
+    slots = ring.claim(n)
+    ring.timestamp[slots] = slots
+    worker.put_readout(ring, slots)
+    return slots
+
+
+def take(worker: AcquisitionWorker) -> list:
+    '''
+    Empty the buffer as the event builder would, releasing the slots, returning their timestamps.
+    '''
+    taken = []
+    while not worker.display_buffer.empty():
+        ring, slots = worker.display_buffer.get_nowait()
+        taken.append(ring.timestamp[slots].tolist())
+        ring.release(slots)
+    return taken
+
+
+def test_not_recording_drops_oldest(make_ring, tmp_path):
+    worker = make_worker('block', tmp_path, recording=False)
+    ring   = make_ring(n_slots=32)
+    for _ in range(5):
+        read_out(worker, ring)
+
+    assert worker.n_dropped.value == 4
+    assert take(worker) == [[4, 5, 6, 7], [8, 9, 10, 11], [12, 13, 14, 15], [16, 17, 18, 19]]
+    assert ring.n_used == 0
+
+
+def test_block_waits_for_room(make_ring, tmp_path):
+    worker = make_worker('block', tmp_path)
+    ring   = make_ring(n_slots=16)
+    read_out(worker, ring)
+    read_out(worker, ring)
+
+    # a third readout takes the ring past half full, and waits for the event builder
+    blocked = Thread(target=read_out, args=(worker, ring))
+    blocked.start()
+    time.sleep(0.05)
+    assert blocked.is_alive()
+    assert worker.display_buffer.qsize() == 2
+
+    taken = take(worker)
+    blocked.join(timeout=2)
+    assert not blocked.is_alive()
+    taken += take(worker)
+    assert taken == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11]]
+    assert worker.t_blocked.value >= 0.05
+    assert worker.n_lost.value == 0
+
+
+def test_block_released_by_stop(make_ring, tmp_path):
+    worker = make_worker('block', tmp_path, recording=False)
+    ring   = make_ring(n_slots=16)
+    read_out(worker, ring, 12)
+    worker.recording.set()
+
+    blocked = Thread(target=read_out, args=(worker, ring))
+    blocked.start()
+    worker.stop_event.set()
+    blocked.join(timeout=2)
+    assert not blocked.is_alive()
+
+
+def test_spill_keeps_every_readout_in_order(make_ring, tmp_path):
+    worker = make_worker('spill', tmp_path)
+    ring   = make_ring(n_slots=16)
+    read_out(worker, ring)
+    read_out(worker, ring)
+    # past the high-water mark, spilled and its slots freed
+    read_out(worker, ring)
+    assert worker.spilled() == 4
+    assert ring.n_used == 8
+
+    taken = take(worker)
+    # with room again, still spilled until the backlog is fed back
+    read_out(worker, ring)
+    assert worker.spilled() == 8
+    assert worker.display_buffer.empty()
+
+    worker.unspill()
+    assert worker.spilled() == 0
+    taken += take(worker)
+    # fed back in batches of up to spill_batch
+    assert sum(taken, []) == list(range(16))
+    assert worker.n_spilled.value == 8
+    assert worker.n_lost.value == 0
+    assert ring.n_used == 0
+
+
+def test_spill_drained_on_exit(make_ring, tmp_path):
+    worker = make_worker('spill', tmp_path)
+    ring   = make_ring(n_slots=16)
+    for _ in range(3):
+        read_out(worker, ring)
+    take(worker)
+
+    worker.drain_spills(timeout=1)
+    assert take(worker) == [[8, 9, 10, 11]]
+    assert worker.spills == {}
+
+
+def test_alert_drops_oldest(make_ring, tmp_path):
+    worker = make_worker('alert', tmp_path)
+    ring   = make_ring(n_slots=16)
+    for _ in range(3):
+        read_out(worker, ring)
+
+    assert worker.n_lost.value == 4
+    assert worker.n_dropped.value == 0
+    assert take(worker) == [[4, 5, 6, 7], [8, 9, 10, 11]]
+    assert ring.n_used == 0
+
+
+def test_unknown_policy_blocks(tmp_path):
+    assert make_worker('wait', tmp_path).backpressure == 'block'
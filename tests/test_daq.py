@@ -0,0 +1,86 @@
+import os
+import time
+import numpy as np
+import pytest
+from threading import Thread
+
+from core.daq import DAQ
+
+CARP_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+
+@pytest.fixture
+def daq(tmp_path, monkeypatch):
+    '''
+    DAQ on the simulated digitiser, never connected, writing to tmp_path with small flushes.
+    '''
+    monkeypatch.setenv('CARP_DIR', str(tmp_path))
+    (tmp_path / 'log').mkdir()
+    with open(os.path.join(CARP_DIR, 'configs', 'recording', 'scope_a4818_V1730_SELFTRIG.conf')) as f:
+        rec_config = f.read()
+    rec_config = rec_config.replace("'../CARP_FILES/SCOPE_testing/a4818test'", repr(str(tmp_path / 'run')))
+    rec_config = rec_config.replace('h5_flush_size = 10000', 'h5_flush_size = 16')
+    (tmp_path / 'rec.conf').write_text(rec_config)
+
+    daq = DAQ(os.path.join(CARP_DIR, 'configs', 'debug.conf'), str(tmp_path / 'rec.conf'))
+    daq.record_timeout = 0.05
+    yield daq
+    daq.shutdown()
+
+
+def dispatch(daq, ring, n_events, readout = 8, timeout = 5):
+    '''
+    Claim and dispatch n_events in readouts, as the event builder would, waiting up to timeout (s)
+    for free slots. Returns whether every readout could be claimed, ie. no slots were left held.
+    '''
+    deadline = time.perf_counter() + timeout
+    for evt in range(0, n_events, readout):
+        while (slots := ring.claim(readout)) is None:
+            if time.perf_counter() > deadline:
+                return False
+            time.sleep(1e-3)
+        daq.dispatch(ring, slots, evt + np.arange(len(slots)))
+    return True
+
+
+def test_dead_writer_releases_slots(daq, make_ring):
+    '''
+    Once the writer has died, recording neither blocks nor holds on to the ring slots.
+    '''
+    ring = make_ring(64, 64, 2)
+
+    def fail():
+        raise OSError('disk full')
+    daq.writer.write_h5 = fail
+    daq.start_recording()
+
+    t0 = time.perf_counter()
+    # far more than the ring and the writer buffer hold
+    assert dispatch(daq, ring, 4096)
+    assert time.perf_counter() - t0 < 10
+    assert not daq.writer.is_alive()
+    assert ring.n_used == 0
+    assert daq.writer_buffer.empty()
+    assert daq.n_lost.value > 0
+
+    daq.stop_recording()
+    assert ring.n_used == 0
+
+
+def test_stop_recording_while_dispatching(daq, make_ring):
+    '''
+    Stopping the recording while events are dispatched leaves nothing held by the writer.
+    '''
+    ring = make_ring(64, 64, 2)
+    daq.start_recording()
+
+    dispatcher = Thread(target=dispatch, args=(daq, ring, 2048))
+    dispatcher.start()
+    time.sleep(0.05)
+    daq.stop_recording()
+    dispatcher.join(timeout=10)
+
+    assert not dispatcher.is_alive()
+    assert not daq.writer.is_alive()
+    assert daq.writer_buffer.empty()
+    assert ring.n_used == 0
@@ -0,0 +1,178 @@
+import time
+import numpy as np
+import pytest
+from queue import Queue
+from threading import Event
+
+from core.event_builder import EventBuilder
+
+
+@pytest.fixture
+def builder():
+    '''
+    Builder of 2 channels with a 5 tick window, outside of its thread, and what it dispatched.
+    '''
+    dispatched = []
+    builder = EventBuilder(Queue(), lambda ring, slots, evts: dispatched.append((ring, slots, evts)),
+                           Event(), channels=[0, 1], window=5, idle_timeout=0.2)
+    return builder, dispatched
+
+
+def read_out(ring, chs: list, ts: list) -> np.ndarray:
+    '''
+    Claim slots holding the given channels and timestamps.
+    '''
+    slots = ring.claim(len(chs))
+    ring.channel[slots]   = chs
+    ring.timestamp[slots] = ts
+    return slots
+
+
+def events(ring, dispatched: list) -> dict:
+    '''
+    {event number : [(channel, timestamp), ...]} of everything dispatched.
+    '''
+    built = {}
+    for _, slots, evts in dispatched:
+        for slot, evt in zip(slots, evts):
+            built.setdefault(int(evt), []).append((int(ring.channel[slot]), int(ring.timestamp[slot])))
+    return built
+
+
+def test_window_grouping(builder, make_dpp_ring):
+    builder, dispatched = builder
+    ring = make_dpp_ring()
+    builder.add(ring, read_out(ring, [0, 1, 0, 1], [100, 104, 200, 203]))
+    builder.build()
+
+    assert events(ring, dispatched) == {0 : [(0, 100), (1, 104)], 1 : [(0, 200), (1, 203)]}
+    assert (builder.n_complete, builder.n_partial) == (2, 0)
+
+
+def test_fragments_sorted_across_readouts(builder, make_dpp_ring):
+    builder, dispatched = builder
+    ring = make_dpp_ring()
+    # ch1 reads out first, each channel is in time order
+    builder.add(ring, read_out(ring, [1, 1], [102, 300]))
+    builder.add(ring, read_out(ring, [0, 0], [100, 298]))
+    builder.build()
+
+    assert events(ring, dispatched) == {0 : [(0, 100), (1, 102)], 1 : [(0, 298), (1, 300)]}
+
+
+def test_outside_window_is_another_event(builder, make_dpp_ring):
+    builder, dispatched = builder
+    ring = make_dpp_ring()
+    builder.add(ring, read_out(ring, [0, 1, 0, 1], [100, 106, 200, 200]))
+    builder.build()
+
+    built = events(ring, dispatched)
+    assert built[0] == [(0, 100)]
+    assert built[1] == [(1, 106)]
+    assert (builder.n_complete, builder.n_partial) == (1, 2)
+
+
+def test_channel_twice_in_window_is_not_complete(builder, make_dpp_ring):
+    builder, dispatched = builder
+    ring = make_dpp_ring()
+    # ch0 piles up, two fragments in the window still leave ch1 missing
+    builder.add(ring, read_out(ring, [0, 0], [100, 103]))
+    builder.build()
+    assert dispatched == []
+
+    builder.add(ring, read_out(ring, [1], [104]))
+    builder.build()
+    assert events(ring, dispatched) == {0 : [(0, 100), (0, 103), (1, 104)]}
+    assert (builder.n_complete, builder.n_partial) == (1, 0)
+
+
+def test_watermark_holds_incomplete_events(builder, make_dpp_ring):
+    builder, dispatched = builder
+    ring = make_dpp_ring()
+    builder.add(ring, read_out(ring, [0, 1, 0], [100, 100, 300]))
+    builder.build()
+    # ch1 may still read out an event at 300
+    assert builder.watermark() == 100
+    assert events(ring, dispatched) == {0 : [(0, 100), (1, 100)]}
+
+    builder.add(ring, read_out(ring, [1, 0], [400, 500]))
+    builder.build()
+    # every channel is past 300, so it's emitted without ch1, 400 and 500 are still held
+    assert builder.watermark() == 400
+    assert events(ring, dispatched)[1] == [(0, 300)]
+    assert builder.stats()['buffered'] == 2
+    assert builder.n_partial == 1
+
+
+def test_quiet_channel_stops_holding_back(builder, make_dpp_ring):
+    builder, dispatched = builder
+    ring = make_dpp_ring()
+    builder.add(ring, read_out(ring, [0, 1], [100, 100]))
+    builder.build()
+    time.sleep(0.25)
+    # ch1 has gone quiet, only ch0 holds events back
+    builder.add(ring, read_out(ring, [0, 0], [200, 300]))
+    builder.build()
+
+    assert builder.watermark() == 300
+    assert events(ring, dispatched)[1] == [(0, 200)]
+
+
+def test_orphans(builder, make_dpp_ring):
+    builder, dispatched = builder
+    ring = make_dpp_ring()
+    builder.add(ring, read_out(ring, [0, 1, 0, 1], [100, 100, 200, 200]))
+    builder.build()
+    # ch1 fragment within the emitted event's window, read out late
+    builder.add(ring, read_out(ring, [1, 1], [203, 300]))
+
+    assert builder.n_orphans == 1
+    assert events(ring, dispatched)[2] == [(1, 203)]
+
+    builder.build(flush=True)
+    assert events(ring, dispatched)[3] == [(1, 300)]
+    assert builder.stats() == {'events' : 4, 'complete' : 2, 'partial' : 1, 'orphans' : 1, 'forced' : 0, 'buffered' : 0}
+
+
+def test_timestamp_reset_emits_everything(builder, make_dpp_ring):
+    builder, dispatched = builder
+    ring = make_dpp_ring()
+    builder.add(ring, read_out(ring, [0, 1, 0], [100, 100, 200]))
+    builder.build()
+    # a new run starts from 0
+    builder.add(ring, read_out(ring, [0, 1], [10, 12]))
+    builder.build()
+
+    built = events(ring, dispatched)
+    assert built[1] == [(0, 200)]
+    assert built[2] == [(0, 10), (1, 12)]
+    assert builder.n_orphans == 0
+
+
+def test_scope_fragments_are_complete(make_ring):
+    dispatched = []
+    builder = EventBuilder(Queue(), lambda ring, slots, evts: dispatched.append((slots, evts)),
+                           Event(), channels=[0, 1], window=0)
+    ring  = make_ring(n_slots=8, channels=2)
+    slots = ring.claim(3)
+    builder.add(ring, slots)
+    builder.build()
+
+    (slots_out, evts), = dispatched
+    np.testing.assert_array_equal(slots_out, slots)
+    np.testing.assert_array_equal(evts, [0, 1, 2])
+    assert builder.n_complete == 3
+
+
+def test_depth_forces_oldest_out(make_dpp_ring):
+    dispatched = []
+    builder = EventBuilder(Queue(), lambda ring, slots, evts: dispatched.append(evts),
+                           Event(), channels=[0, 1], window=0, depth=2)
+    ring = make_dpp_ring()
+    # ch1 never reads out, but hasn't gone quiet
+    builder.add(ring, read_out(ring, [0, 0, 0, 0], [100, 200, 300, 400]))
+    builder.build()
+
+    assert builder.n_forced == 2
+    np.testing.assert_array_equal(np.concatenate(dispatched), [0, 1])
+    assert builder.stats()['buffered'] == 2
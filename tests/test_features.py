@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from core.features import FeatureExtractor, feature_dtype
+
+
+@pytest.fixture
+def rec_config():
+    '''
+    128 samples of 1 ns with the trigger at sample 32, the baseline over samples 0-23,
+    a short gate over samples 24-47 and a long one over 32-95.
+    '''
+    return {'record_length' : 128,
+            'pre_trigger'   : 32,
+            'features'      : {'gates' : [(-8, 16), (0, 64)], 'baseline_margin' : 8},
+            'ch0'           : {'polarity' : 'positive'},
+            'ch1'           : {'polarity' : 'negative'}}
+
+
+def pulses(sign: int) -> np.ndarray:
+    '''
+    Two waveforms on a baseline of 1000 with a noisy pre-trigger: a pulse of 100 peaking at 50
+    on sample 41, and the same with a second pulse of 20 on sample 70, past the short gate.
+    '''
+    wf = np.full((2, 128), 1000, dtype=np.int64)
+    wf[:, :24:2] += 3
+    wf[:, 1:24:2] -= 3
+    wf[:, 40:44] += sign * np.array([10, 50, 30, 10])
+    wf[1, 70]    += sign * 20
+    return wf.astype(np.uint16)
+
+
+def test_gates_in_samples(rec_config):
+    extractor = FeatureExtractor(rec_config, 128)
+    assert extractor.n_baseline == 24
+    assert extractor.gates == [(24, 48), (32, 96)]
+    # samples are 2 ns at half the size
+    extractor = FeatureExtractor(rec_config, 64)
+    assert extractor.n_baseline == 12
+    assert extractor.gates == [(12, 24), (16, 48)]
+
+
+@pytest.mark.parametrize('ch, sign', [(0, 1), (1, -1)], ids=['positive', 'negative'])
+def test_extract(rec_config, ch, sign):
+    extractor = FeatureExtractor(rec_config, 128)
+    out = np.zeros(2, dtype=feature_dtype(2))
+    extractor.extract(pulses(sign), ch, out)
+
+    np.testing.assert_array_equal(out['baseline'],    [1000, 1000])
+    np.testing.assert_array_equal(out['amplitude'],   [50, 50])
+    np.testing.assert_array_equal(out['peak_sample'], [41, 41])
+    np.testing.assert_array_equal(out['charge'],      [[100, 100], [100, 120]])
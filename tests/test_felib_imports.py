@@ -0,0 +1,32 @@
+import os
+import sys
+import types
+import subprocess
+
+from felib.readers import felib_error_code
+from felib.simulator import SimError, TIMEOUT, STOP
+
+CARP_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+
+def test_core_imports_without_felib():
+    '''
+    The acquisition core and the simulated digitiser run on machines without FeLib,
+    importing caen_felib (which loads the library) only to connect to hardware.
+    '''
+    code   = "import sys; sys.modules['caen_felib'] = None; sys.path.insert(0, '.'); import core.daq"
+    result = subprocess.run([sys.executable, '-c', code], cwd=CARP_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_error_codes(monkeypatch):
+    assert felib_error_code(SimError('Timeout', TIMEOUT, 'CAEN_FELib_ReadData')) == TIMEOUT
+    assert felib_error_code(RuntimeError('not FeLib')) is None
+
+    # errors raised by FeLib, once connecting to hardware has imported it
+    class Error(Exception):
+        def __init__(self, code):
+            self.code = code
+    monkeypatch.setitem(sys.modules, 'caen_felib.error', types.SimpleNamespace(Error=Error))
+    assert felib_error_code(Error(STOP)) == STOP
+    assert felib_error_code(RuntimeError('not FeLib')) is None
@@ -0,0 +1,10 @@
+import pytest
+
+import felib.formats as formats
+
+
+@pytest.mark.parametrize('data_format', [formats.SCOPE, formats.DPP, formats.DIG2_SCOPE, formats.DIG2_DPP],
+                         ids=lambda data_format: data_format.__name__)
+def test_every_field_has_its_dim(data_format):
+    for field in data_format(4, 128):
+        assert field['dim'] == len(field.get('shape', [])), field['name']
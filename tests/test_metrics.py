@@ -0,0 +1,55 @@
+import json
+import urllib.request
+import pytest
+
+from core.metrics import Registry, MetricsServer, SnapshotWriter
+
+
+def strict_loads(text: str):
+    '''
+    json.loads rejecting NaN and Infinity, as standard JSON parsers do.
+    '''
+    def reject(constant):
+        raise ValueError(f'{constant} is not valid JSON')
+    return json.loads(text, parse_constant=reject)
+
+
+@pytest.fixture
+def registry():
+    '''
+    Registry with a latency histogram yet to see an event, and a gauge reading nan.
+    '''
+    registry = Registry()
+    registry.latency('disk_latency_seconds', 'Readout to disk latency.')
+    registry.gauge('writer_cpu_percent', 'Writer CPU use.', fn = lambda: float('nan'))
+    registry.counter('events_read_total', 'Events read.').add(3)
+    return registry
+
+
+def test_empty_latency_summary(registry):
+    assert registry.snapshot()['disk_latency_seconds'] == {'count' : 0, 'p50' : None, 'p99' : None, 'max' : None}
+    registry.latency('disk_latency_seconds').add(1e-3)
+    summary = registry.snapshot()['disk_latency_seconds']
+    assert summary['count'] == 1
+    assert summary['p50'] == pytest.approx(1e-3, rel=0.05)
+
+
+def test_metrics_json_is_valid_before_any_event(registry):
+    server = MetricsServer(registry)
+    server.start()
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.port}/metrics.json', timeout=5) as response:
+            metrics = strict_loads(response.read().decode())
+    finally:
+        server.stop()
+    assert metrics['disk_latency_seconds']['p99'] is None
+    assert metrics['writer_cpu_percent'] is None
+    assert metrics['events_read_total'] == 3
+
+
+def test_snapshot_file_is_valid_before_any_event(registry, tmp_path):
+    path = tmp_path / 'metrics.json'
+    SnapshotWriter(registry, str(path)).write()
+    metrics = strict_loads(path.read_text())['metrics']
+    assert metrics['disk_latency_seconds']['max'] is None
+    assert metrics['writer_cpu_percent'] is None
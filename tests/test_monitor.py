@@ -0,0 +1,97 @@
+import json
+import time
+import numpy as np
+import pytest
+from threading import Thread
+
+from core.monitor import MonitorServer, MonitorClient, FRAME
+
+FPS = 50
+
+
+@pytest.fixture
+def server():
+    '''
+    Monitor of channels 0 and 1 on a free localhost port, at FPS frames per second.
+    '''
+    server = MonitorServer(lambda: {'recording' : True, 'events_ps' : 10}, channels=[0, 1],
+                           port=0, fps=FPS, max_points=64)
+    server.start()
+    assert server.listening.wait(timeout=5)
+    yield server
+    server.stop()
+
+
+def read_without_ack(client: MonitorClient) -> dict:
+    '''
+    Header of the next message, leaving it unacknowledged.
+    '''
+    header_len, payload_len = FRAME.unpack(client.read_exactly(FRAME.size))
+    header = json.loads(client.read_exactly(header_len))
+    client.read_exactly(payload_len)
+    return header
+
+
+def test_protocol(server):
+    short = np.arange(32, dtype=np.uint16)
+    long  = (1000 + 100 * np.sin(np.arange(1000) / 50)).astype(np.uint16)
+    long[500] = 0
+    server.push(0, short)
+    server.push(1, long)
+
+    with MonitorClient(port=server.port) as client:
+        assert client.channels == [0, 1]
+        assert client.fps == FPS
+        header, waveforms = client.receive()
+
+    assert header['type'] == 'frame'
+    assert header['status'] == {'recording' : True, 'events_ps' : 10}
+    x, y = waveforms[0]
+    np.testing.assert_array_equal(x, np.arange(32))
+    np.testing.assert_array_equal(y, short)
+
+    # decimated to min/max pairs, keeping the extremes
+    wf = next(wf for wf in header['waveforms'] if wf['ch'] == 1)
+    assert wf['samples'] == 1000
+    x, y = waveforms[1]
+    assert len(y) <= 64
+    assert (y.min(), y.max()) == (0, long.max())
+    assert x[-1] < 1000
+
+
+def test_slow_client_skips_frames_without_blocking(server):
+    pushes = []
+    def push():
+        # as dispatch does, for a second
+        t_end = time.perf_counter() + 1
+        i = 0
+        while time.perf_counter() < t_end:
+            t0 = time.perf_counter()
+            server.push(0, np.full(128, i % 60000, dtype=np.uint16))
+            pushes.append(time.perf_counter() - t0)
+            i += 1
+            time.sleep(1e-4)
+
+    with MonitorClient(port=server.port) as slow, MonitorClient(port=server.port) as fast:
+        pusher = Thread(target=push)
+        pusher.start()
+        # the slow client takes one frame, and doesn't acknowledge it
+        first = read_without_ack(slow)
+        n_fast = 0
+        while pusher.is_alive():
+            fast.receive()
+            n_fast += 1
+        pusher.join()
+
+        # the fast client wasn't held back
+        assert n_fast >= FPS / 2
+        assert max(pushes) < 0.05
+
+        # frames for the slow client were replaced rather than queued
+        slow_client = next(client for client in server.clients if client.n_sent == 1)
+        assert slow_client.n_dropped >= FPS / 2
+        slow.sock.sendall(b'\x01')
+        header = read_without_ack(slow)
+        # the next is the newest, not the frame after the first
+        assert header['time'] - first['time'] >= 0.5
+        assert time.time() - header['time'] < 0.5
@@ -0,0 +1,56 @@
+import time
+import numpy as np
+import tables as tb
+import pytest
+from queue import Queue
+from threading import Event
+
+from core.process_writer import ProcessWriter
+
+
+@pytest.mark.parametrize('ring_slots, readout', [(256, 50), (256, 256), (64, 256)],
+                         ids=['flush_size_readouts', 'whole_ring_readouts', 'blocks_larger_than_slabs'])
+def test_process_writer_more_channels_than_slabs(tmp_path, make_ring, ring_slots, readout):
+    '''
+    8 channels through 4 slabs, in readouts of flush_size / 2 events or of a whole ring, far
+    past flush_size. With ring_slots below the ring's size, blocks are too large for the slabs
+    and sent whole.
+    '''
+    channels, n_slots, samples = 8, 256, 64
+    ring = make_ring(n_slots, samples, channels)
+    ring.waveform[:] = (np.arange(n_slots)[:, None, None] + 100 * np.arange(channels)[None, :, None]).astype(np.uint16)
+
+    write_buffer, stop_event = Queue(), Event()
+    writer = ProcessWriter(ch_map       = {ch : ch for ch in range(channels)},
+                           flush_size   = 100,
+                           write_buffer = write_buffer,
+                           stop_event   = stop_event,
+                           rec_config   = {'file_name' : str(tmp_path / 'run'), 'shm_slabs' : 4,
+                                           'ring_slots' : ring_slots, 'checksum' : False},
+                           dig_config   = {'dig_gen' : 1},
+                           TIMESTAMP    = 'test')
+    writer.start()
+
+    n_events = 3 * n_slots
+    deadline = time.perf_counter() + 30
+    evt = 0
+    while evt < n_events:
+        # the writer releases the slots once copied
+        slots = ring.claim(min(readout, n_events - evt))
+        if slots is None:
+            assert writer.is_alive() and time.perf_counter() < deadline
+            stop_event.wait(0.01)
+            continue
+        write_buffer.put((ring, slots, evt + np.arange(len(slots))))
+        evt += len(slots)
+    stop_event.set()
+    writer.join(timeout=30)
+    assert not writer.is_alive()
+    assert not writer.process.is_alive()
+
+    with tb.open_file(str(tmp_path / 'run_data_test.h5')) as h5file:
+        for ch in range(channels):
+            rows = h5file.get_node(f'/ch_{ch}/rwf').read()
+            assert len(rows) == n_events
+            np.testing.assert_array_equal(rows['evt_no'], np.arange(n_events))
+            np.testing.assert_array_equal(rows['rwf'][:, 0], (rows['evt_no'] % n_slots) + 100 * ch)
@@ -0,0 +1,27 @@
+import pytest
+
+from felib.readers import READERS, Dig1Reader, Dig2Reader, ScopeReader
+
+
+@pytest.mark.parametrize('reader', READERS.values(), ids=lambda reader: reader.__name__)
+def test_readers_implement_every_method(reader):
+    reader(dig=None, params=None)
+
+
+def test_missing_method_fails_on_creation():
+    class NoConfigure(Dig1Reader):
+        endpoint_path = 'SCOPE'
+
+    with pytest.raises(TypeError, match='configure'):
+        NoConfigure(dig=None, params=None)
+
+
+@pytest.mark.parametrize('base', [Dig1Reader, Dig2Reader], ids=['dig1', 'dig2'])
+def test_missing_channel_trigger_fails_on_creation(base):
+    # every other method given
+    class NoChannelTrigger(base):
+        configure      = ScopeReader.configure
+        record_samples = Dig1Reader.record_samples
+
+    with pytest.raises(TypeError, match='channel_trigger'):
+        NoChannelTrigger(dig=None, params=None)
@@ -0,0 +1,33 @@
+import numpy as np
+
+from ui.renderer import Renderer
+
+
+class Screen:
+    '''
+    Screen keeping the persistence images drawn, with their ADC range.
+    '''
+    def __init__(self):
+        self.images = {}
+
+    def set_mode(self, mode):
+        pass
+
+    def update_persistence(self, ch, image, wf_size, adc_range):
+        self.images[ch] = (image, adc_range)
+
+
+def test_persistence_binned_over_the_digitiser_range():
+    screen   = Screen()
+    renderer = Renderer(screen, mode='persistence', persistence={'n_time' : 4, 'n_adc' : 4})
+    # half scale of a 12 bit board, and of a 16 bit one
+    renderer.push(0, np.full(4, 2048, dtype=np.uint16), adc_bits=12)
+    renderer.push(1, np.full(4, 2048, dtype=np.uint16), adc_bits=16)
+    renderer.render()
+
+    image, adc_range = screen.images[0]
+    assert adc_range == 4096
+    np.testing.assert_array_equal(image[:, 2], 1)
+    image, adc_range = screen.images[1]
+    assert adc_range == 65536
+    np.testing.assert_array_equal(image[:, 0], 1)
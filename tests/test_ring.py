@@ -0,0 +1,133 @@
+import numpy as np
+
+from core.ring import SpillFile
+
+
+def test_claim_in_order_without_wrapping(make_ring):
+    ring = make_ring(n_slots=8)
+    np.testing.assert_array_equal(ring.claim(3), [0, 1, 2])
+    np.testing.assert_array_equal(ring.claim(3), [3, 4, 5])
+    # claims stop at the end of the ring, the next starts over from the front
+    np.testing.assert_array_equal(ring.claim(3), [6, 7])
+    assert ring.n_used == 8
+    assert ring.head == 0
+
+
+def test_claim_stops_at_held_slot(make_ring):
+    ring  = make_ring(n_slots=4)
+    slots = ring.claim(4)
+    ring.release(slots[[0, 1, 3]])
+    np.testing.assert_array_equal(ring.claim(4), [0, 1])
+    assert ring.n_used == 3
+
+
+def test_unclaim(make_ring):
+    ring  = make_ring(n_slots=8)
+    slots = ring.claim(5)
+    ring.unclaim(slots[2:])
+    assert ring.n_used == 2
+    assert ring.head == 2
+    np.testing.assert_array_equal(ring.claim(2), [2, 3])
+
+    ring.unclaim(np.empty(0, dtype=np.int64))
+    assert ring.head == 4
+
+
+def test_full_ring(make_ring):
+    ring  = make_ring(n_slots=4)
+    slots = ring.claim(4)
+    assert ring.claim() is None
+    assert ring.n_full == 1
+
+    ring.release(slots[:2])
+    np.testing.assert_array_equal(ring.claim(4), [0, 1])
+    # the next slot is still held, so nothing more until it's released
+    assert ring.claim() is None
+    assert ring.n_full == 2
+
+
+def test_hold_and_release_refcounts(make_ring):
+    ring  = make_ring(n_slots=4)
+    slots = ring.claim(2)
+    # handed to two more consumers
+    ring.hold(slots, 2)
+    np.testing.assert_array_equal(ring.refs[:2], [3, 3])
+
+    ring.release(slots)
+    ring.release(slots[0])
+    np.testing.assert_array_equal(ring.refs[:2], [1, 2])
+    assert ring.n_used == 2
+
+    # freed only once the last reference goes
+    ring.release(slots[0])
+    assert ring.n_used == 1
+    ring.release(slots[1], 2)
+    assert ring.n_used == 0
+    np.testing.assert_array_equal(ring.refs, 0)
+
+
+def test_event(make_ring):
+    ring  = make_ring(n_slots=4, samples=16, channels=3)
+    slots = ring.claim(2)
+    ring.waveform[slots] = np.arange(2 * 3 * 16).reshape(2, 3, 16)
+
+    event = ring.event(1)
+    assert [ch for _, _, ch, _ in event] == [0, 1, 2]
+    wf_size, ADCs, ch, ts = event[2]
+    assert (wf_size, ch, ts) == (16, 2, 1)
+    np.testing.assert_array_equal(ADCs, np.arange(80, 96))
+
+
+def test_waveforms(make_ring):
+    ring  = make_ring(n_slots=4, samples=16, channels=3)
+    slots = ring.claim(2)
+    ring.waveform[slots] = np.arange(2 * 3 * 16).reshape(2, 3, 16)
+    np.testing.assert_array_equal(ring.waveforms(slots, 1), [np.arange(16, 32), np.arange(64, 80)])
+
+
+def test_split_channels(make_ring, make_dpp_ring):
+    scope = make_ring(n_slots=4, channels=2)
+    split = list(scope.split_channels(np.arange(3)))
+    assert [ch for ch, _ in split] == [0, 1]
+    np.testing.assert_array_equal(split[0][1], [0, 1, 2])
+
+    dpp = make_dpp_ring(n_slots=4, channels=2)
+    dpp.channel[:] = [1, 0, 1, 1]
+    split = dict(dpp.split_channels(np.arange(4)))
+    np.testing.assert_array_equal(split[0], [1])
+    np.testing.assert_array_equal(split[1], [0, 2, 3])
+
+
+def test_spill_file_round_trip(make_ring, tmp_path):
+    ring  = make_ring(n_slots=8, samples=16, channels=2)
+    spill = SpillFile(ring, str(tmp_path))
+
+    slots = ring.claim(6)
+    ring.waveform[slots] = np.arange(6)[:, None, None]
+    ring.timestamp[slots] = 100 + slots
+    ring.read_time[slots] = slots / 10
+    spill.write(slots[:4])
+    spill.write(slots[4:])
+    ring.release(slots)
+    ring.waveform[:] = 0
+    assert len(spill) == 6
+    assert ring.n_used == 0
+
+    # copied back oldest first, into newly claimed slots
+    first = spill.read(4)
+    np.testing.assert_array_equal(first, [6, 7])
+    second = spill.read(4)
+    np.testing.assert_array_equal(second, [0, 1, 2, 3])
+    back = np.concatenate([first, second])
+    np.testing.assert_array_equal(ring.waveform[back, 1, 0], np.arange(6))
+    np.testing.assert_array_equal(ring.timestamp[back], 100 + np.arange(6))
+    np.testing.assert_array_equal(ring.read_time[back], np.arange(6) / 10)
+    assert len(spill) == 0
+    assert ring.n_used == 6
+
+    # nothing read back while the ring is full
+    spill.write(back[:2])
+    ring.claim(2)
+    assert spill.read(2) is None
+    assert len(spill) == 2
+    spill.close()
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from core.suppression import ZeroSuppressor
+
+
+@pytest.fixture
+def rec_config():
+    '''
+    128 samples of 1 ns, 32 of them before the trigger. ch0 positive and ch1 negative,
+    both with a 50 ADC threshold, and ch2 never suppressed.
+    '''
+    return {'zero_suppression' : 'drop',
+            'record_length'    : 128,
+            'pre_trigger'      : 32,
+            'ch0' : {'enabled' : True, 'threshold' : 50, 'polarity' : 'positive'},
+            'ch1' : {'enabled' : True, 'threshold' : 50, 'polarity' : 'negative'},
+            'ch2' : {'enabled' : True, 'threshold' : 50, 'zero_suppress' : False}}
+
+
+def test_keep_by_threshold_and_polarity(rec_config, make_ring):
+    ring  = make_ring(n_slots=4, samples=128, channels=3, baseline=8000)
+    slots = ring.claim(3)
+    ring.waveform[0, 0, 60] += 51      # above threshold
+    ring.waveform[1, 0, 60] += 50      # at threshold, suppressed
+    ring.waveform[0, 1, 60] -= 100     # negative pulse
+    ring.waveform[1, 1, 60] += 100     # wrong polarity, suppressed
+    # 55 above 8000, but only 45 above the baseline of the pre-trigger samples
+    ring.waveform[2, 0, :32] += 10
+    ring.waveform[2, 0, 60]  += 55
+
+    keep = ZeroSuppressor(rec_config).keep(ring, slots)
+    np.testing.assert_array_equal(keep, [[True,  True,  True],
+                                         [False, False, True],
+                                         [False, False, True]])
+
+
+def test_keep_dpp_single_column(rec_config, make_dpp_ring):
+    ring  = make_dpp_ring(n_slots=4, samples=128, channels=2)
+    slots = ring.claim(3)
+    ring.channel[slots]       = [0, 1, 1]
+    ring.waveform_size[slots] = 128
+    ring.waveform[slots]      = 1000
+    ring.waveform[0, 60]     += 100
+    ring.waveform[1, 60]     -= 100
+
+    keep = ZeroSuppressor(rec_config).keep(ring, slots)
+    np.testing.assert_array_equal(keep, [[True], [True], [False]])
+
+
+def test_stats(rec_config, make_ring):
+    suppressor = ZeroSuppressor(rec_config)
+    ring = make_ring(n_slots=4, samples=128, channels=3)
+    suppressor.keep(ring, ring.claim(4))
+
+    stats = suppressor.stats()
+    assert (stats['waveforms'], stats['suppressed']) == (12, 8)
+    assert stats['MB_suppressed'] == 8 * 128 * 2 / 1e6
+    assert stats['fraction'] == {0 : 1.0, 1 : 1.0, 2 : 0.0}
+
+
+def test_unknown_mode(rec_config):
+    with pytest.raises(ValueError):
+        ZeroSuppressor(dict(rec_config, zero_suppression='keep'))
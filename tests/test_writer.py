@@ -0,0 +1,150 @@
+import numpy as np
+import tables as tb
+import pytest
+from queue import Queue
+from threading import Event
+
+from core.writer import Writer
+from core.convert import raw_to_h5
+
+CHANNELS = 3
+SAMPLES  = 32
+
+
+def make_writer(path, flush_size: int = 10, **rec_config) -> Writer:
+    '''
+    Writer of 3 channels, with extra recording config keys passed through.
+    '''
+    return Writer(ch_map       = {ch : ch for ch in range(CHANNELS)},
+                  flush_size   = flush_size,
+                  write_buffer = Queue(),
+                  stop_event   = Event(),
+                  rec_config   = {'file_name' : str(path / 'run'), 'checksum' : False,
+                                  'record_length' : SAMPLES, 'pre_trigger' : 8, **rec_config},
+                  dig_config   = {'dig_gen' : 1},
+                  TIMESTAMP    = 'test')
+
+
+@pytest.fixture
+def ring(make_ring):
+    '''
+    Ring whose waveforms encode their slot and channel, slot * 10 + channel, with a pulse on sample 12.
+    '''
+    ring = make_ring(n_slots=64, samples=SAMPLES, channels=CHANNELS)
+    ring.waveform[:] = (10 * np.arange(64)[:, None, None] + np.arange(CHANNELS)[None, :, None])
+    ring.waveform[:, :, 12] += 100
+    ring.timestamp[:] = 1000 + np.arange(64)
+    return ring
+
+
+def record(writer: Writer, ring, n_events: int, readout: int = 8, keep = None):
+    '''
+    Run the writer thread over n_events events read out readout at a time, event numbers
+    starting from 0, each entry carrying keep (called with its slots) if given.
+    '''
+    writer.start()
+    for evt in range(0, n_events, readout):
+        slots = ring.claim(readout)
+        entry = (ring, slots, evt + np.arange(readout))
+        writer.write_buffer.put(entry if keep is None else (*entry, keep(slots)))
+    writer.stop_event.set()
+    writer.join(timeout=10)
+    assert not writer.is_alive()
+    assert ring.n_used == 0
+
+
+def read_h5(path) -> dict:
+    '''
+    {(channel, table) : rows} of an h5 output file.
+    '''
+    with tb.open_file(str(path)) as h5file:
+        return {(int(group._v_name[3:]), table._v_name) : table.read()
+                for group in h5file.root._f_iter_nodes('Group') if group._v_name.startswith('ch_')
+                for table in group._f_iter_nodes('Table')}
+
+
+def test_h5_round_trip(tmp_path, ring):
+    writer = make_writer(tmp_path)
+    record(writer, ring, 40)
+
+    tables = read_h5(tmp_path / 'run_data_test.h5')
+    assert sorted(tables) == [(ch, 'rwf') for ch in range(CHANNELS)]
+    for ch in range(CHANNELS):
+        rows = tables[(ch, 'rwf')]
+        np.testing.assert_array_equal(rows['evt_no'], np.arange(40))
+        np.testing.assert_array_equal(rows['channel'], ch)
+        np.testing.assert_array_equal(rows['timestamp'], 1000 + np.arange(40))
+        np.testing.assert_array_equal(rows['rwf'][:, 0], 10 * np.arange(40) + ch)
+        np.testing.assert_array_equal(rows['rwf'][:, 12], 10 * np.arange(40) + ch + 100)
+
+
+def test_features_without_waveforms(tmp_path, ring):
+    writer = make_writer(tmp_path, features={'gates' : [(0, 8)]}, store_waveforms=False)
+    record(writer, ring, 16)
+
+    tables = read_h5(tmp_path / 'run_data_test.h5')
+    assert sorted(tables) == [(ch, 'features') for ch in range(CHANNELS)]
+    rows = tables[(1, 'features')]
+    np.testing.assert_array_equal(rows['evt_no'], np.arange(16))
+    np.testing.assert_array_equal(rows['baseline'], 10 * np.arange(16) + 1)
+    np.testing.assert_array_equal(rows['amplitude'], 100)
+    np.testing.assert_array_equal(rows['peak_sample'], 12)
+    np.testing.assert_array_equal(rows['charge'][:, 0], 100)
+
+
+@pytest.mark.parametrize('mode', ['drop', 'truncate'])
+def test_zero_suppressed_entries(tmp_path, ring, mode):
+    writer = make_writer(tmp_path, zero_suppression=mode)
+    # ch1 of the even slots kept, every other waveform suppressed
+    def keep(slots):
+        mask = np.zeros((len(slots), CHANNELS), dtype=bool)
+        mask[:, 1] = slots % 2 == 0
+        return mask
+    record(writer, ring, 16, keep=keep)
+
+    tables = read_h5(tmp_path / 'run_data_test.h5')
+    if mode == 'drop':
+        assert len(tables[(0, 'rwf')]) == 0
+        np.testing.assert_array_equal(tables[(1, 'rwf')]['evt_no'], np.arange(0, 16, 2))
+    else:
+        rows = tables[(1, 'rwf')]
+        np.testing.assert_array_equal(rows['evt_no'], np.arange(16))
+        np.testing.assert_array_equal(rows['rwf'][1::2], 0)
+        np.testing.assert_array_equal(rows['rwf'][::2, 0], 10 * np.arange(0, 16, 2) + 1)
+        np.testing.assert_array_equal(tables[(0, 'rwf')]['rwf'], 0)
+
+
+def test_raw_output_and_conversion(tmp_path, ring):
+    features = {'gates' : [(0, 8)]}
+    (tmp_path / 'h5').mkdir()
+    record(make_writer(tmp_path / 'h5', features=features), ring, 24)
+    # the same events again, from the emptied ring
+    ring.head = 0
+    record(make_writer(tmp_path, output_format='raw', features=features), ring, 24)
+
+    # readable as they are
+    rwf = np.load(tmp_path / 'run_data_test.rwf.npy', mmap_mode='r')
+    assert len(rwf) == 24 * CHANNELS
+    assert len(np.load(tmp_path / 'run_data_test.features.npy')) == 24 * CHANNELS
+
+    h5_path = raw_to_h5(str(tmp_path / 'run_data_test.json'), rows_per_write=10)
+    assert h5_path == str(tmp_path / 'run_data_test.h5')
+    converted = read_h5(h5_path)
+    written   = read_h5(tmp_path / 'h5' / 'run_data_test.h5')
+    assert sorted(converted) == sorted(written)
+    for key, rows in written.items():
+        np.testing.assert_array_equal(converted[key], rows)
+
+
+def test_flush_at_half_a_ring(tmp_path, ring):
+    writer = make_writer(tmp_path, flush_size=1000)
+    writer.buffer_entry((ring, ring.claim(16), np.arange(16)))
+    assert not writer.flush_due()
+    # half of the 64 slots
+    writer.buffer_entry((ring, ring.claim(16), np.arange(16, 32)))
+    assert writer.flush_due()
+
+    writer.write_h5()
+    assert ring.n_used == 0
+    assert not writer.flush_due()
+    writer.cleanup()
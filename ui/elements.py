@@ -63,14 +63,63 @@ class StatsBox(QGroupBox):
     def __init__(self, parent=None):
         super().__init__("Stats", parent = parent)
 
-        self.fps_label = QLabel("FPS: 0")
-        #self.events_collected = QLabel(f'evts: {self.acq.events_collected}')
-        #self.rate = QLabel(f'Rate: {self.acq.rate} Hz')
+        self.fps_label     = QLabel("FPS: 0")
+        self.rate_label    = QLabel("Rate: 0 events/sec, 0.00 MB/sec")
+        self.events_label  = QLabel("Events: 0 read, 0 built, 0 written")
+        self.dropped_label = QLabel("Dropped: 0 display, 0 recording")
+        self.spill_label   = QLabel("Spill backlog: 0 (0 spilled)")
+        self.queues_label  = QLabel("Queues: display 0, writer 0")
+        self.writer_label  = QLabel("Writer: stopped")
+
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+        for label in (self.fps_label, self.rate_label, self.events_label, self.dropped_label,
+                      self.spill_label, self.queues_label, self.writer_label):
+            layout.addWidget(label)
+
+    def update_metrics(self, metrics: dict):
+        '''
+        Show a snapshot of the metrics registry (see core/metrics.py).
+        '''
+        flush = metrics['writer_flush_seconds']
+        self.rate_label.setText(f"Rate: {metrics['event_rate']} events/sec, {metrics['MB_rate']:.2f} MB/sec")
+        self.events_label.setText(f"Events: {metrics['events_read_total']} read, {metrics['events_built']} built, "
+                                  f"{metrics['events_written_total']} written")
+        self.dropped_label.setText(f"Dropped: {metrics['display_dropped_total']} display, {metrics['record_dropped_total']} recording")
+        # spilled readouts aren't lost, they're waiting to be fed back
+        self.spill_label.setText(f"Spill backlog: {metrics['spill_depth']} ({metrics['events_spilled_total']} spilled)")
+        self.queues_label.setText(f"Queues: display {metrics['display_buffer_depth']}, writer {metrics['writer_buffer_depth']}")
+        if metrics['writer_alive']:
+            # no flush time until the first flush
+            flush_p99 = '-' if flush['p99'] is None else f"{1e3 * flush['p99']:.0f}"
+            self.writer_label.setText(f"Writer: {metrics['writer_cpu_percent']:.0f}% CPU, "
+                                      f"flush p99 {flush_p99} ms, {metrics['bytes_written_total'] / 1e6:.0f} MB")
+        else:
+            self.writer_label.setText("Writer: stopped")
+
+class DisplayMode(QGroupBox):
+    '''
+    Choice between the latest trace of each channel and the persistence
+    histogram of every waveform, with a button to clear the latter.
+    '''
+    def __init__(self, controller, parent=None):
+        super().__init__("Display", parent = parent)
+        self.controller = controller
+
+        self.mode  = QComboBox()
+        self.mode.addItems(['trace', 'persistence'])
+        self.mode.setCurrentText(self.controller.display_mode)
+        self.clear = QPushButton("Clear")
 
         layout = QHBoxLayout()
         self.setLayout(layout)
 
-        layout.addWidget(self.fps_label)
+        layout.addWidget(self.mode)
+        layout.addWidget(self.clear)
+
+        self.mode.currentTextChanged.connect(self.controller.set_display_mode)
+        self.clear.clicked.connect(self.controller.clear_persistence)
 
 class ConnectDigitiser(QGroupBox):
     def __init__(self, controller, parent=None):
@@ -7,6 +7,7 @@ https://github.com/diepala/wicope/
 
 import sys
 import random
+import numpy as np
 
 from PySide6.QtWidgets import (
     QComboBox,
@@ -24,6 +25,7 @@ from PySide6 import QtCore, QtGui
 import pyqtgraph as pg
 
 from ui import elements
+from core.functions import minmax_decimate
 
 
 
@@ -39,6 +41,7 @@ class ControlPanel(QFrame):
         self.stats_box         = elements.StatsBox()
         self.conf_files        = elements.config_files(self.controller)
         self.acquisition       = elements.Acquisition(self.controller)
+        self.display_mode      = elements.DisplayMode(self.controller)
 
         self.layout = QVBoxLayout()
 
@@ -46,6 +49,7 @@ class ControlPanel(QFrame):
         self.layout.addWidget(self.stats_box)
         self.layout.addWidget(self.conf_files)
         self.layout.addWidget(self.acquisition)
+        self.layout.addWidget(self.display_mode)
 
         self.layout.addStretch()
 
@@ -53,6 +57,9 @@ class ControlPanel(QFrame):
 
 
 class OscilloScopeScreen(pg.PlotWidget):
+    # points drawn per pixel of plot width, above this waveforms are decimated
+    points_per_pixel = 2
+
     def __init__(self, controller, parent = None, plotItem = None, **kwargs):
         super().__init__(parent=parent, controller=controller, background='w', plotItem=plotItem, **kwargs)
 
@@ -68,18 +75,73 @@ class OscilloScopeScreen(pg.PlotWidget):
 
         self.pen_ch   = {}
         self.channels = {}
+        self.data     = {}  # ch -> full resolution (x, y) last drawn, to redraw on zoom
+        self.images   = {}  # ch -> persistence ImageItem, created on first use
         # create pens for each channel, and plot the defaults
         for ch in controller.ch_mapping.keys():
             self.pen_ch[ch] = pg.mkPen(pg.intColor(ch), width = 1)
             self.plot_ch([0,1], [0,0], ch)
 
+        # zooming changes how many samples land on each pixel
+        self.sigXRangeChanged.connect(self.redraw)
 
 
     def plot_ch(self, x, y, ch = 1):
         self.channels[ch] = self.plot(x, y, pen=self.pen_ch[ch], name = f'ch {ch}')
 
     def update_ch(self, x, y, ch = 1):
-        self.channels[ch].setData(x, y)
+        self.data[ch] = (x, y)
+        self.channels[ch].setData(*self.decimate(x, y))
+
+    def decimate(self, x, y):
+        '''
+        Waveform min/max decimated to points_per_pixel points per pixel of plot width
+        over the visible range, returned at full resolution once zoomed in far enough.
+        The whole waveform is kept so that auto-ranging still sees all of it.
+        '''
+        x_min, x_max = self.viewRange()[0]
+        visible = np.searchsorted(x, x_max) - np.searchsorted(x, x_min)
+        n_bins  = max(int(self.plotItem.vb.width()), 1) * self.points_per_pixel // 2
+        if visible <= 2 * n_bins:
+            return x, y
+        # bins sized so the visible samples span n_bins of them
+        return minmax_decimate(x, y, n_bins * len(x) // visible)
+
+    def redraw(self):
+        for ch, (x, y) in self.data.items():
+            self.channels[ch].setData(*self.decimate(x, y))
+
+    def set_mode(self, mode: str):
+        '''
+        Show the traces ('trace') or the persistence images ('persistence').
+        '''
+        persistence = mode == 'persistence'
+        for curve in self.channels.values():
+            curve.setVisible(not persistence)
+        for image in self.images.values():
+            image.setVisible(persistence)
+
+    def update_persistence(self, ch, image, wf_size, adc_range):
+        '''
+        Draw the (time, ADC) histogram of a channel, spanning wf_size samples and adc_range ADCs.
+        Each channel is drawn in its own colour, with counts on a log scale.
+        '''
+        if ch not in self.images:
+            lut = np.zeros((256, 4), dtype=np.ubyte)
+            lut[:, :3] = self.pen_ch[ch].color().getRgb()[:3]
+            lut[:, 3]  = np.linspace(0, 255, 256)
+            self.images[ch] = pg.ImageItem(lut = lut)
+            # channels overlap, so add their colours rather than painting over each other
+            self.images[ch].setCompositionMode(QtGui.QPainter.CompositionMode.CompositionMode_Plus)
+            self.addItem(self.images[ch])
+
+        levels = np.log1p(image)
+        self.images[ch].setImage(levels, levels = (0, max(levels.max(), 1)))
+        self.images[ch].setRect(QtCore.QRectF(0, 0, wf_size, adc_range))
+
+    def clear_persistence(self):
+        for image in self.images.values():
+            image.clear()
 
 
 class MainWindow(QMainWindow):
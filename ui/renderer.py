@@ -0,0 +1,187 @@
+'''
+Frame-rate limited rendering of the oscilloscope screen.
+
+The acquisition side only copies the newest waveform of each channel into a
+back buffer, and a QTimer on the GUI thread draws whatever is newest at a
+fixed rate. Frames that arrive between two redraws are overwritten, so the
+display cost stays flat however high the trigger rate is.
+
+In persistence mode every waveform is instead accumulated into a per-channel
+(time, ADC) histogram, drawn as an image at the same rate.
+'''
+import time
+import numpy as np
+from threading import Lock
+from typing import Optional
+
+from PySide6.QtCore import QObject, QTimer
+
+
+class Persistence:
+    '''
+    2D (time, ADC) histogram of every waveform of one channel. Waveforms are
+    batched and binned together with a single bincount, keeping the per-event cost
+    down to a copy.
+    '''
+    def __init__(self, n_time: int = 512, n_adc: int = 256, adc_bits: int = 14, batch: int = 256):
+        self.max_time = n_time
+        self.n_adc    = n_adc
+        self.adc_bits = adc_bits
+        self.batch    = np.empty((batch, 0))
+        self.n_batch  = 0
+        self.wf_size  = None
+
+    def reset(self, wf_size: int, dtype):
+        '''
+        Clear the histogram, binning waveforms of wf_size samples.
+        '''
+        self.wf_size = wf_size
+        self.n_time  = min(self.max_time, wf_size)
+        self.hist    = np.zeros(self.n_time * self.n_adc, dtype=np.int64)
+        self.batch   = np.empty((len(self.batch), wf_size), dtype=dtype)
+        self.n_batch = 0
+        # flat histogram offset of the time bin of each sample
+        self.t_index = (np.arange(wf_size) * self.n_time // wf_size) * self.n_adc
+
+    def add(self, ADCs: np.ndarray):
+        if len(ADCs) != self.wf_size:
+            self.reset(len(ADCs), ADCs.dtype)
+        self.batch[self.n_batch] = ADCs
+        self.n_batch += 1
+        if self.n_batch == len(self.batch):
+            self.flush()
+
+    def flush(self):
+        if self.n_batch == 0:
+            return
+        adc = (self.batch[:self.n_batch].astype(np.int64) * self.n_adc) >> self.adc_bits
+        np.clip(adc, 0, self.n_adc - 1, out=adc)
+        self.hist += np.bincount((self.t_index + adc).ravel(), minlength=self.hist.size)
+        self.n_batch = 0
+
+    def image(self) -> np.ndarray:
+        '''
+        Copy of the histogram, indexed [time bin, ADC bin].
+        '''
+        self.flush()
+        return self.hist.reshape(self.n_time, self.n_adc).copy()
+
+
+class Renderer(QObject):
+    '''
+    Holds the latest waveform (or persistence histogram) per channel and redraws the screen
+    at fps frames per second. push() may be called from any thread, rendering happens on the
+    thread start() is called from.
+
+    persistence holds the Persistence settings (n_time, n_adc), the ADC resolution
+    being given with the waveforms, as reported by the digitiser.
+    '''
+    modes = ('trace', 'persistence')
+
+    def __init__(self, screen, fps: float = 30, mode: str = 'trace', persistence: Optional[dict] = None, parent = None):
+        super().__init__(parent)
+        if mode not in self.modes:
+            raise ValueError(f"Display mode must be one of {self.modes}, not '{mode}'.")
+        self.screen  = screen
+        self.fps     = fps
+        self.mode    = mode
+        self.lock    = Lock()
+
+        self.persistence_settings = persistence or {}
+        self.persistence = {}   # ch -> Persistence
+
+        self.back    = {}   # ch -> newest waveform, written by push()
+        self.sizes   = {}   # ch -> samples of the pending frame, absent once drawn
+        self.x_cache = {}   # wf_size -> x axis, reused between frames
+
+        self.n_frames  = 0  # frames drawn since the last measured_fps() call
+        self.t_measure = time.perf_counter()
+
+        self.timer = None
+
+    def start(self):
+        self.screen.set_mode(self.mode)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.render)
+        self.timer.start(int(1000 / self.fps))
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.stop()
+
+    def push(self, ch: int, ADCs: np.ndarray, adc_bits: Optional[int] = None):
+        '''
+        Offer a waveform for display, replacing any frame of ch not drawn yet.
+        ADCs is copied, so it may be a view into the ring. adc_bits is the
+        resolution of the digitiser, binning the persistence histogram.
+        '''
+        n = len(ADCs)
+        with self.lock:
+            if self.mode == 'persistence':
+                persistence = self.persistence.get(ch)
+                if persistence is None or (adc_bits is not None and persistence.adc_bits != adc_bits):
+                    settings = self.persistence_settings if adc_bits is None else {**self.persistence_settings, 'adc_bits' : adc_bits}
+                    persistence = self.persistence[ch] = Persistence(**settings)
+                persistence.add(ADCs)
+                self.sizes[ch] = n
+                return
+
+            back = self.back.get(ch)
+            if back is None or len(back) < n or back.dtype != ADCs.dtype:
+                back = self.back[ch] = np.empty(n, dtype=ADCs.dtype)
+            back[:n] = ADCs
+            self.sizes[ch] = n
+
+    def set_mode(self, mode: str):
+        '''
+        Switch between drawing the latest trace and the persistence histogram.
+        '''
+        if mode not in self.modes:
+            raise ValueError(f"Display mode must be one of {self.modes}, not '{mode}'.")
+        with self.lock:
+            self.mode = mode
+            self.sizes.clear()
+        self.screen.set_mode(mode)
+
+    def clear_persistence(self):
+        with self.lock:
+            self.persistence.clear()
+        self.screen.clear_persistence()
+
+    def x_axis(self, n: int) -> np.ndarray:
+        x = self.x_cache.get(n)
+        if x is None:
+            x = self.x_cache[n] = np.arange(n)
+        return x
+
+    def render(self):
+        '''
+        Draw the pending frame of each channel, if any.
+        '''
+        with self.lock:
+            if not self.sizes:
+                return
+            mode = self.mode
+            if mode == 'persistence':
+                images = {ch : (self.persistence[ch].image(), n, 2 ** self.persistence[ch].adc_bits)
+                          for ch, n in self.sizes.items()}
+            else:
+                frames = {ch : self.back[ch][:n].copy() for ch, n in self.sizes.items()}
+            self.sizes.clear()
+
+        if mode == 'persistence':
+            for ch, (image, n, adc_range) in images.items():
+                self.screen.update_persistence(ch, image, n, adc_range)
+        else:
+            for ch, y in frames.items():
+                self.screen.update_ch(self.x_axis(len(y)), y, ch)
+        self.n_frames += 1
+
+    def measured_fps(self) -> float:
+        '''
+        Frames drawn per second since the previous call.
+        '''
+        t_check = time.perf_counter()
+        fps = self.n_frames / (t_check - self.t_measure)
+        self.n_frames, self.t_measure = 0, t_check
+        return fps
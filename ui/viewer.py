@@ -0,0 +1,90 @@
+'''
+Standalone viewer of a run served by the monitor (monitor_port in the recording
+config, see core/monitor.py), drawing the latest waveforms on the oscilloscope
+screen and showing the rates and writer status. Runs in its own process, on the
+acquisition machine or any machine that can reach the monitor.
+'''
+import logging
+from threading import Thread, Lock
+from types import SimpleNamespace
+
+from PySide6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QLabel, QApplication
+from PySide6.QtCore import QTimer
+
+from core.monitor import MonitorClient
+from ui.oscilloscope import OscilloScopeScreen
+
+
+class ViewerWindow(QMainWindow):
+    '''
+    Oscilloscope screen fed by a MonitorClient. Messages are read on a separate thread,
+    keeping only the newest, and drawn by a QTimer at the server's frame rate.
+    '''
+    def __init__(self, client: MonitorClient, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.client = client
+        self.lock   = Lock()
+        self.latest = None      # (header, waveforms) not drawn yet
+        self.connected = True
+
+        self.setWindowTitle(f"CARP viewer ({client.sock.getpeername()[0]}:{client.sock.getpeername()[1]})")
+        # the screen only needs the channels, given by the server on connecting
+        self.screen       = OscilloScopeScreen(SimpleNamespace(ch_mapping = {ch : i for i, ch in enumerate(client.channels)}))
+        self.status_label = QLabel("Waiting for data.")
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.screen)
+        layout.addWidget(self.status_label)
+        self.setCentralWidget(QWidget())
+        self.centralWidget().setLayout(layout)
+
+        self.reader = Thread(target=self.read, daemon=True)
+        self.reader.start()
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.render)
+        self.timer.start(int(1000 / client.fps))
+
+    def read(self):
+        '''
+        Keep the newest message, replacing any not drawn yet, until the server goes away.
+        '''
+        try:
+            while True:
+                message = self.client.receive()
+                with self.lock:
+                    self.latest = message
+        except (ConnectionError, OSError) as e:
+            logging.warning(f"Monitor connection lost: {e}")
+            self.connected = False
+
+    def render(self):
+        with self.lock:
+            message, self.latest = self.latest, None
+        if message is None:
+            if not self.connected:
+                self.status_label.setText("Disconnected.")
+                self.timer.stop()
+            return
+
+        header, waveforms = message
+        for ch, (x, y) in waveforms.items():
+            self.screen.update_ch(x, y, ch)
+
+        status = header['status']
+        self.status_label.setText(f"{'Recording' if status['recording'] else 'Not recording'} || "
+                                  f"{status['events_ps']} events/sec || {status['MB_ps']:.2f} MB/sec || "
+                                  f"{status['events_built']} built || {status['events_written']} written || "
+                                  f"writer {'running' if status['writer_alive'] else 'stopped'}, "
+                                  f"buffer {status['writer_buffer']}, CPU {status['writer_cpu']:.1f}%")
+
+
+def run_viewer(host: str, port: int) -> int:
+    '''
+    Show the run served on host:port until the window is closed.
+    '''
+    app = QApplication([])
+    with MonitorClient(host, port) as client:
+        window = ViewerWindow(client)
+        window.show()
+        return app.exec()